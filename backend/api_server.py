@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+API HTTP sin interfaz para canales externos (WhatsApp, widget web).
+
+    python -m backend.api_server --port 8503 [--token SECRETO]
+
+POST /v1/conversations                      crea una conversación -> {"conversation_id"}
+POST /v1/conversations/{id}/messages        {"text", "tenant_id"?} -> respuesta + carrito + datos
+GET  /v1/conversations/{id}                 estado (carrito, datos del cliente, faltantes)
+POST /v1/conversations/{id}/order           confirma el pedido (acepta "client" para completar datos)
+POST /v1/conversations/{id}/pendings        {"question", "language"?} consulta a cocina
+GET  /v1/conversations/{id}/decisions       decisiones de cocina no notificadas (?ack=1 las marca)
+POST /v1/batch                              {"requests": [{"method", "path", "body"}]} en paralelo
+GET  /v1/health
+GET  /v1/metrics                            snapshot JSON de las métricas del proceso
+GET  /metrics                               las mismas métricas en texto Prometheus
+"""
+from __future__ import annotations
+import re
+import json
+import time
+import argparse
+import threading
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+from .config import get_config
+from .db import (
+    init_db, fetch_menu, create_order_from_chat_ready, create_pending_question,
+    fetch_unnotified_decisions, mark_pending_notified,
+)
+from .extraction import update_conversation_state, ensure_all_required_present
+from .conversations import Conversation, open_conversation, session_stats
+from .llm_chat import client_assistant_reply
+from .metrics import observe, snapshot, send_text_metrics
+
+_ROUTE = re.compile(r"^/v1/conversations/([\w\-]+)(?:/(messages|order|pendings|decisions))?$")
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str, **extra):
+        super().__init__(message)
+        self.status = status
+        self.payload = {"error": message, **extra}
+
+
+class ChatAPI:
+    """Transport-free request handling; ``handle(method, path, body)`` -> ``(status, payload)``."""
+
+    def __init__(self, cfg: Optional[dict] = None, workers: Optional[int] = None):
+        self.cfg = cfg or get_config()
+        workers = int(workers or self.cfg.get("api_workers", 16))
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        # Pool aparte para las sub-peticiones de un batch: un batch ocupa un worker de
+        # `pool` y no puede quedar esperando por workers del mismo pool.
+        self.batch_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-batch")
+        self.stats = {"requests": 0, "errors": 0, "batches": 0}
+        self._stats_lock = threading.Lock()
+        self._menu: Tuple[float, List[Dict]] = (0.0, [])
+
+    def menu(self) -> List[Dict]:
+        # Menú compartido por todas las conversaciones, releído cada pocos segundos.
+        ts, menu = self._menu
+        if time.time() - ts > float(self.cfg.get("api_menu_ttl_s", 30)):
+            menu = fetch_menu()
+            self._menu = (time.time(), menu)
+        return menu
+
+    def submit(self, method: str, path: str, body: Dict):
+        return self.pool.submit(self.handle, method, path, body)
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def handle(self, method: str, path: str, body: Optional[Dict] = None) -> Tuple[int, Dict]:
+        self._count("requests")
+        t0 = time.perf_counter()
+        status = 200
+        try:
+            return 200, self._dispatch(method.upper(), path, body or {})
+        except ApiError as e:
+            self._count("errors")
+            status = e.status
+            return e.status, e.payload
+        except Exception as e:
+            self._count("errors")
+            status = 500
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            observe("api_request_seconds", time.perf_counter() - t0,
+                    method=method.upper(), route=_route_label(path), status=status)
+
+    def _dispatch(self, method: str, path: str, body: Dict) -> Dict:
+        url = urlparse(path)
+        route = url.path.rstrip("/")
+        if route == "/v1/health":
+            return {"ok": True, "conversations": session_stats()["sessions"], **self.stats}
+        if route == "/v1/metrics" and method == "GET":
+            return snapshot()
+        if route == "/v1/conversations" and method == "POST":
+            conv = open_conversation(uuid4().hex, channel=body.get("channel") or "api", cfg=self.cfg)
+            return {"conversation_id": conv.id}
+        if route == "/v1/batch" and method == "POST":
+            return self._batch(body)
+        m = _ROUTE.match(route)
+        if not m:
+            raise ApiError(404, "not found")
+        try:
+            # Las conversaciones viven en la base: sobreviven a reinicios y a otras réplicas.
+            conv = open_conversation(m.group(1), create=False, cfg=self.cfg)
+        except KeyError:
+            raise ApiError(404, "conversation not found")
+        action = m.group(2)
+        if action is None and method == "GET":
+            with conv.lock:
+                return self._view(conv)
+        if action == "messages" and method == "POST":
+            return self._message(conv, body)
+        if action == "order" and method == "POST":
+            return self._order(conv, body)
+        if action == "pendings" and method == "POST":
+            return self._pending(conv, body)
+        if action == "decisions" and method == "GET":
+            return self._decisions(conv, parse_qs(url.query).get("ack", ["0"])[0] in ("1", "true"))
+        raise ApiError(405, "method not allowed")
+
+    def _state(self, conv: Conversation) -> Dict:
+        # Al reabrir una conversación el parser la recorre una vez (por páginas) y sigue incremental.
+        return update_conversation_state(conv.state, conv, self.menu(), self.cfg,
+                                         lang=self.cfg.get("language", "es"), emit_events=False)
+
+    def _view(self, conv: Conversation) -> Dict:
+        lang = self.cfg.get("language", "es")
+        return {"conversation_id": conv.id, "cart": self._state(conv)["items"],
+                "client_info": conv.client_info,
+                "missing": ensure_all_required_present(dict(conv.client_info), lang),
+                "messages": len(conv)}
+
+    def _message(self, conv: Conversation, body: Dict) -> Dict:
+        text = (body.get("text") or "").strip()
+        if not text:
+            raise ApiError(400, "text is required")
+        menu = self.menu()
+        lang = self.cfg.get("language", "es")
+        with conv.lock:
+            self._state(conv)
+            conv.append({"role": "user", "content": text})
+            state = update_conversation_state(conv.state, conv, menu, self.cfg, lang=lang)
+            for ev in state["events"]:
+                conv.client_info.update(ev["fields"])
+            conv.save_client_info()
+            event = state["last_event"]
+            reply = client_assistant_reply(conv, menu, self.cfg, conversation_id=conv.id,
+                                           tenant_id=body.get("tenant_id"), cart=state["items"], event=event)
+            conv.append({"role": "assistant", "content": reply})
+            update_conversation_state(state, conv, menu, self.cfg, lang=lang)
+            out = self._view(conv)
+        out.update({"reply": reply, "event": {k: v for k, v in (event or {}).items() if k != "text"}})
+        return out
+
+    def _order(self, conv: Conversation, body: Dict) -> Dict:
+        lang = self.cfg.get("language", "es")
+        with conv.lock:
+            conv.client_info.update({k: v for k, v in (body.get("client") or {}).items() if v})
+            conv.save_client_info()
+            info = dict(conv.client_info)
+            missing = ensure_all_required_present(info, lang)
+            items = self._state(conv)["items"]
+            if missing or not items:
+                raise ApiError(422, "order incomplete", missing=missing, cart=items)
+            order = create_order_from_chat_ready(client=info, items=items,
+                                                 currency=self.cfg.get("currency", "USD"))
+        return {"order": order}
+
+    def _pending(self, conv: Conversation, body: Dict) -> Dict:
+        question = (body.get("question") or "").strip()
+        if not question:
+            raise ApiError(400, "question is required")
+        row = create_pending_question(conversation_id=conv.id, question=question,
+                                      language=body.get("language") or self.cfg.get("language", "es"),
+                                      ttl_seconds=int(body.get("ttl_seconds", 60)))
+        return {"pending": row}
+
+    def _decisions(self, conv: Conversation, ack: bool) -> Dict:
+        rows = fetch_unnotified_decisions(conv.id)
+        if ack:
+            for r in rows:
+                mark_pending_notified(r["id"])
+        return {"decisions": rows}
+
+    def _batch(self, body: Dict) -> Dict:
+        reqs = body.get("requests") or []
+        limit = int(self.cfg.get("api_batch_max", 50))
+        if len(reqs) > limit:
+            raise ApiError(413, f"batch too large (max {limit})")
+        if any(urlparse(r.get("path") or "").path.rstrip("/") == "/v1/batch" for r in reqs):
+            raise ApiError(400, "nested batches are not allowed")
+        self._count("batches")
+        # Las peticiones de una misma conversación corren en orden, una tras otra (el lock
+        # solo evita que se pisen, no respeta el orden del batch); las demás, en paralelo.
+        groups: Dict[object, List[int]] = {}
+        for i, r in enumerate(reqs):
+            m = _ROUTE.match(urlparse(r.get("path") or "").path.rstrip("/"))
+            groups.setdefault(m.group(1) if m else i, []).append(i)
+        results: List[Optional[Dict]] = [None] * len(reqs)
+
+        def run(idxs: List[int]) -> None:
+            for i in idxs:
+                r = reqs[i]
+                status, payload = self.handle(r.get("method", "GET"), r.get("path", ""), r.get("body") or {})
+                results[i] = {"status": status, "body": payload}
+
+        for f in [self.batch_pool.submit(run, idxs) for idxs in groups.values()]:
+            f.result()
+        return {"responses": results}
+
+
+def _route_label(path: str) -> str:
+    # Etiqueta de baja cardinalidad: el id de la conversación no entra en la métrica.
+    route = urlparse(path).path.rstrip("/")
+    m = _ROUTE.match(route)
+    if m:
+        return "/v1/conversations/{id}" + (f"/{m.group(2)}" if m.group(2) else "")
+    return route if route in ("/v1/health", "/v1/metrics", "/v1/conversations", "/v1/batch") else "other"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "chat-api/1.0"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status: int, payload: Dict) -> None:
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _serve(self, method: str) -> None:
+        token = self.server.token
+        if token and self.headers.get("Authorization", "") != f"Bearer {token}":
+            self._reply(401, {"error": "unauthorized"})
+            return
+        if method == "GET" and self.path.split("?")[0].rstrip("/") == "/metrics":
+            send_text_metrics(self)
+            return
+        body: Dict = {}
+        if method == "POST":
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._reply(400, {"error": "invalid JSON"})
+                return
+        api: ChatAPI = self.server.api
+        # La conexión solo espera; el trabajo corre en el pool propio de la API (con tope de concurrencia).
+        status, payload = api.submit(method, self.path, body).result()
+        self._reply(status, payload)
+
+    def do_GET(self):
+        self._serve("GET")
+
+    def do_POST(self):
+        self._serve("POST")
+
+
+def start_api_server(port: int = 8503, host: str = "127.0.0.1", token: Optional[str] = None,
+                     cfg: Optional[dict] = None) -> ThreadingHTTPServer:
+    """Start the API in a daemon thread; ``.api`` is the ``ChatAPI``, ``.shutdown()`` stops it."""
+    srv = ThreadingHTTPServer((host, port), _Handler)
+    srv.daemon_threads = True
+    srv.token = token
+    srv.api = ChatAPI(cfg)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Headless chat / order API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8503)
+    ap.add_argument("--token", default=None, help="exigir 'Authorization: Bearer <token>'")
+    args = ap.parse_args()
+    init_db(seed=True)
+    srv = start_api_server(args.port, args.host, args.token)
+    print(f"API en http://{args.host}:{args.port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Arranque único por proceso: tablas/migraciones, configuración y (opcional) el cliente LLM.
+
+Las páginas llaman ``bootstrap()`` en cada rerun; solo la primera llamada del proceso
+(por base de datos) hace trabajo. Con ``metrics_port`` > 0 también levanta el exportador
+de métricas del proceso (``backend/metrics.py``). Las dependencias pesadas (pandas, openai/httpx,
+dotenv, Pillow, tiktoken) se importan al primer uso, no al importar ``backend``.
+
+    python -m backend.bootstrap --bench [--repeat 5] [--detail]
+
+mide en procesos nuevos cuánto tarda importar cada módulo y qué dependencias pesadas arrastra.
+"""
+from __future__ import annotations
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import subprocess
+from typing import Dict, List, Optional
+
+from .config import get_config, get_db_path
+from .db import init_db
+from .metrics import start_metrics_server
+
+_DONE: Dict[str, Dict] = {}
+_LOCK = threading.Lock()
+_METRICS: Dict[str, object] = {}
+
+HEAVY = ("pandas", "numpy", "openai", "httpx", "dotenv", "PIL", "tiktoken")
+BENCH_MODULES = ("backend.config", "backend.db", "backend.extraction", "backend.faq", "backend.llm_chat",
+                 "backend.llm_worker", "backend.conversations", "backend.utils", "backend.api_server",
+                 "backend.kitchen_server")
+
+
+def bootstrap(seed: bool = True, warm_llm: Optional[bool] = None) -> None:
+    """
+    Create/migrate the DB once per process (per DB path). With ``llm_warmup`` (or
+    ``warm_llm=True``) the OpenAI client is built in a background thread so the first
+    LLM turn does not pay for the SDK import.
+    """
+    path = get_db_path()
+    info = _DONE.get(path)
+    if info is None or (seed and not info["seed"]):
+        with _LOCK:
+            info = _DONE.get(path)
+            if info is None or (seed and not info["seed"]):
+                t0 = time.perf_counter()
+                init_db(seed=seed)
+                # La config (st.secrets) se lee en el hilo: las páginas llaman bootstrap()
+                # antes de set_page_config y no deben emitir elementos.
+                threading.Thread(target=_warm_llm, args=(warm_llm,), daemon=True, name="bootstrap").start()
+                _DONE[path] = {"seed": seed, "init_s": round(time.perf_counter() - t0, 4)}
+
+
+def _warm_llm(warm_llm: Optional[bool]) -> None:
+    try:
+        cfg = get_config()
+        _start_metrics(cfg)
+        if not (cfg.get("llm_warmup", False) if warm_llm is None else warm_llm):
+            return
+        from .llm_client import get_client
+        get_client(cfg)
+    except Exception:
+        pass  # sin openai / sin clave: el primer turno LLM reporta el error como siempre
+
+
+def _start_metrics(cfg: dict) -> None:
+    port = int(cfg.get("metrics_port", 0) or 0)
+    with _LOCK:
+        if port <= 0 or _METRICS:
+            return
+        try:
+            _METRICS["server"] = start_metrics_server(port, cfg.get("metrics_host", "127.0.0.1"))
+        except OSError:
+            # Puerto ocupado (otro proceso de la app ya exporta): se sigue sin exportador.
+            _METRICS["server"] = None
+
+
+def bootstrap_stats() -> Dict:
+    return {path: dict(v) for path, v in _DONE.items()}
+
+
+_PROBE = """
+import sys, json, time
+t0 = time.perf_counter()
+import {module}
+dt = time.perf_counter() - t0
+print(json.dumps({{"s": dt, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _probe(module: str, detail: bool = False) -> Dict:
+    cmd = [sys.executable]
+    if detail:
+        cmd += ["-X", "importtime"]
+    cmd += ["-c", _PROBE.format(module=module, heavy=HEAVY)]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(cmd, cwd=root, capture_output=True, text=True, timeout=120)
+    lines = [ln for ln in proc.stdout.splitlines() if ln.startswith("{")]
+    if proc.returncode != 0 or not lines:
+        return {"error": (proc.stderr.strip().splitlines() or ["?"])[-1]}
+    out = json.loads(lines[-1])
+    if detail:
+        out["top"] = _top_imports(proc.stderr)
+    return out
+
+
+def _top_imports(stderr: str, n: int = 8) -> List[Dict]:
+    # Líneas de -X importtime: "import time: self [us] | cumulative | imported package";
+    # se suma el tiempo propio por paquete raíz (streamlit, numpy, backend, ...).
+    by_pkg: Dict[str, int] = {}
+    for ln in stderr.splitlines():
+        if not ln.startswith("import time:") or "cumulative" in ln:
+            continue
+        try:
+            own, _, name = ln[len("import time:"):].split("|")
+            pkg = name.strip().split(".")[0]
+            by_pkg[pkg] = by_pkg.get(pkg, 0) + int(own)
+        except ValueError:
+            continue
+    top = sorted(by_pkg.items(), key=lambda kv: kv[1], reverse=True)[:n]
+    return [{"package": pkg, "self_s": round(us / 1e6, 4)} for pkg, us in top]
+
+
+def bench_imports(modules=BENCH_MODULES, repeat: int = 3, detail: bool = False) -> Dict[str, Dict]:
+    """Cold import time per module (median of ``repeat`` fresh interpreters) and the heavy deps it loads."""
+    report: Dict[str, Dict] = {}
+    for mod in modules:
+        runs = [_probe(mod, detail and i == 0) for i in range(max(1, repeat))]
+        ok = [r for r in runs if "error" not in r]
+        if not ok:
+            report[mod] = {"error": runs[0]["error"]}
+            continue
+        times = sorted(r["s"] for r in ok)
+        row = {"median_s": round(times[len(times) // 2], 4), "min_s": round(times[0], 4),
+               "heavy": ok[0]["heavy"]}
+        if detail and "top" in runs[0]:
+            row["top"] = runs[0]["top"]
+        report[mod] = row
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Process bootstrap / import-time benchmark")
+    ap.add_argument("--bench", action="store_true", help="medir tiempos de import en procesos nuevos")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--detail", action="store_true", help="incluir los imports más lentos (-X importtime)")
+    ap.add_argument("--module", action="append", help="módulo a medir (repetible); por defecto los de backend")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+    if not args.bench:
+        t0 = time.perf_counter()
+        bootstrap()
+        print(f"bootstrap en {time.perf_counter() - t0:.3f} s — DB {get_db_path()}")
+        return
+    rep = bench_imports(args.module or BENCH_MODULES, args.repeat, args.detail)
+    if args.json:
+        print(json.dumps(rep, ensure_ascii=False, indent=2))
+        return
+    print(f"{'módulo':<28}{'mediana':>10}{'mín':>10}  pesados")
+    for mod, row in rep.items():
+        if "error" in row:
+            print(f"{mod:<28}{'error':>10}  {row['error']}")
+            continue
+        print(f"{mod:<28}{row['median_s']:>10.3f}{row['min_s']:>10.3f}  {', '.join(row['heavy']) or '-'}")
+        for r in row.get("top", []):
+            print(f"{'':<30}{r['self_s']:>8.3f}  {r['package']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Tuple
+
+from .tokens import count_tokens
+
+# Estado del resumen por conversación (acotado; las conversaciones inactivas salen por LRU).
+_SUMMARY_STATES: "OrderedDict[str, Dict]" = OrderedDict()
+_MAX_STATES = 1000
+_LOCK = threading.Lock()
+
+_FIELD_LABELS = {
+    "es": {"name": "nombre", "phone": "teléfono", "delivery_type": "entrega",
+           "address": "dirección", "pickup_eta_min": "retiro (min)", "payment_method": "pago"},
+    "en": {"name": "name", "phone": "phone", "delivery_type": "delivery",
+           "address": "address", "pickup_eta_min": "pickup (min)", "payment_method": "payment"},
+}
+
+
+def _trim(content: str, max_tokens: int, model: str) -> str:
+    n = count_tokens(content, model)
+    if n <= max_tokens:
+        return content
+    keep = max(1, int(len(content) * max_tokens / n))
+    return content[:keep].rstrip() + " …"
+
+
+def select_window(history: List[Dict], cfg: dict) -> Tuple[List[Dict], int]:
+    """
+    Newest-first window of ``history`` within ``history_tokens``; each message is
+    capped at ``history_msg_tokens``. Returns ``(window, cut)`` where
+    ``history[:cut]`` are the older turns left out of the window.
+    """
+    budget = int(cfg.get("history_tokens", 1500))
+    per_msg = int(cfg.get("history_msg_tokens", 400))
+    model = cfg.get("model", "gpt-4o-mini")
+    window: List[Dict] = []
+    used = 0
+    cut = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        m = history[i]
+        content = _trim(m.get("content", "") or "", per_msg, model)
+        cost = count_tokens(content, model) + 4
+        if window and used + cost > budget:
+            break
+        window.append({"role": m.get("role", "user"), "content": content})
+        used += cost
+        cut = i
+    window.reverse()
+    return window, cut
+
+
+def summary_state(conversation_id: str, factory) -> Dict:
+    with _LOCK:
+        st_ = _SUMMARY_STATES.get(conversation_id)
+        if st_ is None:
+            st_ = _SUMMARY_STATES[conversation_id] = factory()
+        _SUMMARY_STATES.move_to_end(conversation_id)
+        while len(_SUMMARY_STATES) > _MAX_STATES:
+            _SUMMARY_STATES.popitem(last=False)
+    return st_
+
+
+def drop_summary_state(conversation_id: str) -> None:
+    with _LOCK:
+        _SUMMARY_STATES.pop(conversation_id, None)
+
+
+def format_summary(state: Dict, lang: str) -> str:
+    """Compact summary of the turns left out: cart so far plus collected client fields."""
+    cached = state.get("summary")
+    if cached and cached[0] == (state.get("consumed"), lang):
+        return cached[1]
+    items = state.get("items") or []
+    info = {k: v for k, v in (state.get("client_info") or {}).items() if v}
+    labels = _FIELD_LABELS["es" if lang == "es" else "en"]
+    cart = ", ".join(f"{it['qty']}x {it['name']}" for it in items)
+    fields = ", ".join(f"{labels.get(k, k)}: {v}" for k, v in info.items())
+    if lang == "es":
+        text = "Resumen de la conversación previa — pedido: " + (cart or "sin ítems aún")
+        if fields:
+            text += f"; datos del cliente: {fields}"
+    else:
+        text = "Earlier conversation summary — order: " + (cart or "no items yet")
+        if fields:
+            text += f"; customer details: {fields}"
+    state["summary"] = ((state.get("consumed"), lang), text)
+    return text
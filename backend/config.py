@@ -11,7 +11,76 @@ _DEFAULT_CFG = {
     "assistant_name": "RAIVA",
     "tone": "Amable y profesional; breve, guiado.",
     "currency": "USD",
-    "sla_minutes": 30
+    "sla_minutes": 30,
+    # Cliente OpenAI (backend/llm_client.py)
+    "llm_base_url": "",
+    "llm_connect_timeout": 5.0,
+    "llm_read_timeout": 60.0,
+    "llm_max_retries": 2,
+    "llm_pool_size": 20,
+    "llm_stream": True,
+    # Caché de respuestas (backend/llm_cache.py)
+    "llm_cache_enabled": True,
+    "llm_cache_ttl_s": 600,
+    "llm_cache_max_entries": 512,
+    "llm_cache_sqlite": False,
+    # Presupuesto de tokens del menú en el prompt (backend/menu_context.py)
+    "menu_context_tokens": 1500,
+    # Ventana de historial (backend/chat_history.py)
+    "history_tokens": 1500,
+    "history_msg_tokens": 400,
+    # Intenciones deterministas sin LLM (agregar ítem, subtotal, menú, cierre)
+    "fast_path": True,
+    # Pool de workers LLM (backend/llm_worker.py)
+    "llm_max_concurrency": 8,
+    "llm_poll_interval_s": 0.3,
+    # Admisión / rate limiting (backend/ratelimit.py)
+    "llm_rate_limit": True,
+    "llm_rate_rps": 5.0,
+    "llm_rate_burst": 10,
+    "llm_rate_tpm": 200000,
+    "llm_conv_rpm": 12,
+    "llm_conv_burst": 4,
+    "llm_queue_max": 32,
+    "llm_queue_timeout_s": 10.0,
+    "llm_est_completion_tokens": 300,
+    # Enrutado de modelos (backend/llm_router.py); llm_hedge_delay_s = 0 desactiva el hedge
+    "fallback_models": [],
+    "llm_latency_budget_s": 30.0,
+    "llm_hedge_delay_s": 0.0,
+    # Modo offline: usa el servidor stub local (backend/llm_stub.py)
+    "llm_offline": False,
+    "llm_stub_port": 8800,
+    # LRU de bytes de imágenes del carrusel (backend/utils.py)
+    "image_cache_mb": 64,
+    # Ingesta de imágenes (backend/images.py)
+    "image_max_px": 1600,
+    "image_thumb_px": 320,
+    "image_format": "WEBP",
+    "image_quality": 82,
+    # Refresco de los paneles de órdenes/pendientes en Restaurante (segundos)
+    "restaurant_refresh_s": 5,
+    # Pantalla de cocina (backend/kitchen_server.py)
+    "kitchen_poll_s": 1.0,
+    # API HTTP sin interfaz (backend/api_server.py)
+    "api_workers": 16,
+    "api_batch_max": 50,
+    "api_menu_ttl_s": 30,
+    # Conversaciones persistidas (backend/conversations.py)
+    "conv_window": 40,
+    "conv_page_size": 50,
+    "conv_idle_s": 1800,
+    "conv_max_sessions": 5000,
+    # Client: mensajes dibujados en vivo; el resto se carga por páginas desde el expander
+    "client_render_window": 12,
+    "client_history_page": 20,
+    # Arranque: construir el cliente LLM en segundo plano al iniciar el proceso
+    "llm_warmup": False,
+    # Tablas: filas por página enviadas al navegador (backend/tables.py)
+    "table_page_rows": 50,
+    # Métricas: puerto de /metrics y /metrics.json del proceso de Streamlit (0 = apagado)
+    "metrics_port": 0,
+    "metrics_host": "127.0.0.1"
 }
 
 def _writable(dir_path: str) -> bool:
@@ -24,7 +93,19 @@ def _writable(dir_path: str) -> bool:
     except Exception:
         return False
 
+# Resueltos una vez por proceso (get_db_path se llama en cada conexión).
+_DATA_DIRS: dict = {}
+_CFG_CACHE: dict = {}
+
 def get_data_dir() -> str:
+    env = os.getenv("DATA_DIR")
+    hit = _DATA_DIRS.get(env)
+    if hit and os.path.isdir(hit):
+        return hit
+    _DATA_DIRS[env] = _resolve_data_dir()
+    return _DATA_DIRS[env]
+
+def _resolve_data_dir() -> str:
     candidates = []
     if os.getenv("DATA_DIR"):
         candidates.append(os.getenv("DATA_DIR"))
@@ -56,6 +137,20 @@ def _cfg_path() -> str:
     return os.path.join(get_data_dir(), "config.json")
 
 def get_config() -> dict:
+    # Se relee solo si config.json cambió (save_config / Admin); si no, copia de la caché.
+    path = _cfg_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        mtime = None
+    hit = _CFG_CACHE.get(path)
+    if hit and hit[0] == mtime:
+        return dict(hit[1])
+    cfg = _load_config(path)
+    _CFG_CACHE[path] = (mtime, cfg)
+    return dict(cfg)
+
+def _load_config(path: str) -> dict:
     cfg = dict(_DEFAULT_CFG)
     try:
         s = st.secrets
@@ -66,9 +161,10 @@ def get_config() -> dict:
         if s.get("TONE"): cfg["tone"] = s["TONE"]
         if s.get("CURRENCY"): cfg["currency"] = s["CURRENCY"]
         if s.get("SLA_MINUTES"): cfg["sla_minutes"] = int(s["SLA_MINUTES"])
+        if s.get("OPENAI_BASE_URL"): cfg["llm_base_url"] = s["OPENAI_BASE_URL"]
+        if s.get("LLM_READ_TIMEOUT"): cfg["llm_read_timeout"] = float(s["LLM_READ_TIMEOUT"])
     except Exception:
         pass
-    path = _cfg_path()
     try:
         if os.path.exists(path):
             with open(path, "r", encoding="utf-8") as f:
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Conversaciones persistidas en las tablas ``conversations`` / ``messages`` (solo-append).
+
+Cada sesión abierta guarda en memoria solo sus últimos ``conv_window`` mensajes; los
+turnos anteriores se leen de la base por páginas cuando alguien los pide (resumen,
+re-parseo, historial de la UI). Las sesiones sin uso por ``conv_idle_s`` segundos (o
+las más viejas, pasado ``conv_max_sessions``) salen del registro y se reabren desde
+la base en el siguiente acceso, también tras reiniciar el proceso.
+"""
+from __future__ import annotations
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from typing import List, Dict, Optional
+
+from .config import get_config
+from .db import get_conversation, create_conversation, append_message, fetch_messages, set_conversation_client_info
+from .extraction import new_conversation_state
+from .metrics import register_collector
+
+_SESSIONS: "OrderedDict[str, Conversation]" = OrderedDict()
+_LOCK = threading.Lock()
+_STATS = {"opened": 0, "loaded": 0, "evicted": 0, "page_loads": 0}
+_MAX_PAGES = 4
+
+
+class _View(Sequence):
+    """Read-only slice ``[start, stop)`` of a conversation; stable because messages are never rewritten."""
+
+    def __init__(self, conv: "Conversation", start: int, stop: int):
+        self._conv, self._start, self._stop = conv, start, stop
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def __getitem__(self, idx):
+        n = len(self)
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(n)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return _View(self._conv, self._start + start, self._start + max(start, stop))
+        if idx < 0:
+            idx += n
+        if not 0 <= idx < n:
+            raise IndexError("conversation index out of range")
+        return self._conv._at(self._start + idx)
+
+
+class Conversation(Sequence):
+    """
+    History of one conversation as a read-only sequence of ``{"role", "content"}`` that
+    ``update_conversation_state``, ``select_window`` and the reply path accept as a list.
+    ``append`` writes through to the DB; slices are lazy views.
+    """
+
+    def __init__(self, conversation_id: str, total: int, client_info: Optional[Dict] = None,
+                 channel: str = "web", cfg: Optional[dict] = None):
+        cfg = cfg or get_config()
+        self.id = conversation_id
+        self.channel = channel
+        self.window_size = max(1, int(cfg.get("conv_window", 40)))
+        self.page_size = max(1, int(cfg.get("conv_page_size", 50)))
+        self.client_info: Dict = dict(client_info or {})
+        self._saved_info: Dict = dict(self.client_info)
+        self.state: Dict = new_conversation_state()
+        self.lock = threading.Lock()
+        self.last_seen = time.time()
+        self._total = total
+        self._recent: deque = deque(maxlen=self.window_size)
+        self._pages: "OrderedDict[int, List[Dict]]" = OrderedDict()
+        self._mu = threading.Lock()
+        if total:
+            start = max(0, total - self.window_size)
+            self._recent.extend(fetch_messages(conversation_id, start, total - start))
+
+    def __len__(self) -> int:
+        return self._total
+
+    def __getitem__(self, idx):
+        # Un slice es una vista fija: no ve los mensajes que se agreguen después.
+        return _View(self, 0, self._total)[idx]
+
+    def _at(self, i: int) -> Dict:
+        with self._mu:
+            base = self._total - len(self._recent)
+            if i >= base:
+                return self._recent[i - base]
+            page_no = i // self.page_size
+            page = self._pages.get(page_no)
+            if page is not None:
+                self._pages.move_to_end(page_no)
+        if page is None:
+            page = fetch_messages(self.id, page_no * self.page_size, self.page_size)
+            with self._mu:
+                self._pages[page_no] = page
+                while len(self._pages) > _MAX_PAGES:
+                    self._pages.popitem(last=False)
+            with _LOCK:
+                _STATS["page_loads"] += 1
+        return page[i - page_no * self.page_size]
+
+    def append(self, message: Dict) -> int:
+        msg = {"role": message.get("role", "user"), "content": message.get("content", "") or ""}
+        seq = append_message(self.id, msg["role"], msg["content"])
+        with self._mu:
+            if seq != self._total:
+                # Otra réplica (u otra instancia ya desalojada) escribió en medio: se relee la cola.
+                start = max(0, seq - self.window_size + 1)
+                self._recent.clear()
+                self._recent.extend(fetch_messages(self.id, start, seq - start))
+                self._pages.clear()
+            self._recent.append(msg)
+            self._total = seq + 1
+        self.last_seen = time.time()
+        return seq
+
+    def recent(self, n: int) -> List[Dict]:
+        """Last ``n`` messages (from memory when they fit in the window)."""
+        total = len(self)
+        return list(self[max(0, total - n):total])
+
+    def older(self, before: int, limit: int) -> List[Dict]:
+        """Up to ``limit`` messages ending right before index ``before``, read straight from the DB."""
+        start = max(0, before - limit)
+        return fetch_messages(self.id, start, before - start) if before > 0 else []
+
+    def save_client_info(self, client_info: Optional[Dict] = None) -> None:
+        info = {k: v for k, v in (self.client_info if client_info is None else client_info).items() if v}
+        if info != self._saved_info:
+            set_conversation_client_info(self.id, info)
+            self._saved_info = dict(info)
+        self.client_info = info
+
+
+def open_conversation(conversation_id: str, channel: str = "web", create: bool = True,
+                      greeting: Optional[str] = None, cfg: Optional[dict] = None) -> Conversation:
+    """
+    Session for ``conversation_id`` from the registry, or reopened from the DB (created
+    when ``create``; otherwise ``KeyError`` if it does not exist). A new, empty
+    conversation starts with ``greeting`` as its first assistant message.
+    """
+    cfg = cfg or get_config()
+    now = time.time()
+    with _LOCK:
+        conv = _SESSIONS.get(conversation_id)
+        if conv is not None:
+            _SESSIONS.move_to_end(conversation_id)
+            conv.last_seen = now
+            _STATS["opened"] += 1
+    if conv is None:
+        row = get_conversation(conversation_id)
+        if row is None:
+            if not create:
+                raise KeyError(conversation_id)
+            row = create_conversation(conversation_id, channel)
+        try:
+            info = json.loads(row.get("client_info_json") or "{}")
+        except ValueError:
+            info = {}
+        fresh = Conversation(conversation_id, int(row["message_count"]), info, row.get("channel") or channel, cfg)
+        with _LOCK:
+            # Si otro hilo la abrió mientras leíamos, gana la que ya está registrada.
+            conv = _SESSIONS.setdefault(conversation_id, fresh)
+            _SESSIONS.move_to_end(conversation_id)
+            _STATS["opened"] += 1
+            if conv is fresh:
+                _STATS["loaded"] += 1
+    if greeting and not len(conv):
+        conv.append({"role": "assistant", "content": greeting})
+    evict_idle(cfg=cfg)
+    return conv
+
+
+def evict_idle(now: Optional[float] = None, cfg: Optional[dict] = None) -> int:
+    """Drop idle (or least recently used beyond the cap) sessions; returns how many left the registry."""
+    cfg = cfg or get_config()
+    now = now or time.time()
+    idle_s = float(cfg.get("conv_idle_s", 1800))
+    cap = max(1, int(cfg.get("conv_max_sessions", 5000)))
+    evicted = 0
+    with _LOCK:
+        busy = []
+        while _SESSIONS:
+            cid, conv = next(iter(_SESSIONS.items()))
+            if len(_SESSIONS) + len(busy) <= cap and now - conv.last_seen < idle_s:
+                break
+            _SESSIONS.popitem(last=False)
+            if conv.lock.locked():
+                # En uso (p. ej. un turno de la API en curso): se conserva.
+                busy.append((cid, conv))
+                continue
+            evicted += 1
+        for cid, conv in busy:
+            _SESSIONS[cid] = conv
+        _STATS["evicted"] += evicted
+    return evicted
+
+
+def session_stats() -> Dict:
+    with _LOCK:
+        sessions = len(_SESSIONS)
+        cached = sum(len(c._recent) for c in _SESSIONS.values())
+    return {"sessions": sessions, "cached_messages": cached, **_STATS}
+
+
+register_collector("conversations", session_stats)
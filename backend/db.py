@@ -11,6 +11,8 @@ import secrets
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 from .config import get_db_path, get_config, get_assets_dir
+from .images import ingest_image, content_hash
+from .metrics import instrument_module
 
 
 def _conn():
@@ -20,6 +22,21 @@ def _conn():
     return conn
 
 
+def _bump_stamp(c: sqlite3.Connection, name: str):
+    # Contador por tabla; los paneles que refrescan solo re-consultan cuando cambia.
+    # Toda escritura en orders / pendings debe subirlo (en la misma transacción),
+    # aunque hoy ningún panel muestre la columna tocada.
+    c.execute("""INSERT INTO change_stamps(name, stamp) VALUES (?, 1)
+                 ON CONFLICT(name) DO UPDATE SET stamp = stamp + 1""", (name,))
+
+
+def get_change_stamp(name: str) -> int:
+    c = _conn()
+    row = c.execute("SELECT stamp FROM change_stamps WHERE name = ?", (name,)).fetchone()
+    c.close()
+    return int(row["stamp"]) if row else 0
+
+
 def _col_exists(c: sqlite3.Connection, table: str, col: str) -> bool:
     cur = c.execute(f"PRAGMA table_info({table})")
     return any(r["name"] == col for r in cur.fetchall())
@@ -63,6 +80,23 @@ def _ensure_schema_migrations(c: sqlite3.Connection):
                 "ALTER TABLE pendings ADD COLUMN notified INTEGER NOT NULL DEFAULT 0")
         except Exception:
             pass
+    # menu_images: metadatos del pipeline de ingesta (backend/images.py)
+    for col, typ in (("width", "INTEGER"), ("height", "INTEGER"), ("bytes", "INTEGER"),
+                     ("content_hash", "TEXT"), ("thumb_path", "TEXT")):
+        if not _col_exists(c, "menu_images", col):
+            try:
+                c.execute(f"ALTER TABLE menu_images ADD COLUMN {col} {typ}")
+            except Exception:
+                pass
+    # Un hash por fila: la deduplicación de add_menu_image se apoya en este índice único.
+    try:
+        c.execute("""DELETE FROM menu_images WHERE content_hash IS NOT NULL AND id NOT IN (
+                         SELECT MIN(id) FROM menu_images WHERE content_hash IS NOT NULL GROUP BY content_hash)""")
+        c.execute("DROP INDEX IF EXISTS idx_menu_images_hash")
+        c.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_menu_images_hash_u ON menu_images(content_hash)")
+    except Exception:
+        pass
 
 
 def init_db(seed: bool = True):
@@ -137,6 +171,35 @@ def init_db(seed: bool = True):
         pattern TEXT NOT NULL,
         answer TEXT NOT NULL
     )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS llm_cache (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS change_stamps (
+        name TEXT PRIMARY KEY,
+        stamp INTEGER NOT NULL DEFAULT 0
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS conversations (
+        id TEXT PRIMARY KEY,
+        channel TEXT NOT NULL DEFAULT 'web',
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        client_info_json TEXT NOT NULL DEFAULT '{}'
+    )""")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS messages (
+        conversation_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        PRIMARY KEY (conversation_id, seq)
+    )""")
     c.commit()
     _ensure_schema_migrations(c)
     if seed:
@@ -215,10 +278,12 @@ def delete_menu_item(name: str):
 
 
 def add_menu_image(file):
+    """
+    Store an uploaded menu image through the ingest pipeline (resize, thumbnail,
+    re-encode). The same upload is stored once: a known content hash returns the
+    existing path.
+    """
     assets = get_assets_dir()
-    import time
-    import os
-    ts = int(time.time()*1000)
     ext = ""
     try:
         name = getattr(file, "name", "")
@@ -227,27 +292,57 @@ def add_menu_image(file):
         pass
     if ext not in [".png", ".jpg", ".jpeg"]:
         ext = ".png"  # fallback
-    out_path = os.path.join(assets, f"img_{ts}{ext}")
     try:
         file.seek(0)
     except Exception:
         pass
-    with open(out_path, "wb") as f:
-        f.write(file.read())
+    data = file.read()
+    digest = content_hash(data)
     c = _conn()
-    c.execute("INSERT INTO menu_images(file_path, created_at) VALUES (?,?)",
-              (out_path, datetime.utcnow().isoformat()))
-    c.commit()
+    row = c.execute("SELECT file_path FROM menu_images WHERE content_hash=? LIMIT 1",
+                    (digest,)).fetchone()
     c.close()
-    return out_path
+    if row:
+        return row["file_path"]
+    # Sin conexión abierta: ingest_image lanza ValueError con imágenes ilegibles.
+    meta = ingest_image(data, assets, digest=digest, ext=ext)
+    c = _conn()
+    try:
+        cur = c.execute("""INSERT OR IGNORE INTO menu_images(file_path, created_at, width, height, bytes,
+                                                             content_hash, thumb_path)
+                           VALUES (?,?,?,?,?,?,?)""",
+                        (meta["file_path"], datetime.utcnow().isoformat(), meta["width"], meta["height"],
+                         meta["bytes"], meta["content_hash"], meta["thumb_path"]))
+        row = None if cur.rowcount else c.execute(
+            "SELECT file_path, thumb_path FROM menu_images WHERE content_hash=?", (digest,)).fetchone()
+        c.commit()
+    finally:
+        c.close()
+    if row is None:
+        return meta["file_path"]
+    # Otra subida del mismo contenido ganó la carrera: se borran los archivos propios que su fila no usa.
+    for path in {meta["file_path"], meta["thumb_path"]} - {row["file_path"], row["thumb_path"]}:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return row["file_path"]
 
 
-def fetch_menu_images() -> List[str]:
+def fetch_menu_images(offset: int = 0, limit: Optional[int] = None, thumbs: bool = False) -> List[str]:
     c = _conn()
     rows = c.execute(
-        "SELECT file_path FROM menu_images ORDER BY id DESC").fetchall()
+        "SELECT file_path, thumb_path FROM menu_images ORDER BY id DESC LIMIT ? OFFSET ?",
+        (-1 if limit is None else int(limit), int(offset))).fetchall()
+    c.close()
+    return [(r["thumb_path"] or r["file_path"]) if thumbs else r["file_path"] for r in rows]
+
+
+def count_menu_images() -> int:
+    c = _conn()
+    n = c.execute("SELECT COUNT(*) FROM menu_images").fetchone()[0]
     c.close()
-    return [r["file_path"] for r in rows]
+    return int(n)
 
 # Orders
 
@@ -287,6 +382,7 @@ def create_order_from_chat_ready(client: Dict[str, Any], items: List[Dict[str, A
          items_json, total, currency, status, created_at, priority, sla_deadline, sla_breached)
          VALUES (:id,:client_name,:phone,:delivery_type,:address,:pickup_eta_min,:payment_method,
                  :items_json,:total,:currency,:status,:created_at,:priority,:sla_deadline,:sla_breached)""", row)
+    _bump_stamp(c, "orders")
     c.commit()
     c.close()
     return row
@@ -300,10 +396,19 @@ def fetch_orders_queue() -> List[Dict[str, Any]]:
     return [dict(r) for r in rows]
 
 
+def fetch_active_orders() -> List[Dict[str, Any]]:
+    c = _conn()
+    rows = c.execute("""SELECT * FROM orders WHERE status != 'delivered'
+                       ORDER BY sla_breached DESC, priority DESC, created_at ASC""").fetchall()
+    c.close()
+    return [dict(r) for r in rows]
+
+
 def update_order_status(order_id: str, new_status: str):
     c = _conn()
     c.execute("UPDATE orders SET status = ? WHERE id = ?",
               (new_status, order_id))
+    _bump_stamp(c, "orders")
     c.commit()
     c.close()
 
@@ -311,9 +416,13 @@ def update_order_status(order_id: str, new_status: str):
 def bump_priorities_if_sla_missed():
     now = datetime.utcnow().isoformat()
     c = _conn()
-    c.execute("""UPDATE orders
+    # Solo las que recién vencen: con refresco periódico la prioridad no debe crecer en cada pasada.
+    cur = c.execute("""UPDATE orders
                  SET sla_breached = 1, priority = priority + 1
-                 WHERE sla_deadline IS NOT NULL AND sla_deadline < ? AND status != 'delivered'""", (now,))
+                 WHERE sla_deadline IS NOT NULL AND sla_deadline < ? AND status != 'delivered'
+                   AND sla_breached = 0""", (now,))
+    if cur.rowcount:
+        _bump_stamp(c, "orders")
     c.commit()
     c.close()
 
@@ -339,6 +448,7 @@ def create_pending_question(conversation_id: str, question: str, language: str,
     c = _conn()
     c.execute("""INSERT INTO pendings(id, conversation_id, question, language, created_at, expires_at, status, answer, notified)
                  VALUES(:id,:conversation_id,:question,:language,:created_at,:expires_at,:status,:answer,:notified)""", row)
+    _bump_stamp(c, "pendings")
     c.commit()
     c.close()
     return row
@@ -365,6 +475,7 @@ def fetch_unnotified_decisions(conversation_id: str) -> List[Dict[str, Any]]:
 def mark_pending_notified(pending_id: str):
     c = _conn()
     c.execute("UPDATE pendings SET notified = 1 WHERE id = ?", (pending_id,))
+    _bump_stamp(c, "pendings")
     c.commit()
     c.close()
 
@@ -381,6 +492,7 @@ def answer_pending_question(pending_id: str, status: str, answer: str = ""):
     c = _conn()
     c.execute("UPDATE pendings SET status = ?, answer = ? WHERE id = ?",
               (status, answer, pending_id))
+    _bump_stamp(c, "pendings")
     c.commit()
     c.close()
 
@@ -388,8 +500,94 @@ def answer_pending_question(pending_id: str, status: str, answer: str = ""):
 def autoapprove_expired_pendings():
     now = datetime.utcnow().isoformat()
     c = _conn()
-    c.execute("""UPDATE pendings SET status = 'approved', answer = 'Auto-aprobado por timeout'
+    cur = c.execute("""UPDATE pendings SET status = 'approved', answer = 'Auto-aprobado por timeout'
                  WHERE status = 'pending' AND expires_at < ?""", (now,))
+    if cur.rowcount:
+        _bump_stamp(c, "pendings")
+    c.commit()
+    c.close()
+
+# Conversations (solo-append; ver backend/conversations.py)
+
+
+def get_conversation(conversation_id: str) -> Optional[Dict[str, Any]]:
+    c = _conn()
+    row = c.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+    c.close()
+    return dict(row) if row else None
+
+
+def create_conversation(conversation_id: str, channel: str = "web") -> Dict[str, Any]:
+    now = datetime.utcnow().isoformat()
+    c = _conn()
+    c.execute("INSERT OR IGNORE INTO conversations(id, channel, created_at, updated_at) VALUES (?,?,?,?)",
+              (conversation_id, channel, now, now))
+    c.commit()
+    row = c.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+    c.close()
+    return dict(row)
+
+
+def append_message(conversation_id: str, role: str, content: str) -> int:
+    """Append one message and return its ``seq`` (0-based position in the conversation)."""
+    now = datetime.utcnow().isoformat()
+    c = _conn()
+    # BEGIN IMMEDIATE: el seq se asigna y se inserta sin que otro escritor se intercale.
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        row = c.execute("SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if row is None:
+            c.execute("INSERT INTO conversations(id, created_at, updated_at) VALUES (?,?,?)",
+                      (conversation_id, now, now))
+            seq = 0
+        else:
+            seq = int(row["message_count"])
+        c.execute("INSERT INTO messages(conversation_id, seq, role, content, created_at) VALUES (?,?,?,?,?)",
+                  (conversation_id, seq, role, content, now))
+        c.execute("UPDATE conversations SET message_count = ?, updated_at = ? WHERE id = ?",
+                  (seq + 1, now, conversation_id))
+        c.commit()
+    except Exception:
+        # Sin esto el lock de escritura y la conexión quedan abiertos hasta el GC.
+        c.rollback()
+        raise
+    finally:
+        c.close()
+    return seq
+
+
+def fetch_messages(conversation_id: str, start: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    c = _conn()
+    rows = c.execute(
+        "SELECT role, content FROM messages WHERE conversation_id = ? AND seq >= ? ORDER BY seq ASC LIMIT ?",
+        (conversation_id, max(0, start), -1 if limit is None else limit)).fetchall()
+    c.close()
+    return [dict(r) for r in rows]
+
+
+def set_conversation_client_info(conversation_id: str, client_info: Dict[str, Any]):
+    c = _conn()
+    c.execute("UPDATE conversations SET client_info_json = ?, updated_at = ? WHERE id = ?",
+              (json.dumps(client_info, ensure_ascii=False), datetime.utcnow().isoformat(), conversation_id))
+    c.commit()
+    c.close()
+
+# LLM cache (tier compartido; ver backend/llm_cache.py)
+
+
+def llm_cache_get(key: str) -> Optional[tuple]:
+    c = _conn()
+    row = c.execute("SELECT value, expires_at FROM llm_cache WHERE key = ? AND expires_at > ?",
+                    (key, time.time())).fetchone()
+    c.close()
+    return (row["value"], row["expires_at"]) if row else None
+
+
+def llm_cache_put(key: str, value: str, expires_at: float):
+    c = _conn()
+    c.execute("INSERT OR REPLACE INTO llm_cache(key, value, expires_at) VALUES (?,?,?)",
+              (key, value, expires_at))
+    c.execute("DELETE FROM llm_cache WHERE expires_at < ?", (time.time(),))
     c.commit()
     c.close()
 
@@ -495,3 +693,8 @@ def create_user(tenant_id: int, username: str, password: str, role: str):
               (tenant_id, username, h, salt, role))
     c.commit()
     c.close()
+
+
+# Latencia por función en db_call_seconds{fn=...} (backend/metrics.py). Va al final:
+# quien haga `from .db import x` después de cargar el módulo recibe la versión medida.
+instrument_module(globals(), "db_call_seconds")
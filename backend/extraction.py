@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from typing import List, Dict, Optional
+import re
+import json
+import hashlib
+import difflib
+
+from .textnorm import normalize_text, fold_accents, tokenize
+from .metrics import timed, inc
+
+# Motor de extracción: cada mensaje del cliente se recorre una sola vez y produce
+# un evento (delta del carrito, campos del cliente, escalar a cocina, cierre, idioma)
+# que leen la página y el flujo de respuesta, en lugar de re-escanear el historial.
+
+NUMWORDS_ES = {"uno": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4,
+               "cinco": 5, "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10}
+NUMWORDS_EN = {"one": 1, "a": 1, "two": 2, "three": 3, "four": 4,
+               "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+
+# Broadened intent tokens (covers “¿Puede ser…?”, “¿Podría…?”, “Quisiera…?”)
+_ACTION_TOKENS = {
+    "quiero", "pedir", "ordena", "ordenar", "agrega", "agregar", "quitar", "sin", "con", "extra",
+    "doble", "triple", "cambiar", "sustituir", "reducir", "añadir", "sumar", "puede", "podria", "quisiera", "seria"
+}
+# Accent-folded (see backend.textnorm): "limon" also covers "limón".
+_EASY_INGREDIENTS = {
+    "cebolla", "salsa", "papas", "picante", "sal", "azucar", "hielo", "limon", "mayonesa", "ketchup"
+}
+
+
+def _build_aliases(menu: List[Dict]) -> Dict[str, str]:
+    variants: Dict[str, str] = {}
+
+    def add_alias(alias: str, to_name: str):
+        if not alias:
+            return
+        a = fold_accents(alias.strip().lower())
+        if len(a) < 3:
+            return
+        variants[a] = to_name
+        if not a.endswith("s"):
+            variants[a+"s"] = to_name
+    for m in (menu or []):
+        nm = (m.get("name") or "").strip()
+        if not nm:
+            continue
+        low = fold_accents(nm.lower())
+        variants[low] = nm
+        if not low.endswith("s"):
+            variants[low+"s"] = nm
+        if low.endswith("a"):
+            variants[low[:-1]+"as"] = nm
+        if low.endswith("o"):
+            variants[low[:-1]+"os"] = nm
+        desc = fold_accents((m.get("description") or "").strip().lower())
+        if desc:
+            first_tok = re.split(r"\W+", desc)[0] if desc else ""
+            add_alias(first_tok, nm)
+        notes = (m.get("special_notes") or "")
+        if notes:
+            for tok in re.split(r"[,\|/]+", notes):
+                add_alias(tok, nm)
+    return variants
+
+
+def should_create_pending(user_text: str, menu: List[Dict]) -> bool:
+    """
+    Create a pending ONLY when:
+      A) Explicit ask to check with restaurant (preguntar/consultar/cocina), OR
+      B) A complex customization: 'sin|con|extra|doble|triple' + ingredient NOT in EASY set, OR
+      C) Clear off-menu hint words (e.g., 'almíbar', 'durazno(s)', 'canela', etc.) AND those terms
+         do not map to any menu alias (i.e., it's not recognized from the menu).
+    """
+    norm = normalize_text(user_text)
+    text_low = norm.folded
+    tokens = set(norm.tokens)
+
+    # A) Explicit ask to check
+    if re.search(r"\b(preguntar|consultar|cocina)\b", text_low):
+        return True
+
+    aliases = _menu_aliases(menu)
+
+    # B) Complex customization (non-easy ingredient after sin/con/extra/doble/triple)
+    mods = re.findall(
+        r"(?:\b(?:sin|con|extra|doble|triple)\s+)(\w+)", text_low)
+    for ing in mods:
+        if ing not in _EASY_INGREDIENTS:
+            # If the text mentions at least one menu item or is clearly modifying something,
+            # treat as complex and escalate.
+            return True
+
+    # C) Off-menu hints (conservative list; expand as needed)
+    OFFMENU_HINTS = [
+        "almibar", "durazn", "melocoton", "canela",
+        "sirope", "almendra", "maracuy", "arandano", "tamarindo"
+    ]
+    has_offmenu_word = any(h in text_low for h in OFFMENU_HINTS)
+
+    # Recognized menu tokens?
+    mentioned = []
+    for tok in tokens:
+        if tok in aliases:
+            mentioned.append(aliases[tok])
+        else:
+            cands = difflib.get_close_matches(
+                tok, list(aliases.keys()), n=1, cutoff=0.9)
+            if cands:
+                mentioned.append(aliases[cands[0]])
+    mentioned = list(dict.fromkeys(mentioned))
+
+    # Only consider off-menu pending if we saw an off-menu hint and nothing from the menu matched
+    if has_offmenu_word and not mentioned:
+        return True
+
+    # Otherwise, do NOT create a pending for generic messages like "hola, quiero ordenar"
+    return False
+
+
+# Closings ("eso es todo" / "that's all").
+DONE_PHRASES = ["eso seria todo", "eso es todo", "nada mas", "listo", "no, gracias", "no gracias", "ya no",
+                "that's all", "nothing else", "no thanks", "i'm done", "done"]
+
+
+def is_done_message(text: str) -> bool:
+    """True for "eso es todo" / "that's all" style closings."""
+    low = normalize_text(text).folded
+    return any(tok in low for tok in DONE_PHRASES)
+
+
+def menu_version(menu: List[Dict]) -> str:
+    """Stable hash of the menu fields the parser and prompts depend on."""
+    raw = json.dumps([(m.get("name"), m.get("description"), m.get("price"), m.get("special_notes"))
+                      for m in (menu or [])], ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+_ALIASES_CACHE: Dict[str, Dict[str, str]] = {}
+
+
+def _menu_aliases(menu: List[Dict]) -> Dict[str, str]:
+    ver = menu_version(menu)
+    aliases = _ALIASES_CACHE.get(ver)
+    if aliases is None:
+        if len(_ALIASES_CACHE) > 16:
+            _ALIASES_CACHE.clear()
+        aliases = _ALIASES_CACHE[ver] = _build_aliases(menu)
+    return aliases
+
+
+# Quantity grammar: number token (digit or number word) immediately followed by a
+# menu alias, matched in one tokenizer pass. Compiled once per (menu version, lang).
+_GRAMMAR_CACHE: Dict[tuple, Dict] = {}
+
+
+def _plural_forms(word: str) -> List[str]:
+    forms = [word]
+    if not word.endswith("s"):
+        forms.append(word + "s")
+        if not word.endswith(("a", "e", "i", "o", "u")):
+            forms.append(word + "es")
+    return forms
+
+
+def qty_grammar(menu: List[Dict], lang: str) -> Dict:
+    """Alias phrases and number words for ``scan_quantities``, compiled once per menu version and language."""
+    key = (menu_version(menu), lang)
+    g = _GRAMMAR_CACHE.get(key)
+    if g is not None:
+        return g
+    phrases: Dict[tuple, str] = {}
+    for alias, nm in _menu_aliases(menu).items():
+        toks = tokenize(alias)
+        if not toks:
+            continue
+        for last in _plural_forms(toks[-1]):
+            phrases.setdefault(toks[:-1] + (last,), nm)
+    g = {
+        "phrases": phrases,
+        "max_len": max((len(k) for k in phrases), default=1),
+        "numbers": NUMWORDS_ES if lang == "es" else NUMWORDS_EN,
+    }
+    if len(_GRAMMAR_CACHE) > 16:
+        _GRAMMAR_CACHE.clear()
+    _GRAMMAR_CACHE[key] = g
+    return g
+
+
+def scan_quantities(tokens: List[str], grammar: Dict) -> List[tuple]:
+    """
+    Return every menu mention in ``tokens`` as ``(name, qty)``; ``qty`` is the number
+    token right before the alias, or 0 when there is none. Longest alias wins.
+    """
+    phrases, max_len, numbers = grammar["phrases"], grammar["max_len"], grammar["numbers"]
+    hits = []
+    i, n = 0, len(tokens)
+    while i < n:
+        match_len, nm = 0, None
+        for ln in range(min(max_len, n - i), 0, -1):
+            nm = phrases.get(tuple(tokens[i:i + ln]))
+            if nm:
+                match_len = ln
+                break
+        if not match_len:
+            i += 1
+            continue
+        qty = 0
+        if i > 0:
+            prev = tokens[i - 1]
+            if prev.isdigit():
+                qty = int(prev)
+            elif prev in numbers:
+                qty = numbers[prev]
+        hits.append((nm, qty))
+        i += match_len
+    return hits
+
+
+def new_conversation_state() -> Dict:
+    """Empty parser state; keep one per conversation (e.g. in st.session_state)."""
+    return {
+        "menu_version": None,
+        "lang": None,
+        "consumed": 0,
+        "last_sig": None,
+        "counts": {},
+        "first_qty": {},
+        "tokens_seen": set(),
+        "fuzzy": {},
+        "info_raw": {},
+        "items": [],
+        "client_info": {},
+        "events": [],
+        "last_event": None,
+        "detected_lang": None,
+    }
+
+
+def _msg_sig(m: Dict) -> str:
+    return f"{m.get('role')}:{m.get('content', '')}"
+
+
+# Palabras frecuentes para detectar el idioma del mensaje (sin dependencias).
+_LANG_HINTS = {
+    "es": {"hola", "quiero", "quisiera", "gracias", "favor", "para", "con", "sin", "que", "una", "pedido",
+           "cuanto", "tienen", "por", "eso", "todo", "mas", "dame", "y", "el", "la", "los", "las", "de"},
+    "en": {"hello", "hi", "want", "would", "like", "please", "thanks", "with", "without", "the", "order",
+           "how", "much", "have", "and", "that", "all", "some", "can", "get", "of", "my"},
+}
+
+
+def detect_language(tokens) -> Optional[str]:
+    """``"es"``/``"en"`` by hint-word majority, ``None`` when undecided."""
+    es = sum(1 for t in tokens if t in _LANG_HINTS["es"])
+    en = sum(1 for t in tokens if t in _LANG_HINTS["en"])
+    if es == en:
+        return None
+    return "es" if es > en else "en"
+
+
+def _consume_user_message(state: Dict, text: str, grammar: Dict, lang: str) -> tuple:
+    tokens = normalize_text(text).tokens
+    counts, first_qty = state["counts"], state["first_qty"]
+    for nm, qty in scan_quantities(tokens, grammar):
+        counts[nm] = counts.get(nm, 0) + 1
+        if qty and nm not in first_qty:
+            first_qty[nm] = qty
+    state["tokens_seen"].update(tokens)
+
+    _accumulate_client_info(state["info_raw"], text or "", lang)
+    return tokens
+
+
+def _rebuild_items(state: Dict, menu: List[Dict], aliases: Dict[str, str]) -> List[Dict]:
+    price_map = {m["name"]: float(m.get("price", 0.0))
+                 for m in (menu or []) if m.get("name")}
+    found = dict(state["counts"])
+    if not found:
+        # Fuzzy fallback; each distinct token is matched at most once per conversation.
+        fuzzy = state["fuzzy"]
+        keys = list(aliases.keys())
+        for tok in state["tokens_seen"]:
+            if tok not in fuzzy:
+                cands = difflib.get_close_matches(tok, keys, n=1, cutoff=0.86)
+                fuzzy[tok] = aliases[cands[0]] if cands else None
+            if fuzzy[tok]:
+                found[fuzzy[tok]] = found.get(fuzzy[tok], 0) + 1
+    items = []
+    for nm, count in found.items():
+        q = max(state["first_qty"].get(nm, 1), count)
+        items.append(
+            {"name": nm, "qty": q, "unit_price": price_map.get(nm, 0.0)})
+    return items
+
+
+@timed("parse_seconds", stage="update")
+def update_conversation_state(state: Dict, history: List[Dict], menu: List[Dict], cfg: dict, lang: str | None = None,
+                              emit_events: bool = True) -> Dict:
+    """
+    Feed only the messages appended since the last call into ``state`` and refresh
+    ``state["items"]`` / ``state["client_info"]``. Falls back to a full re-parse when
+    the menu or language changed, or when ``history`` is no longer an extension of
+    what was consumed (new chat, truncated transcript).
+
+    Each new user message also yields one event in ``state["events"]`` (only the
+    ones from this call; ``state["last_event"]`` keeps the latest)::
+
+        {"index", "text", "cart_delta": {name: qty change}, "fields": {changed client fields},
+         "escalate": bool, "done": bool, "lang": "es" | "en" | None}
+    """
+    lang = lang or (cfg or {}).get("language", "es")
+    history = history or []
+    ver = menu_version(menu)
+    consumed = state.get("consumed", 0)
+    stale = (
+        state.get("menu_version") != ver
+        or state.get("lang") != lang
+        or consumed > len(history)
+        or (consumed and _msg_sig(history[consumed - 1]) != state.get("last_sig"))
+    )
+    if stale:
+        if consumed:
+            inc("parse_resets_total")
+        state.clear()
+        state.update(new_conversation_state())
+        state["menu_version"], state["lang"] = ver, lang
+        consumed = 0
+
+    new_msgs = history[consumed:]
+    state["events"] = []
+    if not new_msgs and not stale:
+        return state
+
+    aliases = _menu_aliases(menu)
+    grammar = qty_grammar(menu, lang)
+    for offset, m in enumerate(new_msgs):
+        if m.get("role") != "user":
+            continue
+        text = m.get("content", "") or ""
+        with timed("parse_seconds", stage="message"):
+            tokens = _consume_user_message(state, text, grammar, lang)
+        if not emit_events:
+            continue
+        before_items = {it["name"]: it["qty"] for it in state["items"]}
+        before_info = state["client_info"]
+        state["items"] = _rebuild_items(state, menu, aliases)
+        state["client_info"] = _client_info_from_raw(state["info_raw"])
+        after_items = {it["name"]: it["qty"] for it in state["items"]}
+        detected = detect_language(tokens)
+        event = {
+            "index": consumed + offset,
+            "text": text,
+            "cart_delta": {nm: after_items.get(nm, 0) - before_items.get(nm, 0)
+                           for nm in set(before_items) | set(after_items)
+                           if after_items.get(nm, 0) != before_items.get(nm, 0)},
+            "fields": {k: v for k, v in state["client_info"].items() if v and v != before_info.get(k)},
+            "escalate": should_create_pending(text, menu),
+            "done": is_done_message(text),
+            "lang": detected,
+        }
+        if detected:
+            state["detected_lang"] = detected
+        state["events"].append(event)
+        state["last_event"] = event
+    inc("parse_messages_total", len(new_msgs))
+    state["consumed"] = len(history)
+    state["last_sig"] = _msg_sig(history[-1]) if history else None
+    if not emit_events:
+        state["items"] = _rebuild_items(state, menu, aliases)
+        state["client_info"] = _client_info_from_raw(state["info_raw"])
+    return state
+
+
+def parse_items_from_chat(history: List[Dict], menu: List[Dict], cfg: dict, lang: str | None = None) -> List[Dict]:
+    state = update_conversation_state(
+        new_conversation_state(), history, menu, cfg, lang=lang, emit_events=False)
+    return state["items"]
+
+
+def ensure_all_required_present(info: Dict, lang: str) -> List[str]:
+    req = ["name", "phone", "delivery_type", "payment_method"]
+    if (info.get("delivery_type") or "").lower() == "delivery":
+        req.append("address")
+    else:
+        req.append("pickup_eta_min")
+    missing = [k for k in req if not str(info.get(k, "")).strip()]
+    if "pickup_eta_min" in missing and (info.get("delivery_type") or "").lower() == "pickup":
+        info["pickup_eta_min"] = 30
+        try:
+            missing.remove("pickup_eta_min")
+        except ValueError:
+            pass
+    return missing
+
+
+_NAME_PAT_ES = re.compile(
+    r"(?i)(?:me\s+llamo|soy|mi\s+nombre\s*(?:es|:))\s*([A-Za-zÁÉÍÓÚÜÑ][A-Za-zÁÉÍÓÚÜÑ\s]{1,})")
+_NAME_PAT_EN = re.compile(
+    r"(?i)(?:i\s*am|i'm|my\s+name\s*(?:is|:))\s*([A-Za-z][A-Za-z\s]{1,})")
+_PHONE_PAT_HINT = re.compile(r"(?<!\d)(\+?\d[\d\-\s]{6,}\d)(?!\d)")
+_PHONE_PAT_LABELED = re.compile(
+    r"(?i)(?:tel[eé]fono|phone|cel|cell|m[oó]vil|mobile)\s*(?:es|is|:)?\s*(\+?\d[\d\-\s]{6,}\d)")
+_ADDRESS_PAT_ES = re.compile(r"(?i)direcci[oó]n\s*(?:es|:)?\s*(.+)")
+_ADDRESS_PAT_EN = re.compile(r"(?i)address\s*(?:is|:)?\s*(.+)")
+_MIN_PAT = re.compile(r"(?i)(\d{1,3})\s*(?:min|minute|minutes|minutos)")
+_DELIVERY_ES = re.compile(r"(?i)(domicilio|delivery|enviar|entrega)")
+_PICKUP_ES = re.compile(r"(?i)(retir|recoger|pickup)")
+_DELIVERY_EN = re.compile(r"(?i)(delivery|deliver)")
+_PICKUP_EN = re.compile(r"(?i)(pickup|pick up)")
+_PAY_CASH = re.compile(r"(?i)(efectivo|cash)")
+_PAY_CARD = re.compile(r"(?i)(tarjeta|card)")
+_PAY_ONLINE = re.compile(r"(?i)(online|transfer|transferencia|bank)")
+
+
+def _accumulate_client_info(raw: Dict, text: str, lang: str) -> None:
+    # First match wins for free-text fields; flags are OR-ed across messages.
+    if not raw.get("name"):
+        m = (_NAME_PAT_ES.search(text) if lang ==
+             "es" else _NAME_PAT_EN.search(text))
+        if m:
+            raw["name"] = m.group(1).strip()
+    if not raw.get("phone_labeled"):
+        m = _PHONE_PAT_LABELED.search(text)
+        if m:
+            raw["phone_labeled"] = m.group(1)
+    if not raw.get("phone_hint"):
+        m = _PHONE_PAT_HINT.search(text)
+        if m:
+            raw["phone_hint"] = m.group(1)
+    if (_DELIVERY_ES.search(text) if lang == "es" else _DELIVERY_EN.search(text)):
+        raw["delivery"] = True
+    if (_PICKUP_ES.search(text) if lang == "es" else _PICKUP_EN.search(text)):
+        raw["pickup"] = True
+    if not raw.get("address"):
+        m = (_ADDRESS_PAT_ES.search(text) if lang ==
+             "es" else _ADDRESS_PAT_EN.search(text))
+        if m:
+            raw["address"] = m.group(1).strip()
+    if not raw.get("pickup_eta_min"):
+        m = _MIN_PAT.search(text)
+        if m:
+            raw["pickup_eta_min"] = m.group(1).strip()
+    if _PAY_CASH.search(text):
+        raw["cash"] = True
+    if _PAY_CARD.search(text):
+        raw["card"] = True
+    if _PAY_ONLINE.search(text):
+        raw["online"] = True
+
+
+def _client_info_from_raw(raw: Dict) -> Dict:
+    out = {"name": "", "phone": "", "delivery_type": "",
+           "address": "", "pickup_eta_min": "", "payment_method": ""}
+    out["name"] = raw.get("name", "")
+    phone = raw.get("phone_labeled") or raw.get("phone_hint")
+    if phone:
+        out["phone"] = re.sub(r"\s+", "", phone).replace("-", "")
+    if raw.get("delivery"):
+        out["delivery_type"] = "delivery"
+    elif raw.get("pickup"):
+        out["delivery_type"] = "pickup"
+    out["address"] = raw.get("address", "")
+    out["pickup_eta_min"] = raw.get("pickup_eta_min", "")
+    if raw.get("cash"):
+        out["payment_method"] = "cash"
+    elif raw.get("card"):
+        out["payment_method"] = "card"
+    elif raw.get("online"):
+        out["payment_method"] = "online"
+    return out
+
+
+def extract_client_info(history: List[Dict], lang: str) -> Dict:
+    """Full-transcript variant; the chat page reads ``fields`` from the state's events instead."""
+    raw: Dict = {}
+    for m in history or []:
+        if m.get("role") == "user":
+            _accumulate_client_info(raw, m.get("content", ""), lang)
+    return _client_info_from_raw(raw)
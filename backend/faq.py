@@ -4,6 +4,8 @@ from __future__ import annotations
 import re
 from typing import Optional
 from .db import list_faqs
+from .textnorm import normalize_text, fold_accents
+from .metrics import timed, inc
 
 DEFAULT_FAQ = {
     "es": [
@@ -16,8 +18,10 @@ DEFAULT_FAQ = {
     ]
 }
 
+@timed("faq_match_seconds")
 def match_faq(user_text: str, language: str = "es", tenant_id: Optional[int] = None) -> str | None:
-    text = (user_text or "").lower()
+    # Patterns and text are both accent-folded: "dirección" ~ "direccion".
+    text = normalize_text(user_text).folded
     faqs = []
     try:
         faqs = [(r["pattern"], r["answer"]) for r in list_faqs(tenant_id, language)]
@@ -27,8 +31,10 @@ def match_faq(user_text: str, language: str = "es", tenant_id: Optional[int] = N
         faqs = DEFAULT_FAQ.get(language, [])
     for pat, ans in faqs:
         try:
-            if re.search(pat, text):
+            if re.search(fold_accents(pat), text):
+                inc("faq_lookups_total", result="hit")
                 return ans
         except re.error:
             continue
+    inc("faq_lookups_total", result="miss")
     return None
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import io
+import os
+import hashlib
+from typing import Dict, Optional
+
+from .config import get_config
+
+_EXT = {"WEBP": ".webp", "JPEG": ".jpg", "PNG": ".png"}
+
+
+def _pil():
+    # Pillow es opcional (Streamlit ya lo trae); sin él se guarda el archivo tal cual.
+    # Se importa al primer upload, no al importar db.py.
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # pragma: no cover
+        return None, None
+    return Image, ImageOps
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _encode(img, max_px: int, fmt: str, quality: int) -> bytes:
+    img = img.copy()
+    img.thumbnail((max_px, max_px))
+    if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def ingest_image(data: bytes, assets_dir: str, digest: Optional[str] = None, ext: str = ".png",
+                 cfg: Optional[dict] = None) -> Dict:
+    """
+    Decode an upload, downscale it to ``image_max_px`` (display) and ``image_thumb_px``
+    (thumbnail), re-encode as ``image_format`` and store both under the content hash.
+    Returns ``file_path``, ``thumb_path``, ``width``, ``height``, ``bytes`` and
+    ``content_hash`` (of the original upload, for dedup).
+    """
+    cfg = cfg or get_config()
+    digest = digest or content_hash(data)
+    name = f"img_{digest[:24]}"
+    Image, ImageOps = _pil()
+    if Image is None:
+        out_path = os.path.join(assets_dir, name + ext)
+        with open(out_path, "wb") as f:
+            f.write(data)
+        return {"file_path": out_path, "thumb_path": out_path, "width": None, "height": None,
+                "bytes": len(data), "content_hash": digest}
+
+    fmt = str(cfg.get("image_format", "WEBP")).upper()
+    quality = int(cfg.get("image_quality", 82))
+    try:
+        with Image.open(io.BytesIO(data)) as src:
+            img = ImageOps.exif_transpose(src)
+            img.load()
+    except Exception as e:
+        raise ValueError("No se pudo leer la imagen / Unreadable image") from e
+    display = _encode(img, int(cfg.get("image_max_px", 1600)), fmt, quality)
+    thumb = _encode(img, int(cfg.get("image_thumb_px", 320)), fmt, quality)
+    out_path = os.path.join(assets_dir, name + _EXT.get(fmt, ".img"))
+    thumb_path = os.path.join(assets_dir, name + "_thumb" + _EXT.get(fmt, ".img"))
+    for path, blob in ((out_path, display), (thumb_path, thumb)):
+        with open(path, "wb") as f:
+            f.write(blob)
+    with Image.open(io.BytesIO(display)) as shown:
+        width, height = shown.size
+    return {"file_path": out_path, "thumb_path": thumb_path, "width": width, "height": height,
+            "bytes": len(display), "content_hash": digest}
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Pantalla de cocina: servicio HTTP liviano (stdlib) con la cola de órdenes activas.
+
+    python -m backend.kitchen_server --port 8502
+
+GET /            página de solo lectura que se actualiza por SSE
+GET /api/queue   cola activa en JSON
+GET /events      server-sent events: un snapshot por cada cambio en órdenes
+GET /metrics     métricas del proceso (texto Prometheus)
+
+Un único hilo vigila ``change_stamps`` y reparte el mismo snapshot a todas las pantallas.
+"""
+from __future__ import annotations
+import json
+import queue
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Optional
+from urllib.parse import urlparse, parse_qs
+
+from .config import get_config
+from .db import init_db, fetch_active_orders, get_change_stamp
+from .metrics import register_collector, send_text_metrics
+
+_HEARTBEAT_S = 15.0
+
+_PAGE = """<!doctype html>
+<html lang="es"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Cocina</title>
+<style>
+body{font-family:system-ui,sans-serif;margin:0;background:#111;color:#eee}
+header{padding:10px 16px;background:#222;display:flex;justify-content:space-between}
+#q{display:grid;grid-template-columns:repeat(auto-fill,minmax(240px,1fr));gap:12px;padding:12px}
+.card{background:#1d1d1d;border-radius:8px;padding:10px;border-left:6px solid #4caf50}
+.card.late{border-left-color:#f44336}.card.preparing{border-left-color:#ff9800}
+.card.ready{border-left-color:#2196f3}
+.card h3{margin:0 0 6px;font-size:1rem}.card ul{margin:6px 0;padding-left:18px}
+small{color:#aaa}
+</style></head>
+<body><header><b>🧑‍🍳 Cocina / Kitchen</b><span id="st">…</span></header>
+<div id="q"></div>
+<script>
+const q=document.getElementById('q'), st=document.getElementById('st');
+function esc(s){return String(s??'').replace(/[&<>"]/g,c=>({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;'}[c]));}
+function late(o){return o.sla_breached||(o.sla_deadline&&new Date(o.sla_deadline+'Z')<new Date());}
+function render(data){
+  q.innerHTML=data.orders.map(o=>`<div class="card ${late(o)?'late':''} ${esc(o.status)}">
+    <h3>${esc(o.id)} — ${esc(o.status)}</h3>
+    <small>${esc(o.created_at)} · ${esc(o.client_name)} · ${esc(o.delivery_type)}</small>
+    <ul>${o.items.map(i=>`<li>${esc(i.qty)}× ${esc(i.name)}</li>`).join('')}</ul></div>`).join('')
+    || '<p style="padding:12px">Sin órdenes activas / No active orders</p>';
+  st.textContent=data.orders.length+' · '+new Date().toLocaleTimeString();
+}
+const es=new EventSource('events'+location.search);
+es.onmessage=e=>render(JSON.parse(e.data));
+es.onerror=()=>{st.textContent='reconectando… / reconnecting…';};
+</script></body></html>
+"""
+
+
+def _snapshot(orders: List[Dict], stamp: int) -> str:
+    out = []
+    for o in orders:
+        try:
+            items = json.loads(o.get("items_json") or "[]")
+        except ValueError:
+            items = []
+        out.append({
+            "id": o["id"], "status": o["status"], "created_at": o["created_at"],
+            "client_name": o.get("client_name") or "", "delivery_type": o.get("delivery_type") or "",
+            "priority": o.get("priority", 0), "sla_breached": bool(o.get("sla_breached")),
+            "sla_deadline": o.get("sla_deadline"),
+            "items": [{"name": it.get("name"), "qty": it.get("qty", 1)} for it in items],
+        })
+    return json.dumps({"stamp": stamp, "orders": out}, ensure_ascii=False)
+
+
+class QueueWatcher:
+    """One DB poller per process; subscribers get the latest snapshot (older ones are dropped)."""
+
+    def __init__(self, poll_s: float = 1.0):
+        self.poll_s = poll_s
+        self.stamp: Optional[int] = None
+        self.payload = _snapshot([], 0)
+        self._subs: List[queue.Queue] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def refresh(self) -> bool:
+        stamp = get_change_stamp("orders")
+        if stamp == self.stamp:
+            return False
+        payload = _snapshot(fetch_active_orders(), stamp)
+        with self._lock:
+            self.stamp, self.payload = stamp, payload
+            subs = list(self._subs)
+        for q in subs:
+            _offer(q, payload)
+        return True
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                pass
+            self._stop.wait(self.poll_s)
+
+    def start(self) -> "QueueWatcher":
+        self.refresh()
+        threading.Thread(target=self.run, daemon=True, name="kitchen-watcher").start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def current(self) -> str:
+        with self._lock:
+            return self.payload
+
+    def subscribe(self) -> queue.Queue:
+        q: queue.Queue = queue.Queue(maxsize=1)
+        with self._lock:
+            self._subs.append(q)
+            _offer(q, self.payload)
+        return q
+
+    def unsubscribe(self, q: queue.Queue) -> None:
+        with self._lock:
+            if q in self._subs:
+                self._subs.remove(q)
+
+    @property
+    def subscribers(self) -> int:
+        with self._lock:
+            return len(self._subs)
+
+
+def _offer(q: queue.Queue, payload: str) -> None:
+    # Cada mensaje es la cola completa: a un cliente lento solo le sirve el último.
+    try:
+        q.get_nowait()
+    except queue.Empty:
+        pass
+    try:
+        q.put_nowait(payload)
+    except queue.Full:
+        pass
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "kitchen/1.0"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, code: int, body: bytes, ctype: str) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        token = self.server.token
+        if token and parse_qs(url.query).get("token", [""])[0] != token:
+            self._send(403, b"forbidden", "text/plain")
+            return
+        path = url.path.rstrip("/") or "/"
+        watcher: QueueWatcher = self.server.watcher
+        if path == "/":
+            self._send(200, _PAGE.encode("utf-8"), "text/html; charset=utf-8")
+        elif path == "/api/queue":
+            self._send(200, watcher.current().encode("utf-8"), "application/json")
+        elif path == "/events":
+            self._events(watcher)
+        elif path == "/metrics":
+            send_text_metrics(self)
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def _events(self, watcher: QueueWatcher) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "keep-alive")
+        self.end_headers()
+        q = watcher.subscribe()
+        try:
+            while True:
+                try:
+                    payload = q.get(timeout=_HEARTBEAT_S)
+                    self.wfile.write(f"data: {payload}\n\n".encode("utf-8"))
+                except queue.Empty:
+                    self.wfile.write(b": ping\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            watcher.unsubscribe(q)
+
+
+def start_kitchen_server(port: int = 8502, host: str = "0.0.0.0", poll_s: Optional[float] = None,
+                         token: Optional[str] = None) -> ThreadingHTTPServer:
+    """Start the service in a daemon thread; ``.shutdown()`` stops it (and ``.watcher.stop()``)."""
+    poll_s = float(poll_s if poll_s is not None else get_config().get("kitchen_poll_s", 1.0))
+    srv = ThreadingHTTPServer((host, port), _Handler)
+    srv.daemon_threads = True
+    srv.token = token
+    srv.watcher = QueueWatcher(poll_s).start()
+    register_collector("kitchen", lambda: {"subscribers": srv.watcher.subscribers, "stamp": srv.watcher.stamp or 0})
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Kitchen display service (JSON + SSE)")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8502)
+    ap.add_argument("--poll", type=float, default=None, help="segundos entre lecturas de change_stamps")
+    ap.add_argument("--token", default=None, help="exigir ?token=... en cada petición")
+    args = ap.parse_args()
+    init_db(seed=False)
+    srv = start_kitchen_server(args.port, args.host, args.poll, args.token)
+    print(f"Cocina en http://{args.host}:{args.port}/")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.watcher.stop()
+        srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
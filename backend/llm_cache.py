@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .textnorm import normalize_text
+from .db import llm_cache_get, llm_cache_put
+from .metrics import register_collector
+
+# Caché de respuestas del LLM: LRU+TTL en memoria y, opcionalmente, SQLite (app.db)
+# compartido entre réplicas que montan el mismo directorio de datos.
+_MEM: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_LOCK = threading.Lock()
+_STATS = {"hits_mem": 0, "hits_db": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+# Claves de config que no afectan la respuesta del modelo.
+_CFG_IGNORED = {"sla_minutes", "currency", "llm_connect_timeout", "llm_read_timeout",
+                "llm_max_retries", "llm_pool_size", "llm_stream", "llm_latency_budget_s",
+                "llm_hedge_delay_s"}
+
+
+def _norm_history(messages: List[Dict]) -> List[Tuple[str, str]]:
+    return [(m.get("role", ""), " ".join(normalize_text(m.get("content", "")).folded.split()))
+            for m in messages]
+
+
+def make_key(args: Dict, menu_version: str, cfg: dict) -> str:
+    """
+    Hash of (system prompt, menu version, model, temperature, normalized history,
+    relevant config). Any menu or config change yields a different key, so stale
+    entries are never served and simply age out.
+    """
+    msgs = args.get("messages") or []
+    system = msgs[0]["content"] if msgs and msgs[0].get("role") == "system" else ""
+    rest = msgs[1:] if system else msgs
+    cfg_part = {k: v for k, v in sorted((cfg or {}).items())
+                if k not in _CFG_IGNORED and not k.startswith("llm_cache")}
+    raw = json.dumps({
+        "system": system,
+        "menu": menu_version,
+        "model": args.get("model"),
+        "temperature": args.get("temperature"),
+        "history": _norm_history(rest),
+        "cfg": cfg_part,
+    }, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def enabled(cfg: dict) -> bool:
+    return bool((cfg or {}).get("llm_cache_enabled", True))
+
+
+def get(key: str, cfg: dict) -> Optional[str]:
+    now = time.time()
+    with _LOCK:
+        hit = _MEM.get(key)
+        if hit is not None:
+            expires, value = hit
+            if expires > now:
+                _MEM.move_to_end(key)
+                _STATS["hits_mem"] += 1
+                return value
+            del _MEM[key]
+    if cfg.get("llm_cache_sqlite"):
+        try:
+            row = llm_cache_get(key)
+        except Exception:
+            row = None
+        if row:
+            value, expires = row
+            _remember(key, value, expires, cfg)
+            with _LOCK:
+                _STATS["hits_db"] += 1
+            return value
+    with _LOCK:
+        _STATS["misses"] += 1
+    return None
+
+
+def _remember(key: str, value: str, expires: float, cfg: dict) -> None:
+    max_entries = int(cfg.get("llm_cache_max_entries", 512))
+    with _LOCK:
+        _MEM[key] = (expires, value)
+        _MEM.move_to_end(key)
+        while len(_MEM) > max_entries:
+            _MEM.popitem(last=False)
+            _STATS["evictions"] += 1
+
+
+def put(key: str, value: str, cfg: dict) -> None:
+    if not value:
+        return
+    ttl = float(cfg.get("llm_cache_ttl_s", 600))
+    expires = time.time() + ttl
+    _remember(key, value, expires, cfg)
+    with _LOCK:
+        _STATS["stores"] += 1
+    if cfg.get("llm_cache_sqlite"):
+        try:
+            llm_cache_put(key, value, expires)
+        except Exception:
+            pass
+
+
+def stats() -> Dict[str, float]:
+    with _LOCK:
+        out = dict(_STATS)
+        out["entries"] = len(_MEM)
+    lookups = out["hits_mem"] + out["hits_db"] + out["misses"]
+    out["hit_rate"] = round((out["hits_mem"] + out["hits_db"]) / lookups, 4) if lookups else 0.0
+    return out
+
+
+def clear() -> None:
+    with _LOCK:
+        _MEM.clear()
+
+
+register_collector("llm_cache", stats)
@@ -1,83 +1,48 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-import difflib as _difflib2
-from typing import List, Dict, Optional
+from typing import List, Dict, Iterator, Optional
 import re
-import difflib
-import streamlit as st
-
-try:
-    from openai import OpenAI
-except ImportError as e:
-    raise ImportError(
-        "Falta el paquete 'openai'. Agrega 'openai==1.51.2' a requirements.txt y redeploy.") from e
-
-try:
-    from dotenv import dotenv_values
-except Exception:
-    dotenv_values = lambda *args, **kwargs: {}
+import time
+import hashlib
+import itertools
+import threading
 
 from .config import get_config
+from .llm_client import get_client
+from .menu_context import build_menu_context
+from .chat_history import select_window, summary_state, format_summary
+from . import llm_cache, ratelimit
+from .llm_router import routed_completion, routed_stream, LLMUnavailable
+from .tokens import count_tokens
+from .textnorm import normalize_text
 from .faq import match_faq
 from .db import create_pending_question
-
-NUMWORDS_ES = {"uno": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4,
-               "cinco": 5, "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10}
-NUMWORDS_EN = {"one": 1, "a": 1, "two": 2, "three": 3, "four": 4,
-               "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
-
-
-def _get_client() -> OpenAI:
-    import os
-    for k in ("HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "http_proxy", "https_proxy", "all_proxy"):
-        os.environ.pop(k, None)
-    key = st.secrets.get(
-        "OPENAI_API_KEY") or dotenv_values().get("OPENAI_API_KEY")
-    if not key:
-        raise RuntimeError("Falta OPENAI_API_KEY en .env / secrets")
-    return OpenAI(api_key=key)
-
-
-def _format_price(p) -> str:
-    try:
-        return f"{float(p):.2f}"
-    except Exception:
-        return str(p)
-
-
-def _format_menu(menu: List[Dict]) -> str:
-    lines = []
-    for it in (menu or [])[:120]:
-        name = (it.get("name", "") or "").strip()
-        if not name:
-            continue
-        desc = (it.get("description") or "").strip()
-        price = _format_price(it.get("price", 0))
-        cur = it.get("currency", "USD")
-        notes = (it.get("special_notes") or "").strip()
-        notes_txt = f" — [{notes}]" if notes else ""
-        line = f"- {name} ({cur} {price}){notes_txt}"
-        if desc:
-            line += f"\n  {desc}"
-        lines.append(line)
-    return "\n".join(lines)
-
-
-def _system_prompt(cfg: dict, menu: List[Dict], lang: str) -> str:
-    formatted_menu = _format_menu(menu)
-    tone = cfg.get("tone") or ("Amable y profesional; breve, guiado." if lang ==
-                               "es" else "Friendly and professional; concise, guided.")
-    assistant_name = cfg.get(
-        "assistant_name", "Asistente" if lang == "es" else "Assistant")
+from .metrics import timed, observe, inc, register_collector
+from .extraction import (
+    DONE_PHRASES, menu_version, qty_grammar, scan_quantities, should_create_pending,
+    is_done_message, new_conversation_state, update_conversation_state, parse_items_from_chat,
+)
+
+# Prompt layout: a byte-identical static prefix (rules, then menu) memoized per
+# menu/config version, followed by the per-turn parts. Keeps provider-side prefix
+# caching effective.
+_PREFIX_CACHE: Dict[tuple, str] = {}
+_USAGE_STATS = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+# Los contadores se actualizan desde el worker, el router y los hilos de la API.
+_STATS_LOCK = threading.Lock()
+
+
+def _static_prompt(menu_text: str, lang: str) -> str:
+    key = (hashlib.sha1(menu_text.encode("utf-8")).hexdigest(), lang)
+    cached = _PREFIX_CACHE.get(key)
+    if cached is not None:
+        return cached
     if lang == "es":
-        return (
-            f"Eres {
-                assistant_name}, un asistente de pedidos para un restaurante. Responde SIEMPRE en español.\n"
-            f"Tu tono: {tone}\n\n"
+        text = (
+            "Eres un asistente de pedidos para un restaurante. Responde SIEMPRE en español.\n\n"
             "Objetivo: ayudar al cliente a armar su pedido basado en el menú y confirmar datos.\n"
             "Si detectas petición fuera de menú o una personalización compleja no contemplada, di 'Consultando con cocina...'\n"
             "y espera ~1 minuto la respuesta del restaurante. Si no hay respuesta, aprueba con un precio estimado similar.\n\n"
-            "🍽 Menú disponible:\n" + formatted_menu + "\n\n"
             "📌 Comportamiento:\n"
             "- Cálido, claro, paso a paso. No inventes productos/ingredientes.\n"
             "- Personalizaciones fáciles: sin cebolla, salsa aparte, extra papas, poco picante, sin sal, con hielo, limón, ketchup/mayonesa.\n"
@@ -88,17 +53,15 @@ def _system_prompt(cfg: dict, menu: List[Dict], lang: str) -> str:
             "  1) nombre  2) teléfono  3) pickup o delivery  4) dirección (si delivery)  5) método de pago.\n"
             "Para pickup puedes pedir minutos (default 30). Para delivery NO pidas minutos.\n"
             "NO invites a confirmar hasta tener todos los datos.\n\n"
-            "✅ Al final: “Pedido listo para confirmación. Presiona el botón Confirmar Pedido.”"
+            "✅ Al final: “Pedido listo para confirmación. Presiona el botón Confirmar Pedido.”\n\n"
+            "🍽 Menú disponible:\n" + menu_text
         )
     else:
-        return (
-            f"You are {
-                assistant_name}, a restaurant ordering assistant. ALWAYS respond in Spanish.\n"
-            f"Your tone: {tone}\n\n"
+        text = (
+            "You are a restaurant ordering assistant. ALWAYS respond in Spanish.\n\n"
             "Goal: help the customer build their order based on the menu and confirm details.\n"
             "If you detect an off-menu request or a complex, non-standard customization, say 'Checking with the kitchen...'\n"
             "and wait ~1 minute for the restaurant’s response. If there’s no response, approve with a similar estimated price.\n\n"
-            "🍽 Available menu:\n" + formatted_menu + "\n\n"
             "📌 Behavior:\n"
             "- Warm, clear, and step-by-step. Do not invent products/ingredients.\n"
             "- Easy customizations: no onions, sauce on the side, extra fries, mild spice, no salt, with ice, lemon, ketchup/mayonnaise.\n"
@@ -109,121 +72,208 @@ def _system_prompt(cfg: dict, menu: List[Dict], lang: str) -> str:
             "  1) name  2) phone  3) pickup or delivery  4) address (if delivery)  5) payment method.\n"
             "For pickup you can ask for minutes (default 30). For delivery DO NOT ask for minutes.\n"
             "Do NOT invite to confirm until you have all the data.\n\n"
-            "✅ At the end: “Order ready for confirmation. Please press the Confirm button.”"
-
+            "✅ At the end: “Order ready for confirmation. Please press the Confirm button.”\n\n"
+            "🍽 Available menu:\n" + menu_text
         )
+    if len(_PREFIX_CACHE) > 16:
+        _PREFIX_CACHE.clear()
+    _PREFIX_CACHE[key] = text
+    return text
 
 
-# Broadened intent tokens (covers “¿Puede ser…?”, “¿Podría…?”, “Quisiera…?”)
-_ACTION_TOKENS = {
-    "quiero", "pedir", "ordena", "ordenar", "agrega", "agregar", "quitar", "sin", "con", "extra",
-    "doble", "triple", "cambiar", "sustituir", "reducir", "añadir", "sumar", "puede", "podria", "podría", "quisiera", "seria", "sería"
+def _session_prompt(cfg: dict, relevant_menu: str, lang: str) -> str:
+    tone = cfg.get("tone") or ("Amable y profesional; breve, guiado." if lang ==
+                               "es" else "Friendly and professional; concise, guided.")
+    assistant_name = cfg.get(
+        "assistant_name", "Asistente" if lang == "es" else "Assistant")
+    if lang == "es":
+        text = f"Tu nombre: {assistant_name}.\nTu tono: {tone}"
+        if relevant_menu:
+            text += "\n\n🍽 Detalle de ítems relevantes:\n" + relevant_menu
+    else:
+        text = f"Your name: {assistant_name}.\nYour tone: {tone}"
+        if relevant_menu:
+            text += "\n\n🍽 Relevant item details:\n" + relevant_menu
+    return text
+
+
+def _record_usage(usage, model: Optional[str] = None) -> None:
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    prompt = int(getattr(usage, "prompt_tokens", 0) or 0)
+    cached = int(getattr(details, "cached_tokens", 0) or 0)
+    completion = int(getattr(usage, "completion_tokens", 0) or 0)
+    with _STATS_LOCK:
+        _USAGE_STATS["calls"] += 1
+        _USAGE_STATS["prompt_tokens"] += prompt
+        _USAGE_STATS["cached_tokens"] += cached
+        _USAGE_STATS["completion_tokens"] += completion
+    model = model or "unknown"
+    inc("llm_tokens_total", prompt, model=model, kind="prompt")
+    inc("llm_tokens_total", cached, model=model, kind="cached")
+    inc("llm_tokens_total", completion, model=model, kind="completion")
+
+
+# Cómo se resolvió el último turno de cada hilo (el harness de carga agrupa latencias con esto).
+_TURN_PATH = threading.local()
+
+
+def _replied(t0: float, path: str, text: str) -> str:
+    # Latencia de punta a punta del turno según cómo se resolvió (local / cache / llm / degraded).
+    observe("reply_seconds", time.perf_counter() - t0, path=path)
+    _TURN_PATH.path = getattr(_TURN_PATH, "intent", path) if path == "local" else path
+    return text
+
+
+def last_turn_path() -> Optional[str]:
+    """
+    How the calling thread's last reply was produced: the local intent ("pending", "faq",
+    "subtotal", "menu", "add_item", "done"), or "cache", "degraded" or "llm".
+    """
+    return getattr(_TURN_PATH, "path", None)
+
+
+def prompt_cache_stats() -> Dict[str, float]:
+    """Cached vs. uncached prompt tokens, from the ``usage`` field of completions."""
+    with _STATS_LOCK:
+        out = dict(_USAGE_STATS)
+    out["uncached_tokens"] = out["prompt_tokens"] - out["cached_tokens"]
+    out["cached_ratio"] = round(out["cached_tokens"] / out["prompt_tokens"], 4) if out["prompt_tokens"] else 0.0
+    return out
+
+
+# -------- Fast path: deterministic intents answered without the LLM --------
+_DONE_TOKENS = {t for ph in DONE_PHRASES for t in re.findall(r"\w+", ph)} | {
+    "gracias", "ok", "si", "ahora", "por", "ahi", "thanks", "thank", "you", "that", "is", "all", "it"}
+_SUBTOTAL_PAT = re.compile(
+    r"\b(subtotal|total|cuanto (va|es|seria|llevo|sale|cuesta)|how much)\b")
+_MENU_PAT = re.compile(
+    r"\b(menu|carta|que (tienen|hay|venden|ofrecen)|what do you (have|sell|offer))\b")
+# Subtotal / menu only answer the whole turn: "¿cuánto cuesta la hamburguesa?" or
+# "¿qué tienen sin gluten?" carry other content words and go to the LLM.
+_SUBTOTAL_WORDS = {
+    "subtotal", "total", "cuanto", "va", "es", "seria", "llevo", "sale", "cuesta", "el", "la", "mi", "pedido",
+    "orden", "cuenta", "hasta", "ahora", "de", "todo", "y", "me", "dime", "por", "favor", "how", "much", "is",
+    "it", "my", "order", "the", "so", "far", "what", "s", "whats", "bill", "tell", "please",
 }
-_EASY_INGREDIENTS = {
-    "cebolla", "salsa", "papas", "picante", "sal", "azucar", "azúcar", "hielo", "limon", "limón", "mayonesa", "ketchup"
+_MENU_WORDS = {
+    "menu", "carta", "que", "tienen", "hay", "venden", "ofrecen", "me", "pasas", "das", "muestras", "mostrar",
+    "puedes", "puedo", "ver", "el", "la", "tu", "su", "hoy", "de", "comer", "por", "favor", "what", "do", "you",
+    "have", "sell", "offer", "can", "i", "see", "show", "the", "your", "today", "please",
 }
+# Words allowed around an item for a turn to count as a plain "add item".
+_ADD_FILLER = {
+    "quiero", "quisiera", "dame", "deme", "me", "das", "da", "agrega", "agregar", "anade", "suma", "pon",
+    "y", "e", "tambien", "mas", "otra", "otro", "por", "favor", "porfa", "un", "una", "unos", "unas", "el", "la",
+    "los", "las", "de", "para", "mi", "i", "want", "would", "like", "add", "and", "also", "please", "the",
+    "some", "more", "another", "get", "can", "have", "with", "x",
+}
+_FAST_STATS = {"add_item": 0, "subtotal": 0, "done": 0, "menu": 0, "pending": 0, "faq": 0, "llm": 0}
 
 
-def _build_aliases(menu: List[Dict]) -> Dict[str, str]:
-    variants: Dict[str, str] = {}
+def _cart_total(cart: List[Dict]) -> float:
+    return round(sum(float(it.get("unit_price", 0.0)) * int(it.get("qty", 1)) for it in cart or []), 2)
 
-    def add_alias(alias: str, to_name: str):
-        if not alias:
-            return
-        a = alias.strip().lower()
-        if len(a) < 3:
-            return
-        variants[a] = to_name
-        if not a.endswith("s"):
-            variants[a+"s"] = to_name
-    for m in (menu or []):
-        nm = (m.get("name") or "").strip()
-        if not nm:
-            continue
-        low = nm.lower()
-        variants[low] = nm
-        if not low.endswith("s"):
-            variants[low+"s"] = nm
-        if low.endswith("a"):
-            variants[low[:-1]+"as"] = nm
-        if low.endswith("o"):
-            variants[low[:-1]+"os"] = nm
-        desc = (m.get("description") or "").strip().lower()
-        if desc:
-            first_tok = re.split(r"\W+", desc)[0] if desc else ""
-            add_alias(first_tok, nm)
-        notes = (m.get("special_notes") or "")
-        if notes:
-            for tok in re.split(r"[,\|/]+", notes):
-                add_alias(tok, nm)
-    return variants
-
-
-def _should_create_pending(user_text: str, menu: List[Dict]) -> bool:
+
+def _cart_text(cart: List[Dict]) -> str:
+    return ", ".join(f"{it['qty']}x {it['name']}" for it in cart)
+
+
+def _fast_path_reply(last_user: str, menu: List[Dict], cfg: dict, cart: List[Dict],
+                     cart_delta: Optional[Dict[str, int]] = None) -> Optional[tuple]:
     """
-    Create a pending ONLY when:
-      A) Explicit ask to check with restaurant (preguntar/consultar/cocina), OR
-      B) A complex customization: 'sin|con|extra|doble|triple' + ingredient NOT in EASY set, OR
-      C) Clear off-menu hint words (e.g., 'almíbar', 'durazno(s)', 'canela', etc.) AND those terms
-         do not map to any menu alias (i.e., it's not recognized from the menu).
+    ``(intent, reply)`` for turns that need no LLM, else ``None``. ``cart_delta`` is the
+    cart change this turn produced (its extraction event); without it no add is confirmed.
+    """
+    lang = cfg.get("language", "es")
+    es = lang == "es"
+    cur = cfg.get("currency", "USD")
+    norm = normalize_text(last_user)
+    subtotal = f"{cur} {_cart_total(cart):.2f}"
+
+    # Only short closings ("no gracias, eso es todo"); "ya no quiero cebolla" goes to the LLM.
+    if is_done_message(last_user) and all(t in _DONE_TOKENS for t in norm.tokens):
+        if not cart:
+            return "done", ("Aún no tienes productos en tu pedido. ¿Qué te gustaría ordenar?" if es
+                            else "Your order is still empty. What would you like to order?")
+        return "done", (f"Tu pedido: {_cart_text(cart)} — subtotal {subtotal}." if es
+                        else f"Your order: {_cart_text(cart)} — subtotal {subtotal}.")
+
+    if _SUBTOTAL_PAT.search(norm.folded) and all(t in _SUBTOTAL_WORDS for t in norm.tokens):
+        if not cart:
+            return "subtotal", ("Aún no tienes productos en tu pedido." if es
+                                else "Your order is still empty.")
+        return "subtotal", (f"Llevas: {_cart_text(cart)}. Subtotal: {subtotal}." if es
+                            else f"So far: {_cart_text(cart)}. Subtotal: {subtotal}.")
+
+    if _MENU_PAT.search(norm.folded) and all(t in _MENU_WORDS for t in norm.tokens):
+        lines = [f"- {m['name']} ({m.get('currency', cur)} {float(m.get('price', 0)):.2f})"
+                 for m in (menu or [])[:30] if m.get("name")]
+        more = len(menu or []) - len(lines)
+        text = ("Este es nuestro menú:\n" if es else "Here is our menu:\n") + "\n".join(lines)
+        if more > 0:
+            text += (f"\n… y {more} más." if es else f"\n… and {more} more.")
+        return "menu", text
+
+    grammar = qty_grammar(menu, lang)
+    hits = scan_quantities(list(norm.tokens), grammar)
+    if hits:
+        item_tokens = set()
+        for phrase in grammar["phrases"]:
+            item_tokens.update(phrase)
+        numbers = grammar["numbers"]
+        plain = all(t in item_tokens or t in _ADD_FILLER or t.isdigit() or t in numbers
+                    for t in norm.tokens)
+        # Solo si el carrito cambió exactamente en lo que dice el mensaje: "otra hamburguesa"
+        # o "mejor 3 empanadas" no suman así en el parser, y confirmarlos sería mentir.
+        said: Dict[str, int] = {}
+        for nm, qty in hits:
+            said[nm] = said.get(nm, 0) + (qty or 1)
+        if plain and cart_delta is not None and said == cart_delta:
+            added = [it for it in cart if it["name"] in said]
+            if added:
+                return "add_item", (f"Anotado: {_cart_text(added)}. Subtotal: {subtotal}." if es
+                                    else f"Added: {_cart_text(added)}. Subtotal: {subtotal}.")
+    return None
+
+
+def fast_path_stats() -> Dict[str, float]:
+    """Turns answered per intent and the share that skipped the LLM."""
+    with _STATS_LOCK:
+        out = dict(_FAST_STATS)
+    total = sum(out.values())
+    out["turns"] = total
+    out["coverage"] = round((total - out["llm"]) / total, 4) if total else 0.0
+    return out
+
+
+def _count_turn(intent: str) -> None:
+    with _STATS_LOCK:
+        _FAST_STATS[intent] += 1
+    _TURN_PATH.intent = intent
+
+
+def _local_reply(history: List[Dict], menu: List[Dict], cfg: dict, conversation_id: str, tenant_id: Optional[int],
+                 cart: Optional[List[Dict]] = None, event: Optional[Dict] = None) -> Optional[str]:
+    """
+    Replies that never reach the LLM: kitchen escalation, FAQ hits and fast-path intents.
+    ``event`` is the extraction event of the last user message, when the caller has it.
     """
-    text_low = (user_text or "").lower()
-    tokens = set(re.findall(r"[\wáéíóúñ]+", text_low))
-
-    # A) Explicit ask to check
-    if re.search(r"(?i)\b(preguntar|consultar|cocina)\b", text_low):
-        return True
-
-    aliases = _build_aliases(menu)
-
-    # B) Complex customization (non-easy ingredient after sin/con/extra/doble/triple)
-    mods = re.findall(
-        r"(?:\b(?:sin|con|extra|doble|triple)\s+)([\wáéíóúñ]+)", text_low)
-    for ing in mods:
-        if ing.strip().lower() not in _EASY_INGREDIENTS:
-            # If the text mentions at least one menu item or is clearly modifying something,
-            # treat as complex and escalate.
-            return True
-
-    # C) Off-menu hints (conservative list; expand as needed)
-    OFFMENU_HINTS = [
-        "almibar", "almíbar", "durazn", "melocoton", "melocotón", "canela",
-        "sirope", "almendra", "maracuy", "arándano", "arandano", "tamarindo"
-    ]
-    has_offmenu_word = any(h in text_low for h in OFFMENU_HINTS)
-
-    # Recognized menu tokens?
-    mentioned = []
-    for tok in tokens:
-        if tok in aliases:
-            mentioned.append(aliases[tok])
-        else:
-            cands = difflib.get_close_matches(
-                tok, list(aliases.keys()), n=1, cutoff=0.9)
-            if cands:
-                mentioned.append(aliases[cands[0]])
-    mentioned = list(dict.fromkeys(mentioned))
-
-    # Only consider off-menu pending if we saw an off-menu hint and nothing from the menu matched
-    if has_offmenu_word and not mentioned:
-        return True
-
-    # Otherwise, do NOT create a pending for generic messages like "hola, quiero ordenar"
-    return False
-
-
-def client_assistant_reply(history: List[Dict], menu: List[Dict], cfg: dict | None, conversation_id: str, tenant_id: Optional[int] = None) -> str:
-    cfg = cfg or get_config()
     lang = cfg.get("language", "es")
     last_user = next((m["content"] for m in reversed(
         history) if m.get("role") == "user"), "")
+    if event is not None and event.get("text") != last_user:
+        event = None
+    escalate = event["escalate"] if event is not None else bool(last_user) and should_create_pending(last_user, menu)
 
-    if last_user and _should_create_pending(last_user, menu):
+    if last_user and escalate:
         try:
             create_pending_question(
                 conversation_id=conversation_id, question=last_user, language=lang, ttl_seconds=60)
         except Exception:
             pass
+        _count_turn("pending")
         return ("Entendido, consulto con cocina. Dame ~1 minuto y te confirmo. 🙌"
                 if lang == "es" else
                 "Got it, checking with the kitchen. Give me ~1 minute and I’ll confirm. 🙌")
@@ -231,167 +281,149 @@ def client_assistant_reply(history: List[Dict], menu: List[Dict], cfg: dict | No
     if last_user:
         faq_ans = match_faq(last_user, language=lang, tenant_id=tenant_id)
         if faq_ans:
+            _count_turn("faq")
             return faq_ans
 
-    client = _get_client()
-    system = _system_prompt(cfg, menu, lang)
-    msgs = [{"role": "system", "content": system}] + history[-12:]
-    model = cfg.get("model", "gpt-4o-mini")
-    temp = float(cfg.get("temperature", 0.4))
-    resp = client.chat.completions.create(
-        model=model, temperature=temp, messages=msgs)
-    return (resp.choices[0].message.content or "").strip()
-
-
-# -------- parse_items_from_chat, ensure_all_required_present, extract_client_info (unchanged) --------
-def _numbers_in_text(text: str, lang: str) -> Dict[str, int]:
-    out = {}
-    tokens = re.findall(r"[\wáéíóúñ]+", text.lower())
-    m = NUMWORDS_ES if lang == "es" else NUMWORDS_EN
-    for tok in tokens:
-        if tok.isdigit():
-            out[tok] = int(tok)
-        elif tok in m:
-            out[tok] = m[tok]
-    return out
-
+    if last_user and cfg.get("fast_path", True):
+        if event is None:
+            # Sin evento del llamador: se re-parsea la conversación para saber qué cambió este turno.
+            state = update_conversation_state(new_conversation_state(), history, menu, cfg, lang=lang)
+            event = state["last_event"] if (state["last_event"] or {}).get("text") == last_user else None
+            if cart is None:
+                cart = state["items"]
+        if cart is None:
+            cart = parse_items_from_chat(history, menu, cfg, lang=lang)
+        fast = _fast_path_reply(last_user, menu, cfg, cart, event["cart_delta"] if event else None)
+        if fast:
+            _count_turn(fast[0])
+            return fast[1]
+    _count_turn("llm")
+    return None
+
+
+def _mentioned_items(window: List[Dict], menu: List[Dict], lang: str) -> List[str]:
+    grammar = qty_grammar(menu, lang)
+    names: List[str] = []
+    for m in window:
+        if m.get("role") == "user":
+            names.extend(nm for nm, _ in scan_quantities(
+                normalize_text(m.get("content", "")).tokens, grammar))
+    return list(dict.fromkeys(names))
+
+
+@timed("llm_prompt_build_seconds")
+def _completion_args(history: List[Dict], menu: List[Dict], cfg: dict, conversation_id: str) -> Dict:
+    lang = cfg.get("language", "es")
+    window, cut = select_window(history, cfg)
+    last_user = next((m.get("content", "") for m in reversed(
+        window) if m.get("role") == "user"), "")
+    stable_menu, relevant_menu = build_menu_context(
+        menu, last_user, _mentioned_items(window, menu, lang), cfg, lang)
+    msgs = [{"role": "system", "content": _static_prompt(stable_menu, lang)},
+            {"role": "system", "content": _session_prompt(cfg, relevant_menu, lang)}]
+    if cut:
+        # Older turns are replaced by a summary kept incrementally per conversation.
+        older = summary_state(conversation_id, new_conversation_state)
+        update_conversation_state(older, history[:cut], menu, cfg, lang=lang, emit_events=False)
+        msgs.append({"role": "system", "content": format_summary(older, lang)})
+    msgs += window
+    return {
+        "model": cfg.get("model", "gpt-4o-mini"),
+        "temperature": float(cfg.get("temperature", 0.4)),
+        "messages": msgs,
+    }
+
+
+def _admit(args: Dict, cfg: dict, conversation_id: str) -> str:
+    # Prompt tokens plus a fixed allowance for the completion.
+    est = sum(count_tokens(m.get("content", ""), args["model"]) for m in args["messages"])
+    est += int(cfg.get("llm_est_completion_tokens", 300))
+    return ratelimit.acquire(conversation_id, est, cfg)
+
+
+def client_assistant_reply(history: List[Dict], menu: List[Dict], cfg: dict | None, conversation_id: str, tenant_id: Optional[int] = None,
+                           cart: Optional[List[Dict]] = None, event: Optional[Dict] = None) -> str:
+    cfg = cfg or get_config()
+    t0 = time.perf_counter()
+    local = _local_reply(history, menu, cfg, conversation_id, tenant_id, cart, event)
+    if local is not None:
+        return _replied(t0, "local", local)
+
+    args = _completion_args(history, menu, cfg, conversation_id)
+    cache_key = llm_cache.make_key(args, menu_version(menu), cfg) if llm_cache.enabled(cfg) else None
+    if cache_key:
+        cached = llm_cache.get(cache_key, cfg)
+        if cached is not None:
+            return _replied(t0, "cache", cached)
+
+    decision = _admit(args, cfg, conversation_id)
+    if decision != "ok":
+        return _replied(t0, "degraded", ratelimit.degraded_reply(decision, cfg.get("language", "es")))
 
-def parse_items_from_chat(history: List[Dict], menu: List[Dict], cfg: dict, lang: str | None = None) -> List[Dict]:
-    text_low = "\n".join([m.get("content", "")
-                         for m in history if m.get("role") == "user"]).lower()
-    names = [m["name"] for m in (menu or []) if m.get("name")]
-    price_map = {m["name"]: float(m.get("price", 0.0)) for m in (menu or [])}
-    desc_map = {m["name"]: (m.get("description") or "") for m in (menu or [])}
-    note_map = {m["name"]: (m.get("special_notes") or "")
-                for m in (menu or [])}
+    try:
+        resp = routed_completion(get_client(cfg), args, cfg)
+    except LLMUnavailable:
+        return _replied(t0, "degraded", ratelimit.degraded_reply("timeout", cfg.get("language", "es")))
+    _record_usage(getattr(resp, "usage", None), getattr(resp, "model", None))
+    reply = (resp.choices[0].message.content or "").strip()
+    if cache_key:
+        llm_cache.put(cache_key, reply, cfg)
+    return _replied(t0, "llm", reply)
+
+
+def client_assistant_reply_stream(history: List[Dict], menu: List[Dict], cfg: dict | None, conversation_id: str, tenant_id: Optional[int] = None,
+                                  cart: Optional[List[Dict]] = None, event: Optional[Dict] = None) -> Iterator[str]:
+    """
+    Same decision flow as ``client_assistant_reply`` but yields text deltas as the
+    model produces them. Local replies (pending/FAQ) are yielded in one piece.
+    The caller concatenates the deltas and persists the full reply.
+    """
+    cfg = cfg or get_config()
+    t0 = time.perf_counter()
+    local = _local_reply(history, menu, cfg, conversation_id, tenant_id, cart, event)
+    if local is not None:
+        yield _replied(t0, "local", local)
+        return
+
+    args = _completion_args(history, menu, cfg, conversation_id)
+    cache_key = llm_cache.make_key(args, menu_version(menu), cfg) if llm_cache.enabled(cfg) else None
+    if cache_key:
+        cached = llm_cache.get(cache_key, cfg)
+        if cached is not None:
+            yield _replied(t0, "cache", cached)
+            return
 
-    variants = {}
+    decision = _admit(args, cfg, conversation_id)
+    if decision != "ok":
+        yield _replied(t0, "degraded", ratelimit.degraded_reply(decision, cfg.get("language", "es")))
+        return
 
-    def add_alias(alias: str, to_name: str):
-        if not alias:
-            return
-        a = alias.strip().lower()
-        if len(a) < 3:
-            return
-        variants[a] = to_name
-        if not a.endswith("s"):
-            variants[a+"s"] = to_name
-
-    for nm in names:
-        low = nm.lower()
-        variants[low] = nm
-        if not low.endswith("s"):
-            variants[low+"s"] = nm
-        if low.endswith("a"):
-            variants[low[:-1]+"as"] = nm
-        if low.endswith("o"):
-            variants[low[:-1]+"os"] = nm
-        desc = desc_map.get(nm, "")
-        if desc:
-            first_tok = re.split(r"\W+", desc.lower().strip()
-                                 )[0] if desc.strip() else ""
-            add_alias(first_tok, nm)
-        notes = note_map.get(nm, "")
-        if notes:
-            for tok in re.split(r"[,\|/]+", notes):
-                add_alias(tok, nm)
-
-    from collections import defaultdict
-    found = defaultdict(int)
-    tokens = re.findall(r"[\wáéíóúñ]+", text_low)
-    for tok in tokens:
-        if tok in variants:
-            found[variants[tok]] += 1
-
-    if not found:
-        for tok in set(tokens):
-            cands = _difflib2.get_close_matches(
-                tok, list(variants.keys()), n=1, cutoff=0.86)
-            if cands:
-                found[variants[cands[0]]] += 1
-
-    num_map = _numbers_in_text(text_low, (lang or cfg.get("language", "es")))
-
-    def qty_before(name_low: str) -> int:
-        pat = rf"(\b(\d+|{'|'.join(num_map.keys())
-                          })\s+{re.escape(name_low)}(es|s)?)"
-        m = re.search(pat, text_low)
-        if m:
-            val = m.group(2)
-            if val.isdigit():
-                return int(val)
-            return num_map.get(val, 1)
-        return 1
-
-    items = []
-    for nm, count in found.items():
-        q = max(qty_before(nm.lower()), count)
-        items.append(
-            {"name": nm, "qty": q, "unit_price": price_map.get(nm, 0.0)})
-    return items
-
-
-def ensure_all_required_present(info: Dict, lang: str) -> List[str]:
-    req = ["name", "phone", "delivery_type", "payment_method"]
-    if (info.get("delivery_type") or "").lower() == "delivery":
-        req.append("address")
-    else:
-        req.append("pickup_eta_min")
-    missing = [k for k in req if not str(info.get(k, "")).strip()]
-    if "pickup_eta_min" in missing and (info.get("delivery_type") or "").lower() == "pickup":
-        info["pickup_eta_min"] = 30
-        try:
-            missing.remove("pickup_eta_min")
-        except ValueError:
-            pass
-    return missing
-
-
-_NAME_PAT_ES = re.compile(
-    r"(?i)(?:me\s+llamo|soy|mi\s+nombre\s*(?:es|:))\s*([A-Za-zÁÉÍÓÚÜÑ][A-Za-zÁÉÍÓÚÜÑ\s]{1,})")
-_NAME_PAT_EN = re.compile(
-    r"(?i)(?:i\s*am|i'm|my\s+name\s*(?:is|:))\s*([A-Za-z][A-Za-z\s]{1,})")
-_PHONE_PAT_HINT = re.compile(r"(?<!\d)(\+?\d[\d\-\s]{6,}\d)(?!\d)")
-_PHONE_PAT_LABELED = re.compile(
-    r"(?i)(?:tel[eé]fono|phone|cel|cell|m[oó]vil|mobile)\s*(?:es|is|:)?\s*(\+?\d[\d\-\s]{6,}\d)")
-_ADDRESS_PAT_ES = re.compile(r"(?i)direcci[oó]n\s*(?:es|:)?\s*(.+)")
-_ADDRESS_PAT_EN = re.compile(r"(?i)address\s*(?:is|:)?\s*(.+)")
-_MIN_PAT = re.compile(r"(?i)(\d{1,3})\s*(?:min|minute|minutes|minutos)")
-_DELIVERY_ES = re.compile(r"(?i)(domicilio|delivery|enviar|entrega)")
-_PICKUP_ES = re.compile(r"(?i)(retir|recoger|pickup)")
-_DELIVERY_EN = re.compile(r"(?i)(delivery|deliver)")
-_PICKUP_EN = re.compile(r"(?i)(pickup|pick up)")
-
-
-def extract_client_info(history: List[Dict], lang: str) -> Dict:
-    text = " \n".join([m.get("content", "")
-                      for m in history if m.get("role") == "user"])
-    out = {"name": "", "phone": "", "delivery_type": "",
-           "address": "", "pickup_eta_min": "", "payment_method": ""}
-    m = (_NAME_PAT_ES.search(text) if lang ==
-         "es" else _NAME_PAT_EN.search(text))
-    if m:
-        out["name"] = m.group(1).strip()
-    m = _PHONE_PAT_LABELED.search(text) or _PHONE_PAT_HINT.search(text)
-    if m:
-        import re as _re
-        out["phone"] = _re.sub(r"\s+", "", m.group(1)).replace("-", "")
-    if (_DELIVERY_ES.search(text) if lang == "es" else _DELIVERY_EN.search(text)):
-        out["delivery_type"] = "delivery"
-    if (_PICKUP_ES.search(text) if lang == "es" else _PICKUP_EN.search(text)):
-        out["delivery_type"] = out["delivery_type"] or "pickup"
-    m = (_ADDRESS_PAT_ES.search(text) if lang ==
-         "es" else _ADDRESS_PAT_EN.search(text))
-    if m:
-        out["address"] = m.group(1).strip()
-    m = _MIN_PAT.search(text)
-    if m:
-        out["pickup_eta_min"] = m.group(1).strip()
-    import re as _re2
-    if _re2.search(r"(?i)(efectivo|cash)", text):
-        out["payment_method"] = "cash"
-    elif _re2.search(r"(?i)(tarjeta|card)", text):
-        out["payment_method"] = "card"
-    elif _re2.search(r"(?i)(online|transfer|transferencia|bank)", text):
-        out["payment_method"] = "online"
-    return out
+    stream = routed_stream(get_client(cfg), args, cfg)
+    try:
+        first = next(stream, None)
+    except LLMUnavailable:
+        yield _replied(t0, "degraded", ratelimit.degraded_reply("timeout", cfg.get("language", "es")))
+        return
+    parts: List[str] = []
+    try:
+        for chunk in itertools.chain([first] if first is not None else [], stream):
+            if getattr(chunk, "usage", None):
+                _record_usage(chunk.usage, getattr(chunk, "model", None))
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if not parts:
+                    observe("reply_ttft_seconds", time.perf_counter() - t0)
+                parts.append(delta)
+                yield delta
+    finally:
+        stream.close()
+        _replied(t0, "llm", "")
+    # Only complete streams are cached.
+    if cache_key:
+        llm_cache.put(cache_key, "".join(parts).strip(), cfg)
+
+
+register_collector("fast_path", fast_path_stats)
+register_collector("prompt_cache", prompt_cache_stats)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import os
+import threading
+from typing import Dict, Optional, TYPE_CHECKING
+import streamlit as st
+
+from .config import get_config
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+# Un cliente (y un pool httpx con keep-alive) por proceso y por configuración.
+# openai / httpx / dotenv se importan recién al primer uso: los turnos que resuelven
+# FAQ o fast path (y las páginas de staff) no los cargan nunca.
+_CLIENTS: Dict[tuple, "OpenAI"] = {}
+_LOCK = threading.Lock()
+_STUBS: Dict[int, object] = {}
+_DOTENV: Dict[str, object] = {}
+
+
+def _sdk():
+    try:
+        import httpx
+        from openai import OpenAI
+    except ImportError as e:
+        raise ImportError(
+            "Falta el paquete 'openai'. Agrega 'openai==1.51.2' a requirements.txt y redeploy.") from e
+    return httpx, OpenAI
+
+
+def _dotenv() -> Dict[str, str]:
+    # Como get_config: el .env se relee solo si cambió su mtime (un stat por llamada).
+    if "path" not in _DOTENV:
+        try:
+            from dotenv import find_dotenv
+            _DOTENV["path"] = find_dotenv() or None
+        except Exception:
+            _DOTENV["path"] = None
+    path = _DOTENV["path"]
+    if not path:
+        return {}
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    hit = _DOTENV.get("values")
+    if hit and hit[0] == mtime:
+        return hit[1]
+    try:
+        from dotenv import dotenv_values
+        values = {k: v for k, v in dotenv_values(path).items() if v is not None}
+    except Exception:
+        values = {}
+    _DOTENV["values"] = (mtime, values)
+    return values
+
+
+def _secret(name: str) -> Optional[str]:
+    try:
+        val = st.secrets.get(name)
+        if val:
+            return val
+    except Exception:
+        pass
+    return os.getenv(name) or _dotenv().get(name)
+
+
+def get_api_key() -> str:
+    key = _secret("OPENAI_API_KEY")
+    if not key:
+        raise RuntimeError("Falta OPENAI_API_KEY en .env / secrets")
+    return key
+
+
+def _ensure_stub(port: int) -> str:
+    """Offline mode: start the local stub in-process unless one already listens on ``port``."""
+    with _LOCK:
+        if port not in _STUBS:
+            from .llm_stub import start_stub_server
+            try:
+                _STUBS[port] = start_stub_server(port)
+            except OSError:
+                _STUBS[port] = None  # puerto ocupado: se asume un stub externo
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def get_client(cfg: dict | None = None) -> "OpenAI":
+    """
+    Process-wide OpenAI client. Reuses one httpx pool (keep-alive) per
+    (key, base URL, timeouts, retries); retries use the SDK's exponential backoff.
+    Proxy env vars are ignored via ``trust_env=False`` instead of being popped.
+    """
+    cfg = cfg or get_config()
+    base_url = (cfg.get("llm_base_url") or _secret("OPENAI_BASE_URL") or "").strip() or None
+    if cfg.get("llm_offline"):
+        base_url = _ensure_stub(int(cfg.get("llm_stub_port", 8800)))
+    key = get_api_key() if not base_url else (_secret("OPENAI_API_KEY") or "stub")
+    connect_s = float(cfg.get("llm_connect_timeout", 5.0))
+    read_s = float(cfg.get("llm_read_timeout", 60.0))
+    retries = int(cfg.get("llm_max_retries", 2))
+    pool = int(cfg.get("llm_pool_size", 20))
+    ck = (key, base_url, connect_s, read_s, retries, pool)
+    client = _CLIENTS.get(ck)
+    if client is not None:
+        return client
+    with _LOCK:
+        client = _CLIENTS.get(ck)
+        if client is None:
+            httpx, OpenAI = _sdk()
+            timeout = httpx.Timeout(read_s, connect=connect_s)
+            http_client = httpx.Client(
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=pool,
+                                    max_keepalive_connections=pool,
+                                    keepalive_expiry=60.0),
+                trust_env=False,
+            )
+            client = OpenAI(api_key=key, base_url=base_url, timeout=timeout,
+                            max_retries=retries, http_client=http_client)
+            _CLIENTS[ck] = client
+    return client
+
+
+def reset_clients() -> None:
+    with _LOCK:
+        for client in _CLIENTS.values():
+            try:
+                client.close()
+            except Exception:
+                pass
+        _CLIENTS.clear()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import List, Dict, Iterator, Optional, Tuple
+
+from .metrics import observe, inc, register_collector
+
+# Enrutado de modelos: primario + respaldos, presupuesto de latencia por turno y
+# petición "hedged" opcional. Las latencias por modelo se miden en cada intento.
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_LOCK = threading.Lock()
+_LATENCY: Dict[str, Dict] = {}
+_SAMPLES = 200
+_STATS = {"calls": 0, "hedged": 0, "hedge_wins": 0, "fallbacks": 0, "budget_exceeded": 0}
+
+
+class LLMUnavailable(RuntimeError):
+    """No model answered within the turn's latency budget."""
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-route")
+    return _EXECUTOR
+
+
+def fallback_models(cfg: dict) -> List[str]:
+    # config.json puede traerlos como lista o como "a, b" (editado a mano).
+    fallbacks = cfg.get("fallback_models") or []
+    if isinstance(fallbacks, str):
+        fallbacks = fallbacks.split(",")
+    return [str(m).strip() for m in fallbacks if str(m).strip()]
+
+
+def candidate_models(cfg: dict) -> List[str]:
+    out: List[str] = []
+    for m in [cfg.get("model", "gpt-4o-mini"), *fallback_models(cfg)]:
+        if m and m not in out:
+            out.append(m)
+    return out
+
+
+def _record(model: str, seconds: Optional[float], error: bool = False) -> None:
+    inc("llm_requests_total", model=model, outcome="error" if error else "ok")
+    if not error and seconds is not None:
+        # En streaming es el tiempo al primer chunk.
+        observe("llm_request_seconds", seconds, model=model)
+    with _LOCK:
+        s = _LATENCY.setdefault(model, {"ok": 0, "errors": 0, "ewma_s": None,
+                                        "samples": deque(maxlen=_SAMPLES)})
+        if error:
+            s["errors"] += 1
+            return
+        s["ok"] += 1
+        s["samples"].append(seconds)
+        s["ewma_s"] = seconds if s["ewma_s"] is None else 0.8 * s["ewma_s"] + 0.2 * seconds
+
+
+def _attempt(client, model: str, args: Dict, stream: bool, timeout: float):
+    t0 = time.monotonic()
+    kw = dict(args, model=model, timeout=timeout)
+    try:
+        if not stream:
+            resp = client.chat.completions.create(**kw)
+            _record(model, time.monotonic() - t0)
+            return resp
+        # En streaming la carrera se decide por el primer chunk (time to first token).
+        s = client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kw)
+        it = iter(s)
+        first = next(it, None)
+        _record(model, time.monotonic() - t0)
+        return s, it, first
+    except Exception:
+        _record(model, None, error=True)
+        raise
+
+
+def _close_loser(fut: Future) -> None:
+    try:
+        res = fut.result()
+    except Exception:
+        return
+    if isinstance(res, tuple):
+        res[0].close()
+
+
+def _race(client, args: Dict, cfg: dict, stream: bool):
+    models = candidate_models(cfg)
+    budget = float(cfg.get("llm_latency_budget_s", 30.0))
+    hedge_delay = float(cfg.get("llm_hedge_delay_s", 0.0))
+    start = time.monotonic()
+    deadline = start + budget
+    pending: Dict[Future, Tuple[str, bool]] = {}
+    next_idx = 0
+    hedged = False
+    last_error: Optional[BaseException] = None
+
+    def launch(is_hedge: bool = False) -> bool:
+        nonlocal next_idx
+        if next_idx < len(models):
+            model = models[next_idx]
+            next_idx += 1
+        elif is_hedge:
+            model = models[0]   # sin respaldos, el hedge repite el primario
+        else:
+            return False
+        remaining = max(0.1, deadline - time.monotonic())
+        pending[_executor().submit(_attempt, client, model, args, stream, remaining)] = (model, is_hedge)
+        return True
+
+    with _LOCK:
+        _STATS["calls"] += 1
+    launch()
+    try:
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            timeout = deadline - now
+            if hedge_delay > 0 and not hedged:
+                timeout = min(timeout, max(0.0, start + hedge_delay - now))
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done:
+                model, is_hedge = pending.pop(fut)
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    last_error = e
+                    if launch():
+                        with _LOCK:
+                            _STATS["fallbacks"] += 1
+                    continue
+                with _LOCK:
+                    if is_hedge:
+                        _STATS["hedge_wins"] += 1
+                return res, model
+            if not done and hedge_delay > 0 and not hedged and time.monotonic() >= start + hedge_delay:
+                hedged = True
+                if launch(is_hedge=True):
+                    with _LOCK:
+                        _STATS["hedged"] += 1
+        if last_error is not None and not pending:
+            raise LLMUnavailable(f"all models failed: {last_error}") from last_error
+        with _LOCK:
+            _STATS["budget_exceeded"] += 1
+        raise LLMUnavailable(f"no reply within {budget:.1f}s")
+    finally:
+        # Los perdedores no se pueden abortar a mitad de petición: se cierran al terminar.
+        for fut in pending:
+            fut.add_done_callback(_close_loser)
+
+
+def routed_completion(client, args: Dict, cfg: dict):
+    """``chat.completions.create`` over the configured models; returns the first response."""
+    resp, _ = _race(client, args, cfg, stream=False)
+    return resp
+
+
+def routed_stream(client, args: Dict, cfg: dict) -> Iterator:
+    """Streaming variant: the first model to emit a chunk wins and its stream is relayed."""
+    (stream, it, first), _ = _race(client, args, cfg, stream=True)
+    try:
+        if first is not None:
+            yield first
+        for chunk in it:
+            yield chunk
+    finally:
+        stream.close()
+
+
+def latency_stats() -> Dict[str, Dict]:
+    out: Dict[str, Dict] = {}
+    with _LOCK:
+        snap = {m: (s["ok"], s["errors"], s["ewma_s"], sorted(s["samples"])) for m, s in _LATENCY.items()}
+        out["_router"] = dict(_STATS)
+    for model, (ok, errors, ewma, samples) in snap.items():
+        def pct(p: float) -> Optional[float]:
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 4) if samples else None
+        out[model] = {"ok": ok, "errors": errors, "ewma_s": round(ewma, 4) if ewma is not None else None,
+                      "p50_s": pct(0.50), "p95_s": pct(0.95)}
+    return out
+
+
+register_collector("llm_router", latency_stats)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor local compatible con /v1/chat/completions para pruebas sin red.
+
+    python -m backend.llm_stub --port 8800 --latency gpt-4o-mini=lognormal:-1.2,0.5 \
+        --latency gpt-4o=fixed:0.2 --error-rate 0.02 --chunk-delay 0.01
+
+Latencias: ``fixed:S``, ``uniform:A,B``, ``normal:MU,SD``, ``lognormal:MU,SIGMA``,
+``exp:MEAN`` o un número (segundos fijos). Con ``llm_offline: true`` en la config,
+el cliente apunta a este servidor.
+"""
+from __future__ import annotations
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+LatencySpec = Union[float, str]
+
+# Líneas de menú tal como las arma backend/menu_context.py: "- Nombre (USD 9.50)" o el índice "Nombre (9.50); ...".
+_MENU_LINE = re.compile(r"^- (.+?) \((?:[A-Z]{3} )?[\d.]+\)", re.M)
+_MENU_INDEX = re.compile(r"(?:^|; )([^;\n()]+?) \([\d.]+\)")
+
+
+def parse_latency(spec: LatencySpec) -> Callable[[random.Random], float]:
+    """Sampler for a latency spec (seconds); see the module docstring."""
+    if isinstance(spec, (int, float)):
+        return lambda rng, s=float(spec): s
+    kind, _, params = str(spec).partition(":")
+    if not params:
+        return lambda rng, s=float(kind): s
+    p = [float(x) for x in params.split(",")]
+    samplers = {
+        "fixed": lambda rng: p[0],
+        "uniform": lambda rng: rng.uniform(p[0], p[1]),
+        "normal": lambda rng: rng.gauss(p[0], p[1]),
+        "lognormal": lambda rng: rng.lognormvariate(p[0], p[1]),
+        "exp": lambda rng: rng.expovariate(1.0 / p[0]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"latencia desconocida: {spec}")
+    sampler = samplers[kind]
+    return lambda rng: max(0.0, sampler(rng))
+
+
+def _menu_names(messages: List[Dict]) -> List[str]:
+    names: List[str] = []
+    for m in messages:
+        if m.get("role") != "system":
+            continue
+        text = m.get("content", "")
+        names.extend(_MENU_LINE.findall(text) or _MENU_INDEX.findall(text))
+    return list(dict.fromkeys(n.strip() for n in names if n.strip()))
+
+
+def menu_reply(body: Dict, rng: random.Random) -> str:
+    """Canned reply that echoes menu items mentioned by the user, or suggests one."""
+    messages = body.get("messages") or []
+    last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    names = _menu_names(messages)
+    low = last_user.lower()
+    hits = [n for n in names if n.lower() in low]
+    if hits:
+        return f"Perfecto, anoto {', '.join(hits)}. ¿Deseas agregar algo más?"
+    if names:
+        return f"Te recomiendo {rng.choice(names)}. ¿Te lo agrego al pedido?"
+    return f"(stub) Recibido: {last_user[:80]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "llm-stub/1.0"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _json(self, code: int, payload: Dict) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._json(404, {"error": {"message": "not found"}})
+            return
+        srv = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        model = body.get("model", "stub")
+        with srv.lock:
+            delay = srv.latency.get(model, srv.default_latency)(srv.rng)
+            fail = srv.error_rate > 0 and srv.rng.random() < srv.error_rate
+            code = srv.rng.choice(srv.error_codes) if fail else 200
+            text = srv.reply_fn(body, srv.rng)
+            srv.stats["requests"] += 1
+            srv.stats["errors"] += int(fail)
+        time.sleep(delay)
+        if fail:
+            self._json(code, {"error": {"message": f"injected error {code}", "type": "stub_error"}})
+            return
+        created = int(time.time())
+        usage = {"prompt_tokens": sum(len(m.get("content", "")) // 4 for m in body.get("messages") or []),
+                 "completion_tokens": len(text) // 4,
+                 "prompt_tokens_details": {"cached_tokens": 0}}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if not body.get("stream"):
+            self._json(200, {
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": usage,
+            })
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created, "model": model}
+        for word in text.split(" "):
+            chunk = dict(base, choices=[{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}])
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if srv.chunk_delay:
+                time.sleep(srv.chunk_delay)
+        chunk = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self.wfile.write(f"data: {json.dumps(dict(base, choices=[], usage=usage))}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clientes que cortan (timeouts, hedges perdedores) no son errores del stub.
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def start_stub_server(port: int = 8800, latency: Optional[Dict[str, LatencySpec]] = None,
+                      default_latency: LatencySpec = 0.0, host: str = "127.0.0.1",
+                      error_rate: float = 0.0, error_codes: Sequence[int] = (500,),
+                      chunk_delay: float = 0.0, seed: Optional[int] = None) -> ThreadingHTTPServer:
+    """Start the stub in a daemon thread; call ``.shutdown()`` to stop it. ``.stats`` counts requests."""
+    srv = _Server((host, port), _Handler)
+    srv.latency = {k: parse_latency(v) for k, v in (latency or {}).items()}
+    srv.default_latency = parse_latency(default_latency)
+    srv.error_rate = float(error_rate)
+    srv.error_codes = list(error_codes) or [500]
+    srv.chunk_delay = float(chunk_delay)
+    srv.rng = random.Random(seed)
+    srv.lock = threading.Lock()
+    srv.stats = {"requests": 0, "errors": 0}
+    srv.reply_fn = menu_reply
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8800)
+    ap.add_argument("--latency", action="append", default=[], help="model=spec (e.g. gpt-4o-mini=uniform:0.2,0.8)")
+    ap.add_argument("--default-latency", default="0")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--error-codes", default="500,429")
+    ap.add_argument("--chunk-delay", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+    lat = dict(x.split("=", 1) for x in args.latency)
+    srv = start_stub_server(args.port, lat, args.default_latency, args.host, args.error_rate,
+                            [int(c) for c in args.error_codes.split(",") if c.strip()],
+                            args.chunk_delay, args.seed)
+    print(f"LLM stub en http://{args.host}:{args.port}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import time
+import asyncio
+import threading
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import List, Dict, Optional
+
+from .config import get_config
+from .llm_chat import client_assistant_reply, client_assistant_reply_stream
+from .metrics import observe, register_collector
+
+# Pool global (por proceso) para las llamadas al LLM: la página solo encola y
+# consulta el estado desde un fragmento, sin bloquear el hilo del script.
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_LOCK = threading.Lock()
+_JOBS: Dict[str, "LLMJob"] = {}
+_STATS = {"submitted": 0, "started": 0, "dropped": 0, "finished": 0, "failed": 0, "cancelled": 0}
+
+
+class LLMJob:
+    """Handle for one queued reply. ``text`` grows while the model streams."""
+
+    def __init__(self, conversation_id: str):
+        self.id = uuid4().hex
+        self.conversation_id = conversation_id
+        self.text = ""
+        self.error: Optional[BaseException] = None
+        self.cancelled = threading.Event()
+        self.future: Optional[Future] = None
+        self.created = time.perf_counter()
+
+    @property
+    def status(self) -> str:
+        if self.cancelled.is_set():
+            return "cancelled"
+        if self.future is None or not self.future.done():
+            return "running" if self.future is not None and self.future.running() else "queued"
+        return "failed" if self.error else "done"
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def result(self, timeout: Optional[float] = None) -> str:
+        self.future.result(timeout=timeout)
+        if self.error:
+            raise self.error
+        return self.text.strip()
+
+    async def wait(self) -> str:
+        await asyncio.wrap_future(self.future)
+        return self.result()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _LOCK:
+            if _EXECUTOR is None:
+                workers = int(get_config().get("llm_max_concurrency", 8))
+                _EXECUTOR = ThreadPoolExecutor(max_workers=max(1, workers),
+                                               thread_name_prefix="llm")
+    return _EXECUTOR
+
+
+def _run(job: LLMJob, history: List[Dict], menu: List[Dict], cfg: dict,
+         tenant_id: Optional[int], cart: Optional[List[Dict]], event: Optional[Dict]) -> None:
+    with _LOCK:
+        _STATS["started"] += 1
+    started = time.perf_counter()
+    observe("llm_queue_wait_seconds", started - job.created)
+    try:
+        if not cfg.get("llm_stream", True):
+            job.text = client_assistant_reply(history, menu, cfg, conversation_id=job.conversation_id,
+                                              tenant_id=tenant_id, cart=cart, event=event)
+        else:
+            gen = client_assistant_reply_stream(history, menu, cfg, conversation_id=job.conversation_id,
+                                                tenant_id=tenant_id, cart=cart, event=event)
+            try:
+                for delta in gen:
+                    if job.cancelled.is_set():
+                        break
+                    job.text += delta
+            finally:
+                gen.close()
+    except BaseException as e:
+        job.error = e
+    finally:
+        observe("llm_job_seconds", time.perf_counter() - started,
+                outcome="cancelled" if job.cancelled.is_set() else "failed" if job.error else "done")
+        with _LOCK:
+            if job.cancelled.is_set():
+                _STATS["cancelled"] += 1
+            elif job.error:
+                _STATS["failed"] += 1
+            else:
+                _STATS["finished"] += 1
+            _JOBS.pop(job.id, None)
+
+
+def submit_reply(conversation_id: str, history: List[Dict], menu: List[Dict], cfg: dict | None = None,
+                 tenant_id: Optional[int] = None, cart: Optional[List[Dict]] = None,
+                 event: Optional[Dict] = None) -> LLMJob:
+    """Queue ``client_assistant_reply_stream`` on the shared pool and return its handle."""
+    cfg = cfg or get_config()
+    job = LLMJob(conversation_id)
+    with _LOCK:
+        _JOBS[job.id] = job
+        _STATS["submitted"] += 1
+    job.future = _executor().submit(_run, job, history[:], menu, cfg, tenant_id,
+                                    list(cart) if cart is not None else None, event)
+    job.future.add_done_callback(lambda fut, job=job: _on_done(job, fut))
+    return job
+
+
+def _on_done(job: LLMJob, fut: Future) -> None:
+    # Cancelled while still queued: _run never executed.
+    if fut.cancelled():
+        with _LOCK:
+            _STATS["dropped"] += 1
+            _STATS["cancelled"] += 1
+            _JOBS.pop(job.id, None)
+
+
+def cancel_conversation(conversation_id: str) -> int:
+    """Cancel every queued or running job of a conversation (e.g. on "Nuevo chat")."""
+    with _LOCK:
+        jobs = [j for j in _JOBS.values() if j.conversation_id == conversation_id]
+    for j in jobs:
+        j.cancel()
+    return len(jobs)
+
+
+def queue_depth() -> int:
+    with _LOCK:
+        return _STATS["submitted"] - _STATS["started"] - _STATS["dropped"]
+
+
+def stats() -> Dict[str, int]:
+    with _LOCK:
+        out = dict(_STATS)
+        out["in_flight"] = len(_JOBS)
+    out["queue_depth"] = out["submitted"] - out["started"] - out["dropped"]
+    return out
+
+
+register_collector("llm_worker", stats)
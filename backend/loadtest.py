@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Harness de carga offline: conversaciones simuladas contra el stub local (sin red ni costo).
+
+    python -m backend.loadtest --conversations 50 --turns 6 --concurrency 8 \
+        --latency lognormal:-1.2,0.5 --error-rate 0.02
+
+Reporta p50/p95/p99 por camino real del turno (fast path, FAQ, pendiente, caché, modelo)
+y throughput (turnos/s). Corre contra una base temporal: las pendientes y el uso que
+generan las conversaciones simuladas no tocan la base de la app.
+"""
+from __future__ import annotations
+import os
+import json
+import time
+import tempfile
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+
+from .config import get_config
+from .llm_stub import start_stub_server
+from .extraction import new_conversation_state, update_conversation_state
+from .llm_chat import (
+    client_assistant_reply, client_assistant_reply_stream, fast_path_stats, prompt_cache_stats, last_turn_path,
+)
+from .llm_router import latency_stats
+from . import ratelimit
+
+# Plantillas de turnos: preguntas abiertas (van al modelo), altas al carrito y el subtotal
+# (fast path). El tipo de cada turno en el reporte es el camino que tomó de verdad.
+_TURNS = [
+    "hola, ¿qué me recomiendas hoy?",
+    "quiero {n} {item}",
+    "¿el {item} es bueno para compartir?",
+    "¿cuánto va?",
+    "¿cuál es el plato más popular?",
+    "agrega {n} {item}",
+]
+
+
+def synthetic_menu(n: int) -> List[Dict]:
+    bases = ["Hamburguesa", "Pizza", "Ensalada", "Taco", "Burrito", "Pasta", "Sopa", "Sandwich", "Limonada", "Brownie"]
+    styles = ["Clásica", "Especial", "BBQ", "Vegana", "Picante", "de la Casa", "Mediterránea", "Suprema"]
+    menu = []
+    for i in range(n):
+        name = f"{bases[i % len(bases)]} {styles[(i // len(bases)) % len(styles)]}"
+        if i >= len(bases) * len(styles):
+            name += f" {i}"
+        menu.append({"name": name, "description": f"Receta {i} con ingredientes frescos.",
+                     "price": round(4 + (i % 17) * 0.75, 2), "currency": "USD", "special_notes": ""})
+    return menu
+
+
+def _percentile(samples: List[float], p: float) -> Optional[float]:
+    if not samples:
+        return None
+    s = sorted(samples)
+    return round(s[min(len(s) - 1, int(p / 100.0 * len(s)))], 4)
+
+
+def _run_conversation(idx: int, menu: List[Dict], cfg: dict, turns: int, stream: bool, seed: int) -> List[Dict]:
+    rng = random.Random(seed + idx)
+    cid = f"load-{idx}"
+    conv: List[Dict] = []
+    state = new_conversation_state()
+    out = []
+    for t in range(turns):
+        tpl = _TURNS[t] if t < len(_TURNS) else rng.choice(_TURNS)
+        text = tpl.format(n=rng.randint(1, 3), item=rng.choice(menu)["name"])
+        conv.append({"role": "user", "content": text})
+        update_conversation_state(state, conv, menu, cfg)
+        rec = {"kind": "error", "ok": True, "ttft_s": None}
+        t0 = time.perf_counter()
+        try:
+            if stream:
+                parts = []
+                for delta in client_assistant_reply_stream(conv, menu, cfg, conversation_id=cid,
+                                                           cart=state["items"], event=state["last_event"]):
+                    if rec["ttft_s"] is None:
+                        rec["ttft_s"] = time.perf_counter() - t0
+                    parts.append(delta)
+                reply = "".join(parts).strip()
+            else:
+                reply = client_assistant_reply(conv, menu, cfg, conversation_id=cid,
+                                               cart=state["items"], event=state["last_event"])
+        except Exception as e:
+            rec["ok"] = False
+            rec["error"] = type(e).__name__
+            reply = ""
+        rec["latency_s"] = time.perf_counter() - t0
+        if rec["ok"]:
+            rec["kind"] = last_turn_path() or "llm"
+        rec["degraded"] = reply in (ratelimit.degraded_reply("timeout", cfg.get("language", "es")),
+                                    ratelimit.degraded_reply("conversation", cfg.get("language", "es")))
+        conv.append({"role": "assistant", "content": reply})
+        out.append(rec)
+    return out
+
+
+def run_load(conversations: int = 20, turns: int = 6, concurrency: int = 8, menu: Optional[List[Dict]] = None,
+             cfg: Optional[dict] = None, stream: bool = False, seed: int = 7) -> Dict:
+    """
+    Drive ``conversations`` simulated chats through the reply path and summarize latencies
+    per path taken. Uses whatever database ``DATA_DIR`` points at; ``main`` points it at a
+    temporary one.
+    """
+    cfg = cfg or get_config()
+    menu = menu or synthetic_menu(40)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        futs = [ex.submit(_run_conversation, i, menu, cfg, turns, stream, seed) for i in range(conversations)]
+        records = [r for f in futs for r in f.result()]
+    wall = time.perf_counter() - start
+
+    report: Dict = {"conversations": conversations, "turns": len(records), "concurrency": concurrency,
+                    "wall_s": round(wall, 3), "throughput_tps": round(len(records) / wall, 2) if wall else None,
+                    "errors": sum(1 for r in records if not r["ok"]),
+                    "degraded": sum(1 for r in records if r["degraded"]), "by_kind": {}}
+    groups: Dict[str, List[Dict]] = {"all": records}
+    for r in records:
+        groups.setdefault(r["kind"], []).append(r)
+    for kind, recs in groups.items():
+        lat = [r["latency_s"] for r in recs if r["ok"]]
+        row = {"n": len(recs), "p50_s": _percentile(lat, 50), "p95_s": _percentile(lat, 95),
+               "p99_s": _percentile(lat, 99)}
+        ttft = [r["ttft_s"] for r in recs if r["ttft_s"] is not None]
+        if ttft:
+            row["ttft_p50_s"] = _percentile(ttft, 50)
+            row["ttft_p95_s"] = _percentile(ttft, 95)
+        report["by_kind"][kind] = row
+    report["fast_path"] = fast_path_stats()
+    report["prompt_cache"] = prompt_cache_stats()
+    report["models"] = latency_stats()
+    return report
+
+
+def _print_report(rep: Dict) -> None:
+    print(f"{rep['conversations']} conversaciones, {rep['turns']} turnos, concurrencia {rep['concurrency']}")
+    print(f"tiempo {rep['wall_s']} s — throughput {rep['throughput_tps']} turnos/s — "
+          f"errores {rep['errors']} — degradadas {rep['degraded']}")
+    print(f"{'tipo':<10}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for kind, row in rep["by_kind"].items():
+        fmt = lambda v: f"{v:.3f}" if v is not None else "-"
+        print(f"{kind:<10}{row['n']:>6}{fmt(row['p50_s']):>10}{fmt(row['p95_s']):>10}{fmt(row['p99_s']):>10}")
+    print(f"fast path: cobertura {rep['fast_path'].get('coverage')}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline load test for the chat reply path")
+    ap.add_argument("--conversations", type=int, default=20)
+    ap.add_argument("--turns", type=int, default=6)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--menu-size", type=int, default=40)
+    ap.add_argument("--db-menu", action="store_true", help="usar el menú de la base en vez del sintético")
+    ap.add_argument("--port", type=int, default=8801)
+    ap.add_argument("--latency", default="lognormal:-1.2,0.5", help="spec de latencia del stub")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--chunk-delay", type=float, default=0.0)
+    ap.add_argument("--stream", action="store_true")
+    ap.add_argument("--cache", action="store_true", help="habilitar la caché de respuestas")
+    ap.add_argument("--rate-limit", action="store_true", help="habilitar la admisión / rate limiting")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    srv = start_stub_server(args.port, default_latency=args.latency, error_rate=args.error_rate,
+                            chunk_delay=args.chunk_delay, seed=args.seed)
+    cfg = dict(get_config())
+    cfg.update({"llm_offline": True, "llm_stub_port": args.port, "llm_base_url": "",
+                "llm_cache_enabled": args.cache, "llm_rate_limit": args.rate_limit})
+    from .db import fetch_menu, init_db
+    menu = fetch_menu() if args.db_menu else synthetic_menu(args.menu_size)
+    # Desde acá todo (pendientes, caché, rate limiting) escribe en una base descartable.
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="loadtest-")
+    init_db(seed=False)
+    try:
+        rep = run_load(args.conversations, args.turns, args.concurrency, menu, cfg, args.stream, args.seed)
+    finally:
+        srv.shutdown()
+    rep["stub"] = dict(srv.stats)
+    if args.json:
+        print(json.dumps(rep, ensure_ascii=False, indent=2))
+    else:
+        _print_report(rep)
+
+
+if __name__ == "__main__":
+    main()
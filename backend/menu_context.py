@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+import hashlib
+from typing import List, Dict, Iterable, Tuple
+
+from .textnorm import normalize_text
+from .tokens import count_tokens
+
+# Palabras que no aportan relevancia léxica.
+_STOPWORDS = {
+    "que", "con", "sin", "los", "las", "una", "uno", "por", "para", "del", "quiero", "tienen",
+    "hay", "algo", "mas", "the", "and", "with", "have", "want", "some", "you", "what",
+}
+_ITEM_TOKENS_CACHE: Dict[str, List[set]] = {}
+
+
+def format_price(p) -> str:
+    try:
+        return f"{float(p):.2f}"
+    except Exception:
+        return str(p)
+
+
+def format_item(it: Dict) -> str:
+    name = (it.get("name", "") or "").strip()
+    desc = (it.get("description") or "").strip()
+    price = format_price(it.get("price", 0))
+    cur = it.get("currency", "USD")
+    notes = (it.get("special_notes") or "").strip()
+    notes_txt = f" — [{notes}]" if notes else ""
+    line = f"- {name} ({cur} {price}){notes_txt}"
+    if desc:
+        line += f"\n  {desc}"
+    return line
+
+
+def format_menu(menu: List[Dict]) -> str:
+    return "\n".join(format_item(it) for it in (menu or []) if (it.get("name") or "").strip())
+
+
+def _item_tokens(menu: List[Dict]) -> List[set]:
+    raw = json.dumps([(m.get("name"), m.get("description"), m.get("special_notes")) for m in menu],
+                     ensure_ascii=False, default=str)
+    ver = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    toks = _ITEM_TOKENS_CACHE.get(ver)
+    if toks is None:
+        toks = [
+            {t for t in normalize_text(" ".join([m.get("name") or "", m.get("description") or "",
+                                                 m.get("special_notes") or ""])).tokens if len(t) >= 3}
+            for m in menu
+        ]
+        if len(_ITEM_TOKENS_CACHE) > 16:
+            _ITEM_TOKENS_CACHE.clear()
+        _ITEM_TOKENS_CACHE[ver] = toks
+    return toks
+
+
+_INDEX_CACHE: Dict[tuple, str] = {}
+
+
+def _menu_index(menu: List[Dict], budget: int, model: str, lang: str) -> str:
+    """Compact name/price index of the whole menu; deterministic so it can sit in a cached prefix."""
+    raw = json.dumps([(m.get("name"), m.get("price")) for m in menu], ensure_ascii=False, default=str)
+    key = (hashlib.sha1(raw.encode("utf-8")).hexdigest(), budget, model, lang)
+    out = _INDEX_CACHE.get(key)
+    if out is not None:
+        return out
+    parts: List[str] = []
+    used = 0
+    for m in menu:
+        part = f"{m['name']} ({format_price(m.get('price', 0))})"
+        cost = count_tokens(part, model) + 1
+        if used + cost > budget:
+            break
+        parts.append(part)
+        used += cost
+    out = "; ".join(parts)
+    omitted = len(menu) - len(parts)
+    if omitted:
+        out += (f"\n(+{omitted} ítems más; pide al cliente que los nombre)" if lang == "es"
+                else f"\n(+{omitted} more items; ask the customer to name them)")
+    if len(_INDEX_CACHE) > 16:
+        _INDEX_CACHE.clear()
+    _INDEX_CACHE[key] = out
+    return out
+
+
+def build_menu_context(menu: List[Dict], last_user: str, mentioned: Iterable[str], cfg: dict, lang: str) -> Tuple[str, str]:
+    """
+    Menu text for the prompt within ``menu_context_tokens``, as ``(stable, relevant)``.
+    Small menus go in full into ``stable`` and ``relevant`` is empty. Larger ones get a
+    compact name/price index of the whole menu as ``stable`` (the schema has no
+    categories) and, as ``relevant``, full lines for the items already mentioned in
+    the conversation and the best lexical matches for ``last_user``. ``stable`` only
+    depends on the menu, so it can live in a cached prompt prefix.
+    """
+    menu = [m for m in (menu or []) if (m.get("name") or "").strip()]
+    budget = int(cfg.get("menu_context_tokens", 1500))
+    model = cfg.get("model", "gpt-4o-mini")
+    full = format_menu(menu)
+    if count_tokens(full, model) <= budget:
+        return full, ""
+
+    detail_budget = budget // 3
+    stable = _menu_index(menu, budget - detail_budget, model, lang)
+
+    mentioned = set(mentioned or [])
+    query = {t for t in normalize_text(last_user).tokens if len(t) >= 3 and t not in _STOPWORDS}
+    scored = []
+    for idx, (m, toks) in enumerate(zip(menu, _item_tokens(menu))):
+        score = len(query & toks)
+        if m["name"] in mentioned:
+            score += 100
+        if score:
+            scored.append((-score, idx))
+    scored.sort()
+
+    lines: List[str] = []
+    used = 0
+    for _, idx in scored:
+        line = format_item(menu[idx])
+        cost = count_tokens(line, model)
+        if used + cost > detail_budget:
+            break
+        lines.append(line)
+        used += cost
+    return stable, "\n".join(lines)
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas en proceso: histogramas de latencia y contadores, con exportación en texto
+Prometheus y un snapshot JSON.
+
+    with timed("parse_seconds", stage="update"): ...
+    @timed("faq_match_seconds")
+    inc("llm_tokens_total", 120, kind="prompt")
+
+Los módulos con estadísticas propias (fast path, caché, rate limit, ...) se registran
+con ``register_collector`` y salen como gauges ``app_<nombre>_<campo>``.
+
+Cada proceso expone lo suyo: con ``metrics_port`` > 0 ``bootstrap()`` levanta
+``/metrics`` (texto) y ``/metrics.json`` en ese puerto; la API y la pantalla de cocina
+los sirven en su propio puerto.
+"""
+from __future__ import annotations
+import re
+import json
+import time
+import bisect
+import functools
+import threading
+from contextlib import ContextDecorator
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Límites superiores de los buckets (segundos): de 1 ms a 30 s.
+BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_LOCK = threading.Lock()
+_HISTS: Dict[str, Dict[tuple, "_Histogram"]] = {}
+_COUNTERS: Dict[str, Dict[tuple, float]] = {}
+_COLLECTORS: Dict[str, Callable[[], Dict]] = {}
+_STARTED = time.time()
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        # Interpolación lineal dentro del bucket (como histogram_quantile de Prometheus).
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                lo = BUCKETS[i - 1] if i else 0.0
+                hi = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return round(lo + (hi - lo) * (rank - seen) / c, 6)
+            seen += c
+        return BUCKETS[-1]
+
+
+def _key(labels: Dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    key = _key(labels)
+    with _LOCK:
+        h = _HISTS.setdefault(name, {}).get(key)
+        if h is None:
+            h = _HISTS[name][key] = _Histogram()
+        h.observe(seconds)
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    key = _key(labels)
+    with _LOCK:
+        series = _COUNTERS.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+
+class timed(ContextDecorator):
+    """Context manager / decorator: observes the elapsed time into ``name``; errors also count in ``<name>_errors_total``."""
+
+    def __init__(self, name: str, **labels):
+        self.name = name
+        self.labels = labels
+        self._t0 = 0.0
+
+    def _recreate_cm(self):
+        # Como decorador, cada llamada usa su propia instancia (hilos / recursión).
+        return timed(self.name, **self.labels)
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self._t0, **self.labels)
+        # st.rerun / st.stop se implementan con excepciones: no son errores.
+        if exc_type is not None and not _is_control_flow(exc_type):
+            inc(self.name.removesuffix("_seconds") + "_errors_total", **self.labels)
+        return False
+
+
+def _is_control_flow(exc_type) -> bool:
+    return exc_type.__name__ in ("RerunException", "StopException", "GeneratorExit")
+
+
+def instrument_module(namespace: Dict, metric: str, label: str = "fn") -> int:
+    """Wrap every public function defined in ``namespace`` (a module's ``globals()``) with ``timed``."""
+    module = namespace.get("__name__")
+    n = 0
+    for name, fn in list(namespace.items()):
+        if name.startswith("_") or not callable(fn) or getattr(fn, "__module__", None) != module:
+            continue
+        if isinstance(fn, type) or getattr(fn, "__wrapped__", None) is not None:
+            continue
+        namespace[name] = functools.wraps(fn)(timed(metric, **{label: name})(fn))
+        n += 1
+    return n
+
+
+class page_run:
+    """Streamlit script timer: create at the top, ``done()`` at the end (runs cut short by st.stop/st.rerun only count)."""
+
+    def __init__(self, page: str):
+        self.page = page
+        self.t0 = time.perf_counter()
+        inc("page_runs_total", page=page)
+
+    def done(self) -> None:
+        observe("page_run_seconds", time.perf_counter() - self.t0, page=self.page)
+
+
+def register_collector(name: str, fn: Callable[[], Dict]) -> None:
+    with _LOCK:
+        _COLLECTORS[name] = fn
+
+
+def _collect() -> Dict[str, Dict]:
+    with _LOCK:
+        collectors = dict(_COLLECTORS)
+    out = {}
+    for name, fn in collectors.items():
+        try:
+            out[name] = fn()
+        except Exception as e:
+            out[name] = {"error": f"{type(e).__name__}: {e}"}
+    return out
+
+
+def snapshot() -> Dict:
+    """JSON-friendly view: histograms with count/sum/mean/p50/p95/p99, counters and collector stats."""
+    with _LOCK:
+        hists = {name: [(dict(k), h.count, h.sum, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99))
+                        for k, h in series.items()] for name, series in _HISTS.items()}
+        counters = {name: [(dict(k), v) for k, v in series.items()] for name, series in _COUNTERS.items()}
+    return {
+        "uptime_s": round(time.time() - _STARTED, 1),
+        "histograms": {name: [{"labels": lb, "count": n, "sum_s": round(s, 6),
+                               "mean_s": round(s / n, 6) if n else None,
+                               "p50_s": p50, "p95_s": p95, "p99_s": p99}
+                              for lb, n, s, p50, p95, p99 in rows] for name, rows in hists.items()},
+        "counters": {name: [{"labels": lb, "value": v} for lb, v in rows] for name, rows in counters.items()},
+        "collectors": _collect(),
+    }
+
+
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _metric_name(name: str) -> str:
+    return _NAME_RE.sub("_", name)
+
+
+def _labels(pairs, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(pairs) + ([extra] if extra else [])
+    if not items:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{_metric_name(k)}="{esc(v)}"' for k, v in items) + "}"
+
+
+def _gauges(prefix: str, value, labels: List[Tuple[str, str]], out: List[str], depth: int = 0) -> None:
+    # Aplana los dicts de los collectors; las claves de dicts anidados pasan a etiquetas.
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, (int, float)):
+        out.append(f"{_metric_name(prefix)}{_labels(labels)} {value}")
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            if isinstance(v, dict):
+                _gauges(prefix, v, labels + [(f"key{depth or ''}", k)], out, depth + 1)
+            else:
+                _gauges(f"{prefix}_{k}", v, labels, out, depth)
+
+
+def render_prometheus() -> str:
+    """Prometheus text exposition format (0.0.4)."""
+    with _LOCK:
+        hists = {name: [(k, list(h.counts), h.sum, h.count) for k, h in series.items()]
+                 for name, series in _HISTS.items()}
+        counters = {name: list(series.items()) for name, series in _COUNTERS.items()}
+    lines: List[str] = []
+    for name in sorted(hists):
+        m = _metric_name(name)
+        lines.append(f"# TYPE {m} histogram")
+        for key, counts, total, n in hists[name]:
+            acc = 0
+            for le, c in zip(BUCKETS, counts):
+                acc += c
+                lines.append(f"{m}_bucket{_labels(key, ('le', repr(le)))} {acc}")
+            lines.append(f"{m}_bucket{_labels(key, ('le', '+Inf'))} {n}")
+            lines.append(f"{m}_sum{_labels(key)} {total}")
+            lines.append(f"{m}_count{_labels(key)} {n}")
+    for name in sorted(counters):
+        m = _metric_name(name)
+        lines.append(f"# TYPE {m} counter")
+        for key, v in counters[name]:
+            lines.append(f"{m}{_labels(key)} {v}")
+    for name, stats in sorted(_collect().items()):
+        block: List[str] = []
+        _gauges(f"app_{name}", stats, [], block)
+        for m in dict.fromkeys(ln.split("{")[0].split(" ")[0] for ln in block):
+            lines.append(f"# TYPE {m} gauge")
+            lines.extend(ln for ln in block if ln.split("{")[0].split(" ")[0] == m)
+    lines.append(f"process_uptime_seconds {round(time.time() - _STARTED, 1)}")
+    return "\n".join(lines) + "\n"
+
+
+def reset() -> None:
+    with _LOCK:
+        _HISTS.clear()
+        _COUNTERS.clear()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "metrics/1.0"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/metrics":
+            send_text_metrics(self)
+        elif path == "/metrics.json":
+            send_json_metrics(self)
+        else:
+            self.send_error(404)
+
+
+def _send(handler: BaseHTTPRequestHandler, body: bytes, ctype: str) -> None:
+    handler.send_response(200)
+    handler.send_header("Content-Type", ctype)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.send_header("Cache-Control", "no-store")
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def send_text_metrics(handler: BaseHTTPRequestHandler) -> None:
+    _send(handler, render_prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+
+
+def send_json_metrics(handler: BaseHTTPRequestHandler) -> None:
+    _send(handler, json.dumps(snapshot(), ensure_ascii=False, default=str).encode("utf-8"), "application/json")
+
+
+def start_metrics_server(port: int = 9108, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve ``/metrics`` and ``/metrics.json`` for this process from a daemon thread."""
+    srv = ThreadingHTTPServer((host, port), _Handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True, name="metrics").start()
+    return srv
+
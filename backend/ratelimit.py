@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from .metrics import register_collector
+
+# Control de admisión para llamadas al LLM: token buckets global y por conversación
+# (peticiones y tokens estimados) y una cola de espera acotada.
+_LOCK = threading.Lock()
+_COND = threading.Condition(_LOCK)
+_GLOBAL: Dict[str, "TokenBucket"] = {}
+_PER_CONV: "OrderedDict[str, TokenBucket]" = OrderedDict()
+_LAST: "OrderedDict[str, str]" = OrderedDict()
+_MAX_CONVS = 5000
+_STATS = {"admitted": 0, "rejected_queue_full": 0, "rejected_timeout": 0,
+          "rejected_conversation": 0, "waiting": 0, "max_waiting": 0, "wait_s_total": 0.0}
+
+
+class TokenBucket:
+    def __init__(self, rate_per_s: float, capacity: float):
+        self.rate = float(rate_per_s)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self, n: float, now: float) -> float:
+        """Seconds until ``n`` tokens are available (0 when they already are)."""
+        self._refill(now)
+        n = min(n, self.capacity)
+        if self.tokens >= n:
+            return 0.0
+        return (n - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, n: float) -> None:
+        self.tokens -= min(n, self.capacity)
+
+
+def _buckets(cfg: dict):
+    key = (float(cfg.get("llm_rate_rps", 5.0)), float(cfg.get("llm_rate_burst", 10)),
+           float(cfg.get("llm_rate_tpm", 200000)))
+    if _GLOBAL.get("_key") != key:
+        rps, burst, tpm = key
+        _GLOBAL.clear()
+        _GLOBAL["_key"] = key
+        _GLOBAL["requests"] = TokenBucket(rps, burst)
+        _GLOBAL["tokens"] = TokenBucket(tpm / 60.0, tpm)
+    return _GLOBAL["requests"], _GLOBAL["tokens"]
+
+
+def _conv_bucket(conversation_id: str, cfg: dict) -> TokenBucket:
+    b = _PER_CONV.get(conversation_id)
+    if b is None:
+        per_min = float(cfg.get("llm_conv_rpm", 12))
+        b = _PER_CONV[conversation_id] = TokenBucket(per_min / 60.0, float(cfg.get("llm_conv_burst", 4)))
+    _PER_CONV.move_to_end(conversation_id)
+    while len(_PER_CONV) > _MAX_CONVS:
+        _PER_CONV.popitem(last=False)
+    return b
+
+
+def _remember(conversation_id: str, decision: str) -> None:
+    _LAST[conversation_id] = decision
+    _LAST.move_to_end(conversation_id)
+    while len(_LAST) > _MAX_CONVS:
+        _LAST.popitem(last=False)
+
+
+def acquire(conversation_id: str, est_tokens: int, cfg: dict) -> str:
+    """
+    Admit one LLM call or say why not. Returns ``"ok"``, ``"conversation"`` (that
+    chat exceeds its own rate), ``"queue_full"`` or ``"timeout"``. Callers over the
+    global rate wait in a queue of at most ``llm_queue_max`` for up to
+    ``llm_queue_timeout_s``.
+    """
+    if not cfg.get("llm_rate_limit", True):
+        return "ok"
+    max_wait = float(cfg.get("llm_queue_timeout_s", 10.0))
+    max_queue = int(cfg.get("llm_queue_max", 32))
+    with _COND:
+        now = time.monotonic()
+        conv = _conv_bucket(conversation_id, cfg)
+        if conv.wait_time(1, now) > 0:
+            _STATS["rejected_conversation"] += 1
+            _remember(conversation_id, "conversation")
+            return "conversation"
+        reqs, toks = _buckets(cfg)
+        start = now
+        queued = False
+        try:
+            while True:
+                now = time.monotonic()
+                delay = max(reqs.wait_time(1, now), toks.wait_time(est_tokens, now))
+                if delay == 0:
+                    reqs.take(1)
+                    toks.take(est_tokens)
+                    conv.take(1)
+                    _STATS["admitted"] += 1
+                    _STATS["wait_s_total"] += now - start
+                    _remember(conversation_id, "ok")
+                    return "ok"
+                remaining = max_wait - (now - start)
+                if delay > remaining:
+                    _STATS["rejected_timeout"] += 1
+                    _remember(conversation_id, "timeout")
+                    return "timeout"
+                if not queued:
+                    if _STATS["waiting"] >= max_queue:
+                        _STATS["rejected_queue_full"] += 1
+                        _remember(conversation_id, "queue_full")
+                        return "queue_full"
+                    queued = True
+                    _STATS["waiting"] += 1
+                    _STATS["max_waiting"] = max(_STATS["max_waiting"], _STATS["waiting"])
+                _COND.wait(timeout=delay)
+        finally:
+            if queued:
+                _STATS["waiting"] -= 1
+                _COND.notify_all()
+
+
+def pop_decision(conversation_id: str) -> Optional[str]:
+    """Last admission decision for a conversation, cleared once read."""
+    with _LOCK:
+        return _LAST.pop(conversation_id, None)
+
+
+def degraded_reply(reason: str, lang: str) -> str:
+    if reason == "conversation":
+        return ("Dame un momento para ponerme al día con tus mensajes y vuelve a escribirme en unos segundos. 🙏"
+                if lang == "es" else
+                "Give me a moment to catch up with your messages and write again in a few seconds. 🙏")
+    return ("Estamos con mucha demanda en este momento. Vuelve a intentarlo en unos segundos, por favor. 🙏"
+            if lang == "es" else
+            "We're very busy right now. Please try again in a few seconds. 🙏")
+
+
+def stats() -> Dict[str, float]:
+    with _LOCK:
+        out = dict(_STATS)
+    out["avg_wait_s"] = round(out["wait_s_total"] / out["admitted"], 4) if out["admitted"] else 0.0
+    return out
+
+
+register_collector("ratelimit", stats)
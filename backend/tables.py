@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Tablas de las páginas: DataFrames preparados una vez por versión de los datos.
+
+El frame se arma en forma columnar (formato de totales y marcas de SLA sobre columnas
+completas) y se guarda por ``(tipo, versión, idioma)``; un rerun con los mismos datos
+solo recorta la ventana visible. pandas se importa al primer uso.
+"""
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import streamlit as st
+
+from .config import get_config
+from .extraction import menu_version
+from .metrics import register_collector
+
+_FRAMES: "OrderedDict[tuple, object]" = OrderedDict()
+_MAX_FRAMES = 32
+_LOCK = threading.Lock()
+_STATS = {"hits": 0, "builds": 0}
+
+_ORDER_COLS = ["id", "created_at", "client_name", "delivery_type", "currency", "total",
+               "status", "priority", "sla_breached"]
+_ORDER_LABELS = {
+    "es": {"created_at": "creada", "client_name": "cliente", "delivery_type": "tipo", "total": "total",
+           "status": "estado", "priority": "prioridad", "sla": "SLA"},
+    "en": {"created_at": "created", "client_name": "client", "delivery_type": "type", "total": "total",
+           "status": "status", "priority": "priority", "sla": "SLA"},
+}
+
+
+def _memo(key: tuple, build: Callable[[], object]):
+    # Compartido por todas las sesiones del proceso: el mismo menú / la misma cola se arma una vez.
+    with _LOCK:
+        df = _FRAMES.get(key)
+        if df is not None:
+            _FRAMES.move_to_end(key)
+            _STATS["hits"] += 1
+            return df
+    df = build()
+    with _LOCK:
+        _FRAMES[key] = df
+        while len(_FRAMES) > _MAX_FRAMES:
+            _FRAMES.popitem(last=False)
+        _STATS["builds"] += 1
+    return df
+
+
+def menu_frame(menu: List[Dict], version: Optional[str] = None):
+    import pandas as pd
+    version = version or menu_version(menu)
+    return _memo(("menu", version), lambda: pd.DataFrame.from_records(menu))
+
+
+def orders_frame(orders: List[Dict], lang: str, version):
+    """Order queue for display; ``version`` is the ``orders`` change stamp the rows were read at."""
+    import numpy as np
+    import pandas as pd
+
+    def build():
+        raw = pd.DataFrame.from_records(orders, columns=_ORDER_COLS)
+        labels = _ORDER_LABELS["es" if lang == "es" else "en"]
+        totals = np.char.mod("%0.2f", raw["total"].fillna(0).to_numpy(dtype=float))
+        return pd.DataFrame({
+            "id": raw["id"],
+            labels["created_at"]: raw["created_at"],
+            labels["client_name"]: raw["client_name"],
+            labels["delivery_type"]: raw["delivery_type"],
+            labels["total"]: raw["currency"].fillna("").astype(str) + " " + totals,
+            labels["status"]: raw["status"],
+            labels["priority"]: raw["priority"],
+            labels["sla"]: np.where(raw["sla_breached"].fillna(0).astype(bool), "⚠️", "✅"),
+        })
+
+    return _memo(("orders", version, lang), build)
+
+
+def show_table(df, key: str, lang: str = "es", page_rows: Optional[int] = None) -> None:
+    """Render ``df``; past ``table_page_rows`` rows only the selected page is sent to the browser."""
+    page_rows = int(page_rows or get_config().get("table_page_rows", 50))
+    n = len(df)
+    view = df
+    if n > page_rows:
+        pages = (n + page_rows - 1) // page_rows
+        page = st.number_input("Página" if lang == "es" else "Page", min_value=1, max_value=pages,
+                               value=1, step=1, key=f"{key}_page")
+        start = (int(page) - 1) * page_rows
+        view = df.iloc[start:start + page_rows]
+        st.caption((f"Filas {start + 1}–{start + len(view)} de {n}" if lang == "es"
+                    else f"Rows {start + 1}–{start + len(view)} of {n}"))
+    try:
+        st.dataframe(view, hide_index=True, width='stretch')
+    except TypeError:
+        st.dataframe(view, hide_index=True)
+
+
+def table_stats() -> Dict:
+    with _LOCK:
+        return {"frames": len(_FRAMES), **_STATS}
+
+
+register_collector("tables", table_stats)
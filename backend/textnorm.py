@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import re
+from functools import lru_cache
+from typing import NamedTuple, Tuple
+
+# á/é/í/ó/ú/ü → vocal simple; la ñ se conserva (año ≠ ano).
+_FOLD_TABLE = str.maketrans("áéíóúüàèìòùÁÉÍÓÚÜÀÈÌÒÙ", "aeiouuaeiouAEIOUUAEIOU")
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class NormalizedText(NamedTuple):
+    raw: str
+    low: str
+    folded: str
+    tokens: Tuple[str, ...]
+
+
+def fold_accents(text: str) -> str:
+    return (text or "").translate(_FOLD_TABLE)
+
+
+def tokenize(text: str) -> Tuple[str, ...]:
+    """Lowercase, accent-folded word tokens."""
+    return normalize_text(text).tokens
+
+
+@lru_cache(maxsize=2048)
+def normalize_text(text: str) -> NormalizedText:
+    """
+    Single normalization pass for a chat message, shared by the pending detector,
+    the item parser and the FAQ matcher. Cached, so every consumer of the same
+    message reuses the same result.
+    """
+    raw = text or ""
+    low = raw.lower()
+    folded = fold_accents(low)
+    return NormalizedText(raw, low, folded, tuple(_TOKEN_RE.findall(folded)))
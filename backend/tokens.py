@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+from functools import lru_cache
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    # tiktoken se importa al primer conteo (tarda en cargar sus tablas). La primera vez
+    # puede bajar el encoding por red: sin red (réplicas offline) o ante cualquier error
+    # queda None y se usa la estimación; el resultado se cachea, no se reintenta por llamada.
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")  # modelo desconocido para tiktoken
+    except Exception:
+        return None
+
+
+def _estimate(text: str) -> int:
+    return max(1, (len(text) + 3) // 4)
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Local token count; ~4 chars/token estimate when tiktoken (or its encoding files) is unavailable."""
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is None:
+        return _estimate(text)
+    try:
+        return len(enc.encode(text, disallowed_special=()))
+    except Exception:
+        return _estimate(text)
@@ -1,19 +1,22 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 import os
+import threading
+from collections import OrderedDict
+from typing import Optional
 import streamlit as st
-import pandas as pd
+
+from .config import get_config
+from .tables import menu_frame, show_table
+from .metrics import register_collector
 
 
 def menu_table_component(menu: list[dict], lang: str, deletable: bool = False, on_delete=None):
     if not menu:
         st.info("No hay items aún." if lang == "es" else "No items yet.")
         return
-    df = pd.DataFrame(menu)
-    try:
-        st.dataframe(df, hide_index=True, width='stretch')
-    except TypeError:
-        st.dataframe(df, hide_index=True)
+    # Frame memoizado por versión del menú; solo se envía la página visible.
+    show_table(menu_frame(menu), key="menu_table", lang=lang)
     if deletable and on_delete:
         names = [m["name"] for m in menu]
         sel = st.selectbox("Eliminar ítem" if lang ==
@@ -31,50 +34,136 @@ def _safe_st_image(img_bytes_or_path):
         st.image(img_bytes_or_path, use_column_width=True)
 
 
+# LRU de bytes de imagen acotado en bytes, por proceso; la clave incluye mtime para
+# que un archivo reemplazado no se sirva viejo.
+_IMG_CACHE: "OrderedDict[tuple, bytes]" = OrderedDict()
+_IMG_CACHE_BYTES = 0
+_IMG_LOCK = threading.Lock()
+
+
+def _img_cache_limit() -> int:
+    return int(float(get_config().get("image_cache_mb", 64)) * 1024 * 1024)
+
+
+def load_image_bytes(path: str) -> Optional[bytes]:
+    """Image bytes for ``path`` through the LRU keyed by (path, mtime); ``None`` if unreadable."""
+    global _IMG_CACHE_BYTES
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+    except OSError:
+        return None
+    with _IMG_LOCK:
+        data = _IMG_CACHE.get(key)
+        if data is not None:
+            _IMG_CACHE.move_to_end(key)
+            return data
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    limit = _img_cache_limit()
+    if len(data) > limit:
+        return data
+    with _IMG_LOCK:
+        if key not in _IMG_CACHE:
+            _IMG_CACHE[key] = data
+            _IMG_CACHE_BYTES += len(data)
+        while _IMG_CACHE_BYTES > limit and _IMG_CACHE:
+            _, old = _IMG_CACHE.popitem(last=False)
+            _IMG_CACHE_BYTES -= len(old)
+    return data
+
+
+def image_cache_stats() -> dict:
+    with _IMG_LOCK:
+        return {"entries": len(_IMG_CACHE), "bytes": _IMG_CACHE_BYTES}
+
+
+def _load_item(itm) -> Optional[bytes]:
+    if isinstance(itm, (bytes, bytearray)):
+        return bytes(itm)
+    if isinstance(itm, str):
+        return load_image_bytes(itm)
+    return None
+
+
 def render_js_carousel(
-    images: list[str | bytes],
+    images,
     interval_ms: int = 5000,
     key_prefix: str = "gal",
     show_dots: bool = True,
     aspect_ratio: float = 16 / 9,
     height_px: int = 420,
+    total: Optional[int] = None,
+    prefetch: bool = True,
+    thumbs=None,
 ):
-    if not images:
-        return
-
-    normalized: list[bytes] = []
-    for itm in images:
-        try:
-            if isinstance(itm, (bytes, bytearray)):
-                normalized.append(bytes(itm))
-            elif isinstance(itm, str):
-                if os.path.exists(itm):
-                    with open(itm, "rb") as f:
-                        normalized.append(f.read())
-                else:
-                    continue
-            else:
-                continue
-        except Exception:
-            continue
-
-    if not normalized:
-        st.info("No hay imágenes disponibles o no se pudieron leer.")
+    """
+    Show one gallery image at a time. ``images`` is a list of paths/bytes, or a
+    ``fetch(offset, limit)`` callable (e.g. ``db.fetch_menu_images``) together with
+    ``total`` so only the current page is queried. Only the current image is read
+    (through the LRU); the next one is prefetched in the background. With
+    ``show_dots``, a ``thumbs(offset, limit)`` callable returning thumbnail paths
+    draws a strip of previews around the current image to jump to.
+    """
+    if callable(images):
+        fetch = images
+        n = int(total or 0)
+    else:
+        items = list(images or [])
+        fetch = lambda offset, limit: items[offset:offset + limit]
+        n = len(items)
+    if not n:
         return
 
     idx_key = f"{key_prefix}_idx"
     if idx_key not in st.session_state:
         st.session_state[idx_key] = 0
-    i = st.session_state[idx_key] % len(normalized)
+    i = st.session_state[idx_key] % n
+
+    # Salta archivos ilegibles sin leer la galería completa.
+    data = None
+    for step in range(n):
+        page = fetch((i + step) % n, 1)
+        data = _load_item(page[0]) if page else None
+        if data is not None:
+            i = (i + step) % n
+            break
+    if data is None:
+        st.info("No hay imágenes disponibles o no se pudieron leer.")
+        return
+    st.session_state[idx_key] = i
+
+    _safe_st_image(data)
 
-    _safe_st_image(normalized[i])
+    if prefetch and n > 1:
+        nxt = fetch((i + 1) % n, 1)
+        if nxt and isinstance(nxt[0], str):
+            threading.Thread(target=load_image_bytes, args=(nxt[0],), daemon=True).start()
+
+    if show_dots and thumbs is not None and n > 1:
+        # Miniaturas de los vecinos: solo se leen las versiones chicas, nunca las grandes.
+        k = min(n, 5)
+        start = (i - k // 2) % n
+        for j, col in enumerate(st.columns(k)):
+            pos = (start + j) % n
+            page = thumbs(pos, 1)
+            tdata = _load_item(page[0]) if page else None
+            with col:
+                if tdata is not None:
+                    _safe_st_image(tdata)
+                if st.button("●" if pos == i else "○", key=f"{key_prefix}_dot_{j}") and pos != i:
+                    st.session_state[idx_key] = pos
+                    st.rerun()
 
     c1, _, c3 = st.columns(3)
     if c1.button("⏮️", key=f"{key_prefix}_prev"):
-        st.session_state[idx_key] = (
-            st.session_state[idx_key] - 1) % len(normalized)
+        st.session_state[idx_key] = (i - 1) % n
         st.rerun()
     if c3.button("⏭️", key=f"{key_prefix}_next"):
-        st.session_state[idx_key] = (
-            st.session_state[idx_key] + 1) % len(normalized)
+        st.session_state[idx_key] = (i + 1) % n
         st.rerun()
+
+
+register_collector("image_cache", image_cache_stats)
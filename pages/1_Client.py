@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
+from functools import partial
 import re
 import streamlit as st
 from uuid import uuid4
@@ -7,22 +8,27 @@ from uuid import uuid4
 from backend.utils import render_js_carousel, menu_table_component
 from backend.config import get_config
 from backend.db import (
-    fetch_menu, fetch_menu_images, create_order_from_chat_ready,
+    fetch_menu, fetch_menu_images, count_menu_images, create_order_from_chat_ready,
     has_pending_for_conversation, fetch_unnotified_decisions,
     mark_pending_notified
 )
-from backend.llm_chat import (
-    client_assistant_reply,
-    extract_client_info,
+from backend.extraction import (
     ensure_all_required_present,
-    parse_items_from_chat
+    new_conversation_state,
+    update_conversation_state
 )
+from backend.conversations import open_conversation
+from backend.chat_history import format_summary
+from backend.llm_worker import submit_reply, cancel_conversation, queue_depth
+from backend.ratelimit import pop_decision
 
-from backend.db import init_db
-# crea tablas que falten (incluida pendings) y aplica migraciones
-init_db(seed=True)
+from backend.bootstrap import bootstrap
+from backend.metrics import page_run, timed
+# crea tablas que falten y aplica migraciones (una sola vez por proceso)
+bootstrap()
 
 st.set_page_config(page_title="Cliente", page_icon="💬", layout="wide")
+_run = page_run("client")
 
 
 def _t(lang: str):
@@ -38,7 +44,10 @@ st.title(t("💬 Cliente", "💬 Client"))
 
 # Reset conversation
 if st.button(t("🗑️ Nuevo chat", "🗑️ New chat"), help=t("Reinicia esta conversación.", "Reset this conversation.")):
-    for k in ["conv_id", "conv", "client_info", "order_items", "collecting_info", "last_question_field", "prompted_confirm", "asked_for_data", "awaiting_more_confirmation"]:
+    if "conv_id" in st.session_state:
+        cancel_conversation(st.session_state["conv_id"])
+    st.query_params.pop("c", None)
+    for k in ["conv_id", "conv_state", "older_shown", "llm_job", "llm_job_user_text", "llm_degraded", "client_info", "order_items", "collecting_info", "last_question_field", "prompted_confirm", "asked_for_data", "awaiting_more_confirmation"]:
         if k in st.session_state:
             del st.session_state[k]
     st.rerun()
@@ -51,14 +60,19 @@ if not menu:
 
 ss = st.session_state
 if "conv_id" not in ss:
-    ss.conv_id = uuid4().hex
-if "conv" not in ss:
-    ss.conv = [{"role": "assistant", "content": t(
-        "Gracias por comunicarte con nosotros. ¿Cómo podemos ayudarte?", "Thanks for contacting us. How can we help?")}]
+    # El id va en la URL: al recargar (o si la réplica reinicia) se retoma la misma conversación.
+    ss.conv_id = st.query_params.get("c") or uuid4().hex
+st.query_params["c"] = ss.conv_id
+# Historial persistido; en memoria solo queda la ventana reciente (backend/conversations.py).
+conv = open_conversation(ss.conv_id, channel="web", greeting=t(
+    "Gracias por comunicarte con nosotros. ¿Cómo podemos ayudarte?", "Thanks for contacting us. How can we help?"))
+if "conv_state" not in ss:
+    ss.conv_state = new_conversation_state()
+    update_conversation_state(ss.conv_state, conv, menu, cfg, lang=lang, emit_events=False)
 if "client_info" not in ss:
-    ss.client_info = {}
+    ss.client_info = dict(conv.client_info)
 if "order_items" not in ss:
-    ss.order_items = []
+    ss.order_items = list(ss.conv_state["items"])
 if "collecting_info" not in ss:
     ss.collecting_info = False
 if "last_question_field" not in ss:
@@ -69,6 +83,8 @@ if "asked_for_data" not in ss:
     ss.asked_for_data = False
 if "awaiting_more_confirmation" not in ss:
     ss.awaiting_more_confirmation = False
+if "llm_job" not in ss:
+    ss.llm_job = None
 
 # Pending banner
 if has_pending_for_conversation(ss.conv_id):
@@ -90,7 +106,7 @@ for d in fetch_unnotified_decisions(ss.conv_id):
                         "Kitchen replied.")
     if msg:
         text += f" {msg}"
-    ss.conv.append({"role": "assistant", "content": text})
+    conv.append({"role": "assistant", "content": text})
     mark_pending_notified(d["id"])
 
 # UI
@@ -103,22 +119,158 @@ with col_menu:
     if view == t("Tabla", "Table"):
         menu_table_component(menu, lang)
     else:
-        gallery = fetch_menu_images()
-        if not gallery:
+        n_images = count_menu_images()
+        if not n_images:
             st.info(t("No hay imágenes cargadas aún.", "No images uploaded yet."))
         else:
-            render_js_carousel(gallery, interval_ms=5000, aspect_ratio=16/7,
-                               key_prefix="client_menu", show_dots=True, height_px=520)
+            render_js_carousel(fetch_menu_images, total=n_images, interval_ms=5000, aspect_ratio=16/7,
+                               key_prefix="client_menu", show_dots=True, height_px=520,
+                               thumbs=partial(fetch_menu_images, thumbs=True))
+
+
+def _apply_events():
+    """Merge the extraction events of the last update into the page state."""
+    for ev in ss.conv_state["events"]:
+        ss.client_info.update(ev["fields"])
+    ss.order_items = list(ss.conv_state["items"])
+    conv.save_client_info(ss.client_info)
+
+
+def _after_reply(reply: str, ut: str):
+    """State updates and follow-up prompts once the assistant reply is in."""
+    conv.append({"role": "assistant", "content": reply})
+    update_conversation_state(ss.conv_state, conv, menu, cfg, lang=lang)
+    ev = ss.conv_state["last_event"] or {}
+
+    # Ask “anything else?” ONLY if there's at least one detected item (we have a subtotal)
+    if (ss.order_items  # must have items
+        and not ss.collecting_info
+        and not ss.asked_for_data
+            and not ss.awaiting_more_confirmation):
+        conv.append({"role": "assistant", "content": t(
+            "¿Deseas agregar algo más o eso es todo?", "Would you like anything else, or is that all?")})
+        ss.awaiting_more_confirmation = True
+        return
+
+    # If user says it's all, start data phase (ONLY then)
+    if ss.awaiting_more_confirmation:
+        if ev.get("text") == ut and ev.get("done"):
+            ss.awaiting_more_confirmation = False
+            ss.collecting_info = True
+            ss.asked_for_data = True
+            pre = t("Perfecto. Ahora necesito unos datos para completar tu pedido. Te los pediré uno a uno.",
+                    "Great. I now need a few details to complete your order. I'll ask them one by one.")
+            conv.append({"role": "assistant", "content": pre})
+            # Start with the first missing
+            missing_seq = ensure_all_required_present(ss.client_info, lang)
+            order = ["name", "phone", "delivery_type",
+                     "address", "pickup_eta_min", "payment_method"]
+            for f in order:
+                if f in missing_seq:
+                    first_q = {
+                        "name": t("¿Cuál es tu nombre?", "What is your name?"),
+                        "phone": t("¿Cuál es tu número de teléfono?", "What is your phone number?"),
+                        "delivery_type": t("¿Será para recoger (pickup) o entrega a domicilio?", "Pickup or delivery?"),
+                        "address": t("¿Cuál es la dirección para la entrega?", "What is the delivery address?"),
+                        "pickup_eta_min": t("¿En cuántos minutos pasarías a recoger?", "In how many minutes would you pick up?"),
+                        "payment_method": t("¿Cuál es tu método de pago (efectivo, tarjeta u online)?", "What is your payment method (cash, card, online)?"),
+                    }[f]
+                    # If delivery, skip pickup minutes
+                    if (ss.client_info.get("delivery_type") or "").lower() == "delivery" and f == "pickup_eta_min":
+                        continue
+                    conv.append(
+                        {"role": "assistant", "content": first_q})
+                    ss.last_question_field = f
+                    break
+
+
+@st.fragment(run_every=float(cfg.get("llm_poll_interval_s", 0.3)))
+@timed("fragment_run_seconds", fragment="client_pending_reply")
+def _pending_reply():
+    # Polls the queued LLM job; shows partial text while it streams.
+    job = ss.get("llm_job")
+    if job is None:
+        return
+    if not job.done():
+        with st.chat_message("assistant"):
+            st.write(job.text or "…")
+        return
+    _finish_job(job)
+    st.rerun()
+
+
+def _finish_job(job):
+    ss.llm_job = None
+    ut = ss.pop("llm_job_user_text", "")
+    try:
+        reply = job.result()
+    except Exception:
+        reply = t("Lo siento, no pude responder en este momento. Intenta de nuevo, por favor.",
+                  "Sorry, I couldn't reply right now. Please try again.")
+    # Admission decision for this turn (None when the LLM was not needed).
+    ss.llm_degraded = pop_decision(ss.conv_id) not in (None, "ok")
+    _after_reply(reply, ut)
+
+
+def _settle_pending_job():
+    """
+    A new message arrived while a reply was still queued: a finished reply is applied
+    first; an unfinished one is cancelled and the next reply answers both turns
+    (they are both in the history it sees).
+    """
+    job = ss.get("llm_job")
+    if job is None:
+        return
+    if job.done():
+        _finish_job(job)
+        return
+    cancel_conversation(ss.conv_id)
+    ss.llm_job = None
+    ss.pop("llm_job_user_text", None)
+
+
+def _bubble(m: dict):
+    st.chat_message("user" if m["role"] ==
+                    "user" else "assistant").write(m["content"])
+
+
+@st.fragment
+def _older_history(start: int):
+    # Turnos anteriores a la ventana: se leen de la base solo al pedirlos (rerun solo de este fragmento).
+    shown = min(start, ss.get("older_shown", 0))
+    with st.expander(t(f"🕘 {start} mensajes anteriores", f"🕘 {start} earlier messages"), expanded=bool(shown)):
+        st.caption(format_summary(ss.conv_state, lang))
+        if shown < start and st.button(t("Cargar anteriores", "Load earlier"), key="load_older"):
+            shown = ss.older_shown = min(start, shown + int(cfg.get("client_history_page", 20)))
+        for m in conv.older(start, shown):
+            _bubble(m)
+
+
+def _render_transcript():
+    """Last ``client_render_window`` messages live; the rest behind the expander."""
+    total = len(conv)
+    start = max(0, total - int(cfg.get("client_render_window", 12)))
+    if start:
+        _older_history(start)
+    for m in conv.recent(total - start):
+        _bubble(m)
+    if ss.llm_job is not None:
+        _pending_reply()
+    if ss.get("llm_degraded"):
+        st.caption(t(f"⚠️ Alta demanda (en cola: {queue_depth()}). Las respuestas pueden demorar.",
+                     f"⚠️ High demand (queued: {queue_depth()}). Replies may be delayed."))
+
 
 with col_chat:
-    for m in ss.conv:
-        st.chat_message("user" if m["role"] ==
-                        "user" else "assistant").write(m["content"])
+    # El transcript se dibuja al final del script (arriba del input): así incluye lo que
+    # agregue este mismo run y no hace falta un st.rerun() extra por mensaje.
+    transcript = st.container()
 
     user_text = st.chat_input(t("Escribe tu mensaje…", "Type your message…"))
     if user_text:
         ut = user_text.strip()
-        ss.conv.append({"role": "user", "content": ut})
+        _settle_pending_job()
+        conv.append({"role": "user", "content": ut})
 
         # 1) If we are collecting data and we asked a field, capture it DIRECTLY (no regex)
         if ss.collecting_info and ss.last_question_field:
@@ -152,6 +304,7 @@ with col_chat:
                 val = val.strip()
 
             ss.client_info[fld] = val.strip()
+            conv.save_client_info(ss.client_info)
             ss.last_question_field = None
 
             # Ask next missing (or finish)
@@ -173,75 +326,27 @@ with col_chat:
             if missing_seq:
                 nxt = q(missing_seq[0])
                 if nxt:
-                    ss.conv.append({"role": "assistant", "content": nxt})
+                    conv.append({"role": "assistant", "content": nxt})
                     ss.last_question_field = missing_seq[0]
             else:
                 ss.collecting_info = False
                 if not ss.prompted_confirm:
-                    ss.conv.append({"role": "assistant", "content": t(
+                    conv.append({"role": "assistant", "content": t(
                         "Pedido listo para confirmación. Por favor, presiona el botón **Confirmar**.",
                         "Order ready for confirmation. Please press the **Confirm** button."
                     )})
                     ss.prompted_confirm = True
 
-            st.rerun()
-
-        # 2) Regular assistant reply (suggestions, subtotal, etc.)
-        reply = client_assistant_reply(
-            ss.conv, menu, cfg, conversation_id=ss.conv_id)
-        ss.conv.append({"role": "assistant", "content": reply})
-
-        # Extract info + items for subtotal
-        info_auto = extract_client_info(ss.conv, lang)
-        ss.client_info.update({k: v for k, v in info_auto.items() if v})
-        ss.order_items = parse_items_from_chat(ss.conv, menu, cfg, lang=lang)
-
-        # Ask “anything else?” ONLY if there's at least one detected item (we have a subtotal)
-        if (ss.order_items  # must have items
-            and not ss.collecting_info
-            and not ss.asked_for_data
-                and not ss.awaiting_more_confirmation):
-            ss.conv.append({"role": "assistant", "content": t(
-                "¿Deseas agregar algo más o eso es todo?", "Would you like anything else, or is that all?")})
-            ss.awaiting_more_confirmation = True
-            st.rerun()
-
-        # If user says it's all, start data phase (ONLY then)
-        if ss.awaiting_more_confirmation:
-            low = ut.lower()
-            done_tokens = ["eso sería todo", "eso es todo", "nada más", "listo", "no, gracias", "no gracias", "ya no",
-                           "that's all", "nothing else", "no thanks", "i'm done", "done"]
-            if any(tok in low for tok in done_tokens):
-                ss.awaiting_more_confirmation = False
-                ss.collecting_info = True
-                ss.asked_for_data = True
-                pre = t("Perfecto. Ahora necesito unos datos para completar tu pedido. Te los pediré uno a uno.",
-                        "Great. I now need a few details to complete your order. I'll ask them one by one.")
-                ss.conv.append({"role": "assistant", "content": pre})
-                # Start with the first missing
-                missing_seq = ensure_all_required_present(ss.client_info, lang)
-                order = ["name", "phone", "delivery_type",
-                         "address", "pickup_eta_min", "payment_method"]
-                for f in order:
-                    if f in missing_seq:
-                        first_q = {
-                            "name": t("¿Cuál es tu nombre?", "What is your name?"),
-                            "phone": t("¿Cuál es tu número de teléfono?", "What is your phone number?"),
-                            "delivery_type": t("¿Será para recoger (pickup) o entrega a domicilio?", "Pickup or delivery?"),
-                            "address": t("¿Cuál es la dirección para la entrega?", "What is the delivery address?"),
-                            "pickup_eta_min": t("¿En cuántos minutos pasarías a recoger?", "In how many minutes would you pick up?"),
-                            "payment_method": t("¿Cuál es tu método de pago (efectivo, tarjeta u online)?", "What is your payment method (cash, card, online)?"),
-                        }[f]
-                        # If delivery, skip pickup minutes
-                        if (ss.client_info.get("delivery_type") or "").lower() == "delivery" and f == "pickup_eta_min":
-                            continue
-                        ss.conv.append(
-                            {"role": "assistant", "content": first_q})
-                        ss.last_question_field = f
-                        break
-                st.rerun()
-
-        st.rerun()
+        else:
+            # 2) Regular assistant reply (suggestions, subtotal, etc.)
+            # Parse the new turn first (only the new messages are parsed) so the
+            # fast path can answer item/subtotal turns from the current cart, then
+            # queue the reply on the shared LLM pool; _pending_reply() polls it.
+            update_conversation_state(ss.conv_state, conv, menu, cfg, lang=lang)
+            _apply_events()
+            ss.llm_job = submit_reply(ss.conv_id, conv, menu, cfg,
+                                      cart=ss.conv_state["items"], event=ss.conv_state["last_event"])
+            ss.llm_job_user_text = ut
 
 st.write("---")
 missing = ensure_all_required_present(
@@ -275,9 +380,13 @@ with right:
                                          items=st.session_state.get(
                                              "order_items", []),
                                          currency=currency)
-            st.session_state.conv.append({"role": "assistant", "content": t(
+            conv.append({"role": "assistant", "content": t(
                 "¡Pedido confirmado! Lo estamos preparando 🚗💨 si es a domicilio, o listo según tu hora de retiro.",
                 "Order confirmed! We're on it 🚗💨 for delivery, or ready at your pickup time."
             )})
             st.success(t("¡Pedido confirmado!", "Order confirmed!"))
-            st.rerun()
+
+with transcript:
+    _render_transcript()
+
+_run.done()
@@ -1,23 +1,26 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
+from functools import partial
 import io
 import csv
-import pandas as pd
 import streamlit as st
 from backend.utils import render_js_carousel, menu_table_component
+from backend.tables import orders_frame, show_table
 from backend.config import get_config
 from backend.db import (
-    add_menu_item, fetch_menu, delete_menu_item, add_menu_image, fetch_menu_images,
+    add_menu_item, fetch_menu, delete_menu_item, add_menu_image, fetch_menu_images, count_menu_images,
     fetch_orders_queue, update_order_status, bump_priorities_if_sla_missed,
     fetch_pending_questions, answer_pending_question, autoapprove_expired_pendings,
-    export_orders_csv, export_pendings_csv, verify_login
+    export_orders_csv, export_pendings_csv, verify_login, get_change_stamp
 )
 
-from backend.db import init_db
-# crea tablas que falten (incluida pendings) y aplica migraciones
-init_db(seed=True)
+from backend.bootstrap import bootstrap
+from backend.metrics import page_run, timed
+# crea tablas que falten y aplica migraciones (una sola vez por proceso)
+bootstrap()
 
 st.set_page_config(page_title="Restaurante", page_icon="🧑‍🍳", layout="wide")
+_run = page_run("restaurant")
 
 
 def _t(lang):
@@ -96,9 +99,13 @@ with col2:
     img_up = st.file_uploader(t("Subir imagen del menú", "Upload menu image"), type=[
                               "png", "jpg", "jpeg"], key="menu_img")
     if st.button(t("Guardar imagen", "Save image")) and img_up:
-        add_menu_image(img_up)
-        st.success("OK")
-        st.rerun()
+        try:
+            add_menu_image(img_up)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.success("OK")
+            st.rerun()
 
 st.write("---")
 view = st.radio(t("Visualización del menú", "Menu view"), [t("Tabla", "Table"), t(
@@ -108,37 +115,36 @@ if view == t("Tabla", "Table"):
     menu_table_component(menu, lang, deletable=True,
                          on_delete=delete_menu_item)
 else:
-    gallery = fetch_menu_images()
-    if not gallery:
+    n_images = count_menu_images()
+    if not n_images:
         st.info(t("No hay imágenes cargadas aún.", "No images uploaded yet."))
     else:
-        render_js_carousel(gallery, interval_ms=5000, aspect_ratio=16/6,
-                           key_prefix="rest_menu", show_dots=True, height_px=520)
+        render_js_carousel(fetch_menu_images, total=n_images, interval_ms=5000, aspect_ratio=16/6,
+                           key_prefix="rest_menu", show_dots=True, height_px=520,
+                           thumbs=partial(fetch_menu_images, thumbs=True))
 
 st.write("---")
 c1, c2 = st.columns(2)
+refresh_s = float(cfg.get("restaurant_refresh_s", 5)) or None
 
-with c1:
+
+# Órdenes y pendientes se refrescan solos como fragmentos; solo re-consultan
+# cuando su change stamp se mueve y el resto de la página no se vuelve a ejecutar.
+@st.fragment(run_every=refresh_s)
+@timed("fragment_run_seconds", fragment="orders_panel")
+def _orders_panel():
     st.subheader(t("Órdenes", "Orders"))
     bump_priorities_if_sla_missed()
-    orders = fetch_orders_queue()
+    stamp = get_change_stamp("orders")
+    if ss.get("orders_stamp") != stamp:
+        ss.orders_cache = fetch_orders_queue()
+        ss.orders_csv = None
+        ss.orders_stamp = stamp
+    orders = ss.orders_cache
     if not orders:
         st.info(t("No hay órdenes aún.", "No orders yet."))
     else:
-        df = pd.DataFrame([{
-            "id": o["id"],
-            t("creada", "created"): o["created_at"],
-            t("cliente", "client"): o["client_name"],
-            t("tipo", "type"): o["delivery_type"],
-            t("total", "total"): f'{o["currency"]} {o["total"]:0.2f}',
-            t("estado", "status"): o["status"],
-            t("prioridad", "priority"): o["priority"],
-            t("SLA", "SLA"): "⚠️" if o["sla_breached"] else "✅",
-        } for o in orders])
-        try:
-            st.dataframe(df, hide_index=True, width='stretch')
-        except TypeError:
-            st.dataframe(df, hide_index=True)
+        show_table(orders_frame(orders, lang, stamp), key="orders", lang=lang)
 
         with st.expander(t("Cambiar estado", "Change status")):
             oid = st.selectbox(t("Orden", "Order"), [o["id"] for o in orders])
@@ -147,16 +153,26 @@ with c1:
             if st.button(t("Aplicar", "Apply")) and oid:
                 update_order_status(oid, newst)
                 st.success("OK")
-                st.rerun()
+                st.rerun(scope="fragment")
 
+        if ss.orders_csv is None:
+            ss.orders_csv = export_orders_csv()
         st.download_button(label=t("⬇️ Descargar órdenes (CSV)", "⬇️ Download orders (CSV)"),
-                           data=export_orders_csv(), file_name="orders.csv", mime="text/csv")
+                           data=ss.orders_csv, file_name="orders.csv", mime="text/csv")
 
-with c2:
+
+@st.fragment(run_every=refresh_s)
+@timed("fragment_run_seconds", fragment="pendings_panel")
+def _pendings_panel():
     st.subheader(t("Interacciones por confirmar (1 min)",
                  "Pending interactions (1 min)"))
     autoapprove_expired_pendings()
-    pend = fetch_pending_questions()
+    stamp = get_change_stamp("pendings")
+    if ss.get("pendings_stamp") != stamp:
+        ss.pendings_cache = fetch_pending_questions()
+        ss.pendings_csv = None
+        ss.pendings_stamp = stamp
+    pend = ss.pendings_cache
     if not pend:
         st.info(t("No hay interacciones pendientes.", "No pending interactions."))
     else:
@@ -169,13 +185,13 @@ with c2:
                     answer_pending_question(p["id"], "approved", t(
                         "Aprobado por cocina.", "Approved by kitchen."))
                     st.success("OK")
-                    st.rerun()
+                    st.rerun(scope="fragment")
             with colB:
                 if st.button(t("Negar", "Deny"), key="dn_"+p["id"]):
                     answer_pending_question(p["id"], "denied", t(
                         "No disponible.", "Not available."))
                     st.success("OK")
-                    st.rerun()
+                    st.rerun(scope="fragment")
             with colC:
                 msg = st.text_input(t("Mensaje al cliente (opcional)",
                                     "Message to client (optional)"), key="msg_"+p["id"])
@@ -183,7 +199,18 @@ with c2:
                     answer_pending_question(
                         p["id"], "custom", msg or t("Aprobado.", "Approved."))
                     st.success("OK")
-                    st.rerun()
+                    st.rerun(scope="fragment")
 
+        if ss.pendings_csv is None:
+            ss.pendings_csv = export_pendings_csv()
         st.download_button(label=t("⬇️ Descargar interacciones (CSV)", "⬇️ Download pendings (CSV)"),
-                           data=export_pendings_csv(), file_name="pendings.csv", mime="text/csv")
+                           data=ss.pendings_csv, file_name="pendings.csv", mime="text/csv")
+
+
+with c1:
+    _orders_panel()
+
+with c2:
+    _pendings_panel()
+
+_run.done()
@@ -2,14 +2,16 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
 import streamlit as st
-import pandas as pd
 from backend.config import get_config, save_config, get_db_path, get_data_dir
 from backend.db import get_tenants, create_tenant, create_user, list_faqs, add_faq, delete_faq, verify_login
 
-from backend.db import init_db
-init_db(seed=True)  # crea tablas que falten (incluida pendings) y aplica migraciones
+from backend.metrics import page_run, snapshot, render_prometheus
+from backend.llm_router import fallback_models
+from backend.bootstrap import bootstrap
+bootstrap()  # crea tablas que falten y aplica migraciones (una sola vez por proceso)
 
 st.set_page_config(page_title="Admin", page_icon="🛠️", layout="wide")
+_run = page_run("admin")
 
 cfg = get_config()
 st.title("🛠️ Admin")
@@ -37,6 +39,7 @@ with st.form("cfg"):
     with col1:
         language = st.selectbox("Idioma / Language", ["es","en"], index=(0 if cfg.get("language","es")=="es" else 1))
         model = st.text_input("Modelo (OpenAI)", cfg.get("model","gpt-4o-mini"))
+        fallback_raw = st.text_input("Modelos de respaldo (coma)", ", ".join(fallback_models(cfg)))
         temperature = st.slider("Temperatura", 0.0, 1.2, float(cfg.get("temperature",0.4)), 0.05)
     with col2:
         assistant_name = st.text_input("Nombre del asistente", cfg.get("assistant_name","RAIVA"))
@@ -44,11 +47,18 @@ with st.form("cfg"):
         sla_minutes = st.number_input("SLA minutos (alerta)", min_value=5, max_value=240, value=int(cfg.get("sla_minutes",30)))
     with col3:
         tone = st.text_area("Tono del asistente", cfg.get("tone","Amable y profesional; breve, guiado."), height=120)
+        latency_budget = st.number_input("Presupuesto de latencia (s)", min_value=1.0, max_value=120.0,
+                                         value=float(cfg.get("llm_latency_budget_s",30.0)), step=1.0)
+        hedge_delay = st.number_input("Hedge tras (s, 0 = off)", min_value=0.0, max_value=60.0,
+                                      value=float(cfg.get("llm_hedge_delay_s",0.0)), step=0.5)
 
     if st.form_submit_button("Guardar configuración"):
         save_config({
             "language": language,
             "model": model,
+            "fallback_models": [m.strip() for m in fallback_raw.split(",") if m.strip()],
+            "llm_latency_budget_s": float(latency_budget),
+            "llm_hedge_delay_s": float(hedge_delay),
             "temperature": float(temperature),
             "assistant_name": assistant_name,
             "currency": currency,
@@ -61,6 +71,7 @@ st.write("---")
 st.subheader("Tenants y usuarios (ligero)")
 tenants = get_tenants()
 if tenants:
+    import pandas as pd
     st.dataframe(pd.DataFrame(tenants), hide_index=True)
 with st.form("new_tenant"):
     st.markdown("**Crear tenant**")
@@ -89,6 +100,7 @@ st.subheader("FAQ por tenant")
 lang = cfg.get("language","es")
 faqs = list_faqs(ss.admin_auth["tenant_id"], lang)
 if faqs:
+    import pandas as pd
     st.dataframe(pd.DataFrame(faqs)[["id","pattern","answer"]], hide_index=True)
 with st.form("new_faq"):
     st.markdown("**Agregar FAQ (regex)**")
@@ -112,3 +124,12 @@ st.subheader("Estado")
 st.caption(f"DB: {get_db_path()}")
 st.caption(f"Data dir: {get_data_dir()}")
 st.info("En Cloud usa `st.secrets['OPENAI_API_KEY']`. En local, crea `.env` con `OPENAI_API_KEY=...`.")
+
+with st.expander("📈 Métricas de este proceso"):
+    if cfg.get("metrics_port", 0):
+        st.caption(f"Exportador: http://{cfg.get('metrics_host', '127.0.0.1')}:{cfg['metrics_port']}/metrics")
+    st.json(snapshot(), expanded=False)
+    st.download_button("⬇️ Descargar (texto Prometheus)", data=render_prometheus(),
+                       file_name="metrics.txt", mime="text/plain")
+
+_run.done()
@@ -1,7 +1,7 @@
 
 # -*- coding: utf-8 -*-
 import streamlit as st
-from backend.db import init_db
+from backend.bootstrap import bootstrap
 from backend.config import get_db_path, get_data_dir
 
 st.set_page_config(page_title="Restaurant Chat Demo", page_icon="🍽️", layout="wide")
@@ -9,7 +9,7 @@ st.set_page_config(page_title="Restaurant Chat Demo", page_icon="🍽️", layou
 st.title("InnovaChat para Restaurantes · Demo estable")
 st.caption("Versión estable mínima (texto, sin audio) — Python 3.12 · Streamlit · SQLite")
 
-init_db(seed=True)
+bootstrap()
 
 st.success(f"DB inicializada en: {get_db_path()}")
 st.info(f"Directorio de datos: {get_data_dir()}")
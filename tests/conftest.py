@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Los tests importan `backend` desde la raíz del repo y usan una base SQLite propia.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="chat-tests-"))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _db():
+    from backend.db import init_db
+    init_db(seed=True)
+
+
+@pytest.fixture
+def menu():
+    return [
+        {"name": "Hamburguesa", "price": 5.0, "description": "Carne, queso y pan brioche"},
+        {"name": "Empanada", "price": 2.0, "description": "De carne o pollo"},
+        {"name": "Café", "price": 1.5, "description": "Espresso"},
+        {"name": "Papas fritas", "price": 3.0, "description": "Porción mediana"},
+        {"name": "Limonada", "price": 2.0, "description": "Natural"},
+        {"name": "Burger", "price": 5.0, "description": "Beef patty"},
+        {"name": "Taco", "price": 2.0, "description": "Corn tortilla"},
+    ]
+
+
+@pytest.fixture
+def stub():
+    """Local OpenAI-compatible stub on a free port (see backend/llm_stub.py)."""
+    from backend.llm_stub import start_stub_server
+    srv = start_stub_server(0, seed=1)
+    yield srv
+    srv.shutdown()
+
+
+@pytest.fixture
+def offline_cfg(stub):
+    from backend.config import get_config
+    cfg = dict(get_config())
+    cfg.update({"llm_offline": True, "llm_stub_port": stub.server_address[1], "llm_base_url": "",
+                "llm_cache_enabled": False, "llm_rate_limit": False, "language": "es"})
+    return cfg
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+import urllib.request
+import urllib.error
+
+import pytest
+
+from backend import conversations
+from backend.api_server import ChatAPI, start_api_server
+
+
+@pytest.fixture
+def api(offline_cfg):
+    api = ChatAPI(offline_cfg, workers=4)
+    yield api
+    api.pool.shutdown(wait=False)
+    api.batch_pool.shutdown(wait=False)
+
+
+def _new(api) -> str:
+    status, body = api.handle("POST", "/v1/conversations", {})
+    assert status == 200
+    return body["conversation_id"]
+
+
+def test_message_updates_cart_and_client_info(api):
+    cid = _new(api)
+    dish = api.menu()[0]["name"]
+    status, body = api.handle("POST", f"/v1/conversations/{cid}/messages", {"text": f"quiero dos {dish}"})
+    assert status == 200 and body["reply"]
+    assert {it["name"]: it["qty"] for it in body["cart"]} == {dish: 2}
+    assert body["event"]["cart_delta"] == {dish: 2}
+    api.handle("POST", f"/v1/conversations/{cid}/messages", {"text": "mi nombre es Ana"})
+    status, view = api.handle("GET", f"/v1/conversations/{cid}")
+    assert status == 200 and view["client_info"]["name"] == "Ana"
+    assert view["messages"] == 4
+
+
+def test_errors(api):
+    cid = _new(api)
+    assert api.handle("GET", "/v1/conversations/nope")[0] == 404
+    assert api.handle("GET", "/v1/nothing")[0] == 404
+    assert api.handle("POST", f"/v1/conversations/{cid}/messages", {"text": "  "})[0] == 400
+    assert api.handle("GET", f"/v1/conversations/{cid}/order")[0] == 405
+
+
+def test_order_requires_cart_and_client_data(api):
+    cid = _new(api)
+    dish = api.menu()[0]["name"]
+    status, body = api.handle("POST", f"/v1/conversations/{cid}/order", {})
+    assert status == 422 and body["cart"] == []
+    api.handle("POST", f"/v1/conversations/{cid}/messages", {"text": f"una {dish}"})
+    client = {"name": "Ana", "phone": "5551234", "delivery_type": "pickup", "payment_method": "cash",
+              "pickup_eta_min": "20"}
+    status, body = api.handle("POST", f"/v1/conversations/{cid}/order", {"client": client})
+    assert status == 200 and body["order"]
+
+
+def test_pendings_and_decisions(api):
+    from backend.db import answer_pending_question
+    cid = _new(api)
+    status, body = api.handle("POST", f"/v1/conversations/{cid}/pendings", {"question": "¿hay sin gluten?"})
+    assert status == 200
+    answer_pending_question(body["pending"]["id"], "approved", "Sí")
+    rows = api.handle("GET", f"/v1/conversations/{cid}/decisions?ack=1")[1]["decisions"]
+    assert [r["answer"] for r in rows] == ["Sí"]
+    assert api.handle("GET", f"/v1/conversations/{cid}/decisions")[1]["decisions"] == []
+
+
+def test_conversation_survives_a_restart(api):
+    cid = _new(api)
+    api.handle("POST", f"/v1/conversations/{cid}/messages", {"text": "mi nombre es Ana"})
+    with conversations._LOCK:
+        conversations._SESSIONS.clear()   # como un proceso nuevo: se reabre desde la base
+    status, view = api.handle("GET", f"/v1/conversations/{cid}")
+    assert status == 200 and view["messages"] == 2 and view["client_info"]["name"] == "Ana"
+
+
+def test_batch_keeps_order_per_conversation(api):
+    a, b = _new(api), _new(api)
+    reqs = [{"method": "POST", "path": f"/v1/conversations/{cid}/messages", "body": {"text": f"mensaje {i}"}}
+            for i in range(5) for cid in (a, b)]
+    reqs.append({"method": "GET", "path": "/v1/health"})
+    status, body = api.handle("POST", "/v1/batch", {"requests": reqs})
+    assert status == 200 and [r["status"] for r in body["responses"]] == [200] * len(reqs)
+    assert body["responses"][-1]["body"]["ok"] is True
+    for cid in (a, b):
+        conv = conversations.open_conversation(cid, create=False)
+        assert [m["content"] for m in conv if m["role"] == "user"] == [f"mensaje {i}" for i in range(5)]
+
+
+@pytest.mark.parametrize("path", ["/v1/batch", "/v1/batch/", "/v1/batch?x=1"])
+def test_nested_batches_are_rejected(api, path):
+    status, _ = api.handle("POST", "/v1/batch", {"requests": [{"method": "POST", "path": path, "body": {}}]})
+    assert status == 400
+
+
+def test_batch_size_limit(api):
+    api.cfg = dict(api.cfg, api_batch_max=2)
+    reqs = [{"method": "GET", "path": "/v1/health"}] * 3
+    assert api.handle("POST", "/v1/batch", {"requests": reqs})[0] == 413
+
+
+def test_http_transport_with_token(offline_cfg):
+    srv = start_api_server(0, token="s3cret", cfg=offline_cfg)
+    base = f"http://127.0.0.1:{srv.server_address[1]}"
+
+    def call(method, path, body=None, token="s3cret"):
+        req = urllib.request.Request(base + path, method=method,
+                                     data=json.dumps(body).encode() if body is not None else None,
+                                     headers={"Authorization": f"Bearer {token}"} if token else {})
+        try:
+            with urllib.request.urlopen(req, timeout=10) as r:
+                return r.status, r.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    try:
+        assert call("GET", "/v1/health", token=None)[0] == 401
+        status, raw = call("POST", "/v1/conversations", {})
+        assert status == 200 and json.loads(raw)["conversation_id"]
+        assert call("POST", "/v1/conversations", None)[0] == 200          # cuerpo vacío
+        status, raw = call("GET", "/metrics")
+        assert status == 200 and b"api_request_seconds_count" in raw
+    finally:
+        srv.shutdown()
+        srv.api.pool.shutdown(wait=False)
+        srv.api.batch_pool.shutdown(wait=False)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import os
+
+import pytest
+
+from backend import db
+
+PAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pages", "2_Restaurant.py")
+
+
+def _moves(name, fn, *args, **kw):
+    before = db.get_change_stamp(name)
+    fn(*args, **kw)
+    return db.get_change_stamp(name) != before
+
+
+def test_writes_bump_their_stamp_and_reads_do_not():
+    p = db.create_pending_question("stamps-1", "¿tienen flan?", "es")
+    assert _moves("pendings", db.mark_pending_notified, p["id"])
+    assert _moves("pendings", db.answer_pending_question, p["id"], "approved", "Sí")
+    assert not _moves("pendings", db.fetch_pending_questions)
+    order = db.create_order_from_chat_ready(
+        {"name": "Ana", "phone": "555", "delivery_type": "pickup", "payment_method": "cash"},
+        [{"name": "Empanada", "qty": 1, "unit_price": 2.0}], "USD")
+    assert _moves("orders", db.update_order_status, order["id"], "preparing")
+    assert not _moves("orders", db.fetch_orders_queue)
+    assert not _moves("orders", db.create_pending_question, "stamps-2", "¿y el postre?", "es")
+
+
+@pytest.fixture
+def restaurant(monkeypatch):
+    from streamlit.testing.v1 import AppTest
+    calls = []
+    real = db.fetch_pending_questions
+    monkeypatch.setattr(db, "fetch_pending_questions", lambda: calls.append(1) or real())
+    at = AppTest.from_file(PAGE, default_timeout=30)
+    at.session_state["auth_user"] = db.verify_login("admin", "admin")
+    return at, calls
+
+
+def test_pendings_panel_requeries_only_when_the_stamp_moves(restaurant):
+    at, calls = restaurant
+    at.run()
+    assert not at.exception and len(calls) == 1
+    at.run()
+    assert len(calls) == 1
+    db.create_pending_question("stamps-3", "¿el pan es sin gluten?", "es")
+    at.run()
+    assert len(calls) == 2
+    assert any("¿el pan es sin gluten?" in m.value for m in at.markdown)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import os
+from uuid import uuid4
+
+import pytest
+
+from backend.conversations import open_conversation
+
+PAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pages", "1_Client.py")
+
+
+def _conversation(n):
+    conv = open_conversation(f"hist-{uuid4().hex[:8]}")
+    for i in range(n):
+        conv.append({"role": "user" if i % 2 else "assistant", "content": f"mensaje {i}"})
+    return conv
+
+
+def test_recent_and_older_split_the_history():
+    conv = _conversation(30)
+    assert [m["content"] for m in conv.recent(3)] == ["mensaje 27", "mensaje 28", "mensaje 29"]
+    assert [m["content"] for m in conv.older(18, 2)] == ["mensaje 16", "mensaje 17"]
+    assert [m["content"] for m in conv.older(2, 20)] == ["mensaje 0", "mensaje 1"]
+    assert conv.older(0, 20) == []
+
+
+@pytest.fixture
+def client_page():
+    from streamlit.testing.v1 import AppTest
+    conv = _conversation(30)
+    at = AppTest.from_file(PAGE, default_timeout=30)
+    at.query_params["c"] = conv.id
+    return at
+
+
+def _shown(at):
+    return [m.children[0].value for m in at.chat_message] if at.chat_message else []
+
+
+def test_client_renders_only_the_recent_window(client_page):
+    at = client_page.run()
+    assert [f"mensaje {i}" for i in range(18, 30)] == _shown(at)
+    assert at.expander[0].label.startswith("🕘 18 ")
+
+
+def test_older_history_loads_on_demand(client_page):
+    at = client_page.run()
+    at.button(key="load_older").click().run()
+    assert _shown(at) == [f"mensaje {i}" for i in range(30)]
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+from backend import extraction
+from backend.extraction import new_conversation_state, update_conversation_state, parse_items_from_chat
+
+
+def _say(history, text):
+    history.append({"role": "user", "content": text})
+    return history
+
+
+def test_one_event_per_new_user_message(menu):
+    state, history = new_conversation_state(), []
+    update_conversation_state(state, _say(history, "quiero dos hamburguesas"), menu, {}, lang="es")
+    ev = state["last_event"]
+    assert state["events"] == [ev]
+    assert ev["index"] == 0 and ev["cart_delta"] == {"Hamburguesa": 2} and ev["lang"] == "es"
+
+    history.append({"role": "assistant", "content": "¿Algo más?"})
+    _say(history, "y una limonada")
+    _say(history, "mi nombre es Ana")
+    update_conversation_state(state, history, menu, {}, lang="es")
+    assert [e["index"] for e in state["events"]] == [2, 3]
+    assert state["events"][0]["cart_delta"] == {"Limonada": 1}
+    assert state["events"][1]["cart_delta"] == {}
+    assert state["events"][1]["fields"] == {"name": "Ana"}
+    assert {it["name"]: it["qty"] for it in state["items"]} == {"Hamburguesa": 2, "Limonada": 1}
+
+
+def test_event_flags(menu):
+    state, history = new_conversation_state(), []
+    update_conversation_state(state, _say(history, "pickup, pago en efectivo"), menu, {}, lang="es")
+    assert state["last_event"]["fields"] == {"delivery_type": "pickup", "payment_method": "cash"}
+    update_conversation_state(state, _say(history, "¿pueden consultar con cocina si hay sin gluten?"), menu, {}, lang="es")
+    assert state["last_event"]["escalate"] is True
+    update_conversation_state(state, _say(history, "eso es todo"), menu, {}, lang="es")
+    assert state["last_event"]["done"] is True
+    update_conversation_state(state, _say(history, "one more taco please"), menu, {}, lang="es")
+    assert state["last_event"]["lang"] == "en"
+    assert state["detected_lang"] == "en"
+
+
+def test_only_new_messages_are_parsed(menu, monkeypatch):
+    state, history = new_conversation_state(), []
+    seen = []
+    real = extraction._consume_user_message
+
+    def spy(state, text, grammar, lang):
+        seen.append(text)
+        return real(state, text, grammar, lang)
+
+    monkeypatch.setattr(extraction, "_consume_user_message", spy)
+    update_conversation_state(state, _say(history, "dos empanadas"), menu, {}, lang="es")
+    update_conversation_state(state, history, menu, {}, lang="es")      # sin mensajes nuevos
+    assert state["events"] == []
+    update_conversation_state(state, _say(history, "y un café"), menu, {}, lang="es")
+    assert seen == ["dos empanadas", "y un café"]
+
+
+def test_stale_state_is_rebuilt(menu):
+    state, history = new_conversation_state(), []
+    _say(history, "dos empanadas")
+    _say(history, "tres tacos")
+    update_conversation_state(state, history, menu, {}, lang="es")
+    # Historial reemplazado (nuevo chat): se re-parsea desde cero.
+    update_conversation_state(state, [{"role": "user", "content": "una limonada"}], menu, {}, lang="es")
+    assert {it["name"]: it["qty"] for it in state["items"]} == {"Limonada": 1}
+    # Cambio de menú: la misma conversación se vuelve a parsear con el menú nuevo.
+    new_menu = menu + [{"name": "Flan", "price": 2.5}]
+    update_conversation_state(state, _say(history, "un flan"), new_menu, {}, lang="es")
+    assert state["menu_version"] == extraction.menu_version(new_menu)
+    assert {it["name"]: it["qty"] for it in state["items"]} == {"Empanada": 2, "Taco": 3, "Flan": 1}
+
+
+def test_incremental_matches_full_parse(menu):
+    turns = ["hola", "quiero dos hamburguesas", "y 3 empanadas", "otra hamburguesa", "eso es todo"]
+    state, history = new_conversation_state(), []
+    for t in turns:
+        update_conversation_state(state, _say(history, t), menu, {}, lang="es")
+        history.append({"role": "assistant", "content": "ok"})
+    assert state["items"] == parse_items_from_chat(history, menu, {}, lang="es")
+
+
+def test_without_events_state_is_still_current(menu):
+    state = new_conversation_state()
+    update_conversation_state(state, [{"role": "user", "content": "dos tacos"}], menu, {}, lang="es",
+                              emit_events=False)
+    assert state["events"] == [] and state["last_event"] is None
+    assert {it["name"]: it["qty"] for it in state["items"]} == {"Taco": 2}
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import pytest
+
+from backend.llm_chat import _fast_path_reply, _local_reply
+
+CFG = {"language": "es", "currency": "USD"}
+CART = [{"name": "Empanada", "qty": 2, "unit_price": 2.0}]
+
+
+@pytest.mark.parametrize("text,intent", [
+    ("¿cuánto va?", "subtotal"),
+    ("¿Cuánto es el total?", "subtotal"),
+    ("cuanto llevo hasta ahora", "subtotal"),
+    ("how much is my order?", "subtotal"),
+    ("¿me pasas el menú?", "menu"),
+    ("¿qué tienen hoy?", "menu"),
+    ("what do you have?", "menu"),
+    ("no gracias, eso es todo", "done"),
+])
+def test_whole_turn_intents(menu, text, intent):
+    reply = _fast_path_reply(text, menu, CFG, CART)
+    assert reply is not None and reply[0] == intent
+
+
+@pytest.mark.parametrize("text", [
+    "¿Cuánto cuesta la hamburguesa?",     # precio de un plato, no el subtotal
+    "how much is the burger?",
+    "¿el menú tiene opciones veganas?",   # preguntas abiertas sobre el menú
+    "¿qué tienen sin gluten?",
+    "ya no quiero cebolla",
+])
+def test_open_questions_go_to_the_llm(menu, text):
+    assert _fast_path_reply(text, menu, CFG, CART) is None
+
+
+def _user(*texts):
+    return [{"role": "user", "content": t} for t in texts]
+
+
+def test_add_item_confirms_the_parsed_cart(menu):
+    reply = _local_reply(_user("quiero dos empanadas"), menu, CFG, "fp-add", None)
+    assert reply.startswith("Anotado: 2x Empanada")
+
+
+@pytest.mark.parametrize("texts", [
+    ("quiero dos hamburguesas", "otra hamburguesa"),   # "otra" suma 1, no lo que dice el mensaje
+    ("quiero 2 empanadas", "quiero 3 empanadas"),      # cantidad re-dicha o cambiada
+    ("quiero 2 empanadas", "2 empanadas"),
+])
+def test_add_item_falls_back_when_the_delta_differs(menu, texts):
+    assert _local_reply(_user(*texts), menu, CFG, "fp-delta", None) is None
+
+
+def test_add_item_needs_the_cart_delta(menu):
+    assert _fast_path_reply("quiero dos empanadas", menu, CFG, CART) is None
+    reply = _fast_path_reply("quiero dos empanadas", menu, CFG, CART, {"Empanada": 2})
+    assert reply is not None and reply[0] == "add_item"
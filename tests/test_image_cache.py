@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import os
+
+import pytest
+
+from backend import utils
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(utils, "_img_cache_limit", lambda: 100)
+    utils._IMG_CACHE.clear()
+    monkeypatch.setattr(utils, "_IMG_CACHE_BYTES", 0)
+    yield utils
+    utils._IMG_CACHE.clear()
+
+
+def _img(tmp_path, name, size, fill=b"x"):
+    p = tmp_path / name
+    p.write_bytes(fill * size)
+    return str(p)
+
+
+def test_hits_are_served_from_memory(cache, tmp_path):
+    path = _img(tmp_path, "a.jpg", 40)
+    first = cache.load_image_bytes(path)
+    assert cache.load_image_bytes(path) is first
+    assert cache.image_cache_stats() == {"entries": 1, "bytes": 40}
+
+
+def test_replaced_file_is_not_served_stale(cache, tmp_path):
+    path = _img(tmp_path, "a.jpg", 40)
+    cache.load_image_bytes(path)
+    _img(tmp_path, "a.jpg", 30, b"y")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert cache.load_image_bytes(path) == b"y" * 30
+
+
+def test_evicts_least_recently_used_within_the_byte_budget(cache, tmp_path):
+    a, b, c = (_img(tmp_path, f"{n}.jpg", 40) for n in "abc")
+    cache.load_image_bytes(a)
+    cache.load_image_bytes(b)
+    cache.load_image_bytes(a)          # b pasa a ser el menos usado
+    cache.load_image_bytes(c)
+    cached = {key[0] for key in cache._IMG_CACHE}
+    assert cached == {a, c}
+    assert cache.image_cache_stats()["bytes"] == 80
+
+
+def test_oversized_and_missing_files_are_not_cached(cache, tmp_path):
+    big = _img(tmp_path, "big.jpg", 150)
+    assert len(cache.load_image_bytes(big)) == 150
+    assert cache.load_image_bytes(str(tmp_path / "nope.jpg")) is None
+    assert cache.image_cache_stats() == {"entries": 0, "bytes": 0}
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+import queue
+
+import pytest
+
+from backend import db, kitchen_server
+from backend.kitchen_server import QueueWatcher, _offer
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    calls = []
+    real = kitchen_server.fetch_active_orders
+    monkeypatch.setattr(kitchen_server, "fetch_active_orders", lambda: calls.append(1) or real())
+    return calls
+
+
+def _new_order():
+    return db.create_order_from_chat_ready(
+        {"name": "Cocina", "phone": "555", "delivery_type": "pickup", "payment_method": "cash"},
+        [{"name": "Taco", "qty": 2, "unit_price": 2.0}], "USD")
+
+
+def test_one_snapshot_per_stamp_change_fanned_out_to_all(fetches):
+    w = QueueWatcher()
+    assert w.refresh() is True
+    subs = [w.subscribe() for _ in range(3)]
+    assert all(q.get_nowait() == w.current() for q in subs)
+    assert w.refresh() is False and len(fetches) == 1
+
+    order = _new_order()
+    assert w.refresh() is True and len(fetches) == 2
+    payloads = [q.get_nowait() for q in subs]
+    assert len(set(payloads)) == 1 and payloads[0] == w.current()
+    snap = json.loads(payloads[0])
+    assert snap["stamp"] == db.get_change_stamp("orders")
+    assert order["id"] in [o["id"] for o in snap["orders"]]
+
+
+def test_slow_subscriber_keeps_only_the_latest_payload(fetches):
+    q: queue.Queue = queue.Queue(maxsize=1)
+    for payload in ("a", "b", "c"):
+        _offer(q, payload)
+    assert q.get_nowait() == "c"
+    assert q.empty()
+
+    w = QueueWatcher()
+    w.refresh()
+    slow = w.subscribe()               # nunca lee mientras cambian las órdenes
+    for _ in range(2):
+        _new_order()
+        w.refresh()
+    assert slow.qsize() == 1
+    assert slow.get_nowait() == w.current()
+
+
+def test_unsubscribed_queues_get_nothing(fetches):
+    w = QueueWatcher()
+    w.refresh()
+    q = w.subscribe()
+    q.get_nowait()
+    w.unsubscribe(q)
+    assert w.subscribers == 0
+    _new_order()
+    w.refresh()
+    assert q.empty()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from backend import llm_router
+from backend.llm_router import LLMUnavailable, candidate_models, routed_completion, routed_stream
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    """``client.chat.completions.create`` with a per-model delay and failure plan."""
+
+    def __init__(self, delays=None, failing=()):
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.calls = []
+        self.streams = []
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, timeout, stream=False, **kw):
+        with self._lock:
+            self.calls.append(model)
+        time.sleep(self.delays.get(model, 0.0))
+        if model in self.failing:
+            raise RuntimeError(f"{model} down")
+        if stream:
+            s = FakeStream([f"{model}:1", f"{model}:2"])
+            with self._lock:
+                self.streams.append(s)
+            return s
+        return SimpleNamespace(model=model)
+
+
+def _cfg(**kw):
+    cfg = {"model": "primary", "fallback_models": ["backup"], "llm_latency_budget_s": 2.0, "llm_hedge_delay_s": 0.0}
+    cfg.update(kw)
+    return cfg
+
+
+def test_candidate_models_dedupes_and_accepts_strings():
+    assert candidate_models({"model": "a", "fallback_models": "b, a, c"}) == ["a", "b", "c"]
+    assert candidate_models({"model": "a"}) == ["a"]
+
+
+def test_primary_answers_without_fallback():
+    client = FakeClient()
+    assert routed_completion(client, {"messages": []}, _cfg()).model == "primary"
+    assert client.calls == ["primary"]
+
+
+def test_falls_back_when_primary_fails():
+    client = FakeClient(failing={"primary"})
+    assert routed_completion(client, {"messages": []}, _cfg()).model == "backup"
+    assert client.calls == ["primary", "backup"]
+
+
+def test_all_models_failing_raises():
+    client = FakeClient(failing={"primary", "backup"})
+    with pytest.raises(LLMUnavailable, match="all models failed"):
+        routed_completion(client, {"messages": []}, _cfg())
+
+
+def test_budget_exceeded_raises_in_time():
+    client = FakeClient(delays={"primary": 1.0})
+    t0 = time.monotonic()
+    with pytest.raises(LLMUnavailable, match="no reply within"):
+        routed_completion(client, {"messages": []}, _cfg(llm_latency_budget_s=0.2, fallback_models=[]))
+    assert time.monotonic() - t0 < 0.6
+
+
+def test_hedge_wins_over_slow_primary():
+    client = FakeClient(delays={"primary": 0.8})
+    before = llm_router.latency_stats()["_router"]
+    t0 = time.monotonic()
+    resp = routed_completion(client, {"messages": []}, _cfg(llm_hedge_delay_s=0.05))
+    assert resp.model == "backup"
+    assert time.monotonic() - t0 < 0.5
+    after = llm_router.latency_stats()["_router"]
+    assert after["hedged"] == before["hedged"] + 1
+    assert after["hedge_wins"] == before["hedge_wins"] + 1
+
+
+def test_no_hedge_when_primary_is_fast():
+    client = FakeClient(delays={"primary": 0.01})
+    assert routed_completion(client, {"messages": []}, _cfg(llm_hedge_delay_s=0.3)).model == "primary"
+    assert client.calls == ["primary"]
+
+
+def test_stream_relays_the_winner_and_closes_the_loser():
+    client = FakeClient(delays={"primary": 0.3})
+    chunks = list(routed_stream(client, {"messages": []}, _cfg(llm_hedge_delay_s=0.05)))
+    assert chunks == ["backup:1", "backup:2"]
+    time.sleep(0.4)  # el primario termina después y se cierra en su callback
+    assert all(s.closed for s in client.streams)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import random
+
+import pytest
+
+from backend.llm_stub import parse_latency, menu_reply, start_stub_server
+from backend.db import has_pending_for_conversation
+from backend.loadtest import run_load, synthetic_menu
+
+
+def test_parse_latency_specs():
+    rng = random.Random(3)
+    assert parse_latency(0.25)(rng) == 0.25
+    assert parse_latency("0.5")(rng) == 0.5
+    assert parse_latency("fixed:0.1")(rng) == 0.1
+    assert all(0.2 <= parse_latency("uniform:0.2,0.4")(rng) <= 0.4 for _ in range(50))
+    assert all(parse_latency("normal:0,1")(rng) >= 0.0 for _ in range(50))   # nunca negativa
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1,2")
+
+
+def test_menu_reply_echoes_mentioned_items():
+    body = {"messages": [
+        {"role": "system", "content": "Menú:\n- Empanada (USD 2.00)\n- Taco (USD 2.50)"},
+        {"role": "user", "content": "quiero una empanada"},
+    ]}
+    assert "Empanada" in menu_reply(body, random.Random(1))
+    body["messages"][-1]["content"] = "hola"
+    assert menu_reply(body, random.Random(1)).startswith("Te recomiendo")
+
+
+def test_stub_speaks_the_openai_protocol(stub):
+    from openai import OpenAI
+    client = OpenAI(api_key="stub", base_url=f"http://127.0.0.1:{stub.server_address[1]}/v1", max_retries=0)
+    msgs = [{"role": "user", "content": "hola"}]
+    resp = client.chat.completions.create(model="gpt-4o-mini", messages=msgs)
+    assert resp.choices[0].message.content and resp.usage.prompt_tokens >= 0
+    chunks = list(client.chat.completions.create(model="gpt-4o-mini", messages=msgs, stream=True,
+                                                 stream_options={"include_usage": True}))
+    text = "".join(c.choices[0].delta.content or "" for c in chunks if c.choices)
+    assert text.strip() == resp.choices[0].message.content
+    assert chunks[-1].usage is not None
+
+
+def test_injected_errors():
+    from openai import OpenAI, APIStatusError
+    srv = start_stub_server(0, error_rate=1.0, error_codes=[503], seed=1)
+    try:
+        client = OpenAI(api_key="stub", base_url=f"http://127.0.0.1:{srv.server_address[1]}/v1", max_retries=0)
+        with pytest.raises(APIStatusError) as e:
+            client.chat.completions.create(model="m", messages=[{"role": "user", "content": "x"}])
+        assert e.value.status_code == 503
+        assert srv.stats == {"requests": 1, "errors": 1}
+    finally:
+        srv.shutdown()
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_run_load_against_the_stub(offline_cfg, stub, stream):
+    rep = run_load(conversations=4, turns=3, concurrency=2, menu=synthetic_menu(10), cfg=offline_cfg,
+                   stream=stream, seed=3)
+    assert rep["turns"] == 12 and rep["errors"] == 0
+    assert rep["by_kind"]["all"]["n"] == 12 and rep["by_kind"]["all"]["p95_s"] is not None
+    assert stub.stats["requests"] > 0
+
+
+def test_run_load_groups_turns_by_the_path_taken(offline_cfg, stub):
+    before = has_pending_for_conversation("load-0")
+    rep = run_load(conversations=2, turns=6, concurrency=2, menu=synthetic_menu(10), cfg=offline_cfg, seed=3)
+    kinds = set(rep["by_kind"]) - {"all"}
+    assert {"llm", "subtotal", "add_item"} <= kinds
+    assert "pending" not in kinds
+    assert sum(row["n"] for k, row in rep["by_kind"].items() if k != "all") == rep["turns"]
+    assert not before and not has_pending_for_conversation("load-0")
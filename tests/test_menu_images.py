@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import io
+import os
+
+import pytest
+
+from backend import db
+
+PIL = pytest.importorskip("PIL.Image")
+
+
+def _upload(color, name="foto.png"):
+    buf = io.BytesIO()
+    PIL.new("RGB", (64, 48), color).save(buf, format="PNG")
+    buf.seek(0)
+    buf.name = name
+    return buf
+
+
+def _rows(digest):
+    c = db._conn()
+    rows = c.execute("SELECT file_path, thumb_path FROM menu_images WHERE content_hash=?", (digest,)).fetchall()
+    c.close()
+    return rows
+
+
+def test_same_upload_is_stored_once():
+    first = db.add_menu_image(_upload("red"))
+    again = db.add_menu_image(_upload("red"))
+    assert again == first and os.path.exists(first)
+    assert len(_rows(db.content_hash(_upload("red").read()))) == 1
+
+
+def test_losing_a_concurrent_upload_removes_its_files(monkeypatch, tmp_path):
+    data = _upload("blue").read()
+    digest = db.content_hash(data)
+    real_ingest = db.ingest_image
+
+    def racing_ingest(data, assets, **kw):
+        # La otra subida inserta su fila entre el chequeo y el INSERT de esta.
+        theirs = real_ingest(data, str(tmp_path), **kw)
+        c = db._conn()
+        c.execute("INSERT INTO menu_images(file_path, created_at, content_hash, thumb_path) VALUES (?,?,?,?)",
+                  (theirs["file_path"], "now", digest, theirs["thumb_path"]))
+        c.commit()
+        c.close()
+        mine = real_ingest(data, assets, **kw)
+        racing_ingest.mine = mine
+        return mine
+
+    monkeypatch.setattr(db, "ingest_image", racing_ingest)
+    path = db.add_menu_image(_upload("blue"))
+    assert path.startswith(str(tmp_path))
+    assert len(_rows(digest)) == 1
+    assert not os.path.exists(racing_ingest.mine["file_path"])
+    assert not os.path.exists(racing_ingest.mine["thumb_path"])
+
+
+def test_thumbnails_are_listed_on_request():
+    db.add_menu_image(_upload("green"))
+    full = db.fetch_menu_images(0, 1)
+    small = db.fetch_menu_images(0, 1, thumbs=True)
+    assert full != small and os.path.getsize(small[0]) <= os.path.getsize(full[0])
+
+
+def test_carousel_draws_thumbnail_previews():
+    from streamlit.testing.v1 import AppTest
+
+    def page():
+        from functools import partial
+        from backend.db import fetch_menu_images, count_menu_images
+        from backend.utils import render_js_carousel
+        render_js_carousel(fetch_menu_images, total=count_menu_images(), key_prefix="t",
+                           thumbs=partial(fetch_menu_images, thumbs=True))
+
+    for color in ("white", "black"):
+        db.add_menu_image(_upload(color))
+    at = AppTest.from_function(page).run()
+    dots = [b for b in at.button if b.key.startswith("t_dot_")]
+    assert len(dots) == min(db.count_menu_images(), 5)
+    assert sum(b.label == "●" for b in dots) == 1
+    nxt = next(b for b in dots if b.label == "○")
+    nxt.click().run()
+    assert at.session_state["t_idx"] != 0
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from backend import metrics
+from backend.metrics import timed, observe, inc, snapshot, render_prometheus
+
+
+def _hist(name):
+    return snapshot()["histograms"][name]
+
+
+def _counter(name):
+    return {tuple(sorted(r["labels"].items())): r["value"] for r in snapshot()["counters"].get(name, [])}
+
+
+def test_timed_as_context_manager_and_decorator():
+    with timed("t_ctx_seconds", stage="a"):
+        pass
+
+    @timed("t_deco_seconds")
+    def boom():
+        raise ValueError("x")
+
+    with pytest.raises(ValueError):
+        boom()
+    assert _hist("t_ctx_seconds")[0]["labels"] == {"stage": "a"}
+    assert _hist("t_deco_seconds")[0]["count"] == 1
+    assert _counter("t_deco_errors_total") == {(): 1}
+
+
+def test_rerun_and_stop_are_not_errors():
+    class RerunException(Exception):
+        pass
+
+    with pytest.raises(RerunException):
+        with timed("t_flow_seconds"):
+            raise RerunException()
+    assert _hist("t_flow_seconds")[0]["count"] == 1
+    assert _counter("t_flow_errors_total") == {}
+
+
+def test_quantiles_interpolate_within_buckets():
+    for _ in range(90):
+        observe("t_q_seconds", 0.003)
+    for _ in range(10):
+        observe("t_q_seconds", 2.0)
+    row = _hist("t_q_seconds")[0]
+    assert 0.0025 < row["p50_s"] <= 0.005
+    assert 1.0 < row["p99_s"] <= 2.5
+    assert row["count"] == 100 and row["sum_s"] == pytest.approx(20.27)
+
+
+def test_prometheus_text(monkeypatch):
+    observe("t_prom_seconds", 0.02, path='a"b')
+    observe("t_prom_seconds", 7.0, path='a"b')
+    inc("t_prom_total", 3, kind="x")
+    monkeypatch.setitem(metrics._COLLECTORS, "t_coll", lambda: {"size": 2, "on": True, "gpt-x": {"p50": 1}})
+    monkeypatch.setitem(metrics._COLLECTORS, "t_broken", lambda: 1 / 0)
+    lines = render_prometheus().splitlines()
+    assert "# TYPE t_prom_seconds histogram" in lines
+    assert 't_prom_seconds_bucket{path="a\\"b",le="0.025"} 1' in lines
+    assert 't_prom_seconds_bucket{path="a\\"b",le="10.0"} 2' in lines
+    assert 't_prom_seconds_bucket{path="a\\"b",le="+Inf"} 2' in lines
+    assert 't_prom_total{kind="x"} 3' in lines
+    assert "app_t_coll_size 2" in lines and "app_t_coll_on 1" in lines
+    assert 'app_t_coll_p50{key="gpt-x"} 1' in lines   # dicts anidados: la clave pasa a etiqueta
+    assert snapshot()["collectors"]["t_broken"]["error"].startswith("ZeroDivisionError")
+
+
+def test_instrument_module_wraps_public_functions_only():
+    def public():
+        return 1
+
+    def _private():
+        return 2
+
+    public.__module__ = _private.__module__ = "fake_mod"
+    ns = {"__name__": "fake_mod", "public": public, "_private": _private, "json": json}
+    assert metrics.instrument_module(ns, "t_mod_seconds") == 1
+    assert ns["public"]() == 1 and ns["_private"] is _private
+    assert metrics.instrument_module(ns, "t_mod_seconds") == 0   # ya envuelta
+    assert _hist("t_mod_seconds")[0]["labels"] == {"fn": "public"}
+
+
+def test_metrics_server():
+    inc("t_srv_total")
+    srv = metrics.start_metrics_server(0)
+    base = f"http://127.0.0.1:{srv.server_address[1]}"
+    try:
+        with urllib.request.urlopen(base + "/metrics") as r:
+            assert r.headers["Content-Type"].startswith("text/plain")
+            assert "t_srv_total 1" in r.read().decode()
+        with urllib.request.urlopen(base + "/metrics.json") as r:
+            assert "t_srv_total" in json.load(r)["counters"]
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(base + "/nope")
+    finally:
+        srv.shutdown()
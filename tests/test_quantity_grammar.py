@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+import time
+
+import pytest
+
+from backend.extraction import qty_grammar, scan_quantities, parse_items_from_chat
+from backend.textnorm import normalize_text
+
+# (idioma, mensaje, {plato: cantidad esperada en el carrito})
+CORPUS = [
+    ("es", "quiero dos hamburguesas", {"Hamburguesa": 2}),
+    ("es", "una hamburguesa", {"Hamburguesa": 1}),
+    ("es", "hamburguesa", {"Hamburguesa": 1}),
+    ("es", "3 empanadas y un café", {"Empanada": 3, "Café": 1}),
+    ("es", "dame una cafe y dos papas fritas", {"Café": 1, "Papas fritas": 2}),
+    ("es", "QUIERO DOS LIMONADAS", {"Limonada": 2}),
+    ("es", "tres cafés", {"Café": 3}),
+    ("es", "tres cafes", {"Café": 3}),
+    ("es", "cinco Empanádas", {"Empanada": 5}),
+    ("es", "diez empanadas", {"Empanada": 10}),
+    ("es", "12 empanadas", {"Empanada": 12}),
+    ("es", "¿me das dos limonadas, por favor?", {"Limonada": 2}),
+    ("en", "two burgers and 3 tacos", {"Burger": 2, "Taco": 3}),
+    ("en", "a burger please", {"Burger": 1}),
+    ("en", "ten tacos", {"Taco": 10}),
+    ("en", "two papas fritas", {"Papas fritas": 2}),
+    ("es", "hola, ¿qué me recomiendas?", {}),
+]
+
+
+@pytest.mark.parametrize("lang,text,expected", CORPUS)
+def test_corpus_items(menu, lang, text, expected):
+    items = parse_items_from_chat([{"role": "user", "content": text}], menu, {}, lang=lang)
+    assert {it["name"]: it["qty"] for it in items} == expected
+
+
+@pytest.mark.parametrize("lang,text,expected", [
+    ("es", "dos papas fritas", [("Papas fritas", 2)]),   # el alias más largo gana
+    ("es", "hamburguesa", [("Hamburguesa", 0)]),         # sin número: qty 0
+    ("en", "one taco and two burgers", [("Taco", 1), ("Burger", 2)]),
+    ("es", "two tacos", [("Taco", 0)]),                  # números en otro idioma no cuentan
+])
+def test_scan_quantities(menu, lang, text, expected):
+    grammar = qty_grammar(menu, lang)
+    assert scan_quantities(list(normalize_text(text).tokens), grammar) == expected
+
+
+def test_quantities_across_turns(menu):
+    history = [
+        {"role": "user", "content": "quiero dos hamburguesas"},
+        {"role": "assistant", "content": "¡Listo! ¿Algo más?"},
+        {"role": "user", "content": "y tres limonadas"},
+    ]
+    items = parse_items_from_chat(history, menu, {}, lang="es")
+    assert {it["name"]: it["qty"] for it in items} == {"Hamburguesa": 2, "Limonada": 3}
+
+
+def test_grammar_is_compiled_once_per_menu_version(menu):
+    assert qty_grammar(menu, "es") is qty_grammar(list(menu), "es")
+    assert qty_grammar(menu, "es") is not qty_grammar(menu, "en")
+    changed = menu + [{"name": "Flan", "price": 2.5}]
+    assert ("flan",) in qty_grammar(changed, "es")["phrases"]
+
+
+def test_scan_throughput():
+    big_menu = [{"name": f"Plato especial {i}", "price": 1.0 + i} for i in range(300)]
+    grammar = qty_grammar(big_menu, "es")
+    messages = [list(normalize_text(f"quiero dos plato especial {i % 300} y tres cafés por favor").tokens)
+                for i in range(5000)]
+    t0 = time.perf_counter()
+    hits = sum(len(scan_quantities(toks, grammar)) for toks in messages)
+    elapsed = time.perf_counter() - t0
+    assert hits == len(messages)
+    # Una pasada por mensaje: 5000 mensajes contra 300 platos muy por debajo de un segundo.
+    assert elapsed < 1.0, f"{elapsed:.3f}s"
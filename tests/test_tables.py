@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import annotations
+
+import pytest
+
+from backend import tables
+
+ORDERS = [
+    {"id": "ord_1", "created_at": "2026-01-01T12:00", "client_name": "Ana", "delivery_type": "pickup",
+     "currency": "USD", "total": 7.5, "status": "confirmed", "priority": 0, "sla_breached": 0,
+     "items_json": "[]"},
+    {"id": "ord_2", "created_at": "2026-01-01T12:05", "client_name": "Bo", "delivery_type": "delivery",
+     "currency": None, "total": None, "status": "preparing", "priority": 1, "sla_breached": 1},
+]
+
+
+@pytest.fixture(autouse=True)
+def _fresh(monkeypatch):
+    monkeypatch.setattr(tables, "_FRAMES", tables.OrderedDict())
+    monkeypatch.setattr(tables, "_STATS", {"hits": 0, "builds": 0})
+
+
+def test_orders_frame_formats_columns():
+    df = tables.orders_frame(ORDERS, "es", 1)
+    assert list(df.columns) == ["id", "creada", "cliente", "tipo", "total", "estado", "prioridad", "SLA"]
+    assert list(df["total"]) == ["USD 7.50", " 0.00"]
+    assert list(df["SLA"]) == ["✅", "⚠️"]
+    assert "items_json" not in df.columns
+    assert list(tables.orders_frame(ORDERS, "en", 1).columns)[1:3] == ["created", "client"]
+
+
+def test_frames_are_built_once_per_version_and_language():
+    first = tables.orders_frame(ORDERS, "es", 1)
+    assert tables.orders_frame(ORDERS, "es", 1) is first
+    assert tables.orders_frame(ORDERS[:1], "es", 2) is not first
+    tables.orders_frame(ORDERS, "en", 1)
+    assert tables.table_stats() == {"frames": 3, "hits": 1, "builds": 3}
+
+
+def test_menu_frame_follows_the_menu_version(menu):
+    df = tables.menu_frame(menu)
+    assert tables.menu_frame(list(menu)) is df
+    changed = menu + [{"name": "Flan", "price": 3.0, "description": "Casero"}]
+    assert len(tables.menu_frame(changed)) == len(menu) + 1
+
+
+def test_memo_is_bounded(monkeypatch):
+    monkeypatch.setattr(tables, "_MAX_FRAMES", 2)
+    for v in range(4):
+        tables.orders_frame(ORDERS, "es", v)
+    assert [k[1] for k in tables._FRAMES] == [2, 3]